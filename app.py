@@ -1,18 +1,86 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import re  # <-- coloque este import lá em cima junto com os outros
 import plotly.express as px
+import multiprocessing
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from ingestion import (
+    ARMAZEM_DISPONIVEL,
+    CONTADORES_LEITURA,
+    ArmazemDatasets,
+    CacheIngestao,
+    MonitorCsv,
+    PlanilhasSessao,
+    TarefasSessao,
+    chave_aba,
+    chave_conteudo,
+    contar_leitura,
+    ler_em_paralelo,
+    listar_abas,
+)
+from kpi_engine import (
+    DENTRO_META,
+    FORA_META,
+    GRANULARIDADES,
+    JANELA_MAXIMA,
+    JANELAS_PADRAO,
+    ROTULOS_STATUS,
+    anexar_serie,
+    calcular_agregados,
+    calcular_rollups,
+    carregar_metas,
+    cards_por_periodo,
+    colunas_kpi,
+    colunas_segmento,
+    colunas_tempo,
+    fora_meta_continua,
+    fora_meta_por_periodo,
+    fora_meta_por_segmento,
+    estatisticas_moveis,
+    fracao_para_percentual,
+    janelas_iniciar,
+    kpi_por_segmento,
+    limpar_planilha,
+    matriz_kpis,
+    menor_e_melhor,
+    meta_sugerida as calcular_meta_sugerida,
+    parsear_datas,
+    serie_continua,
+    serie_temporal,
+    reduzir_serie,
+    rotulos_status,
+    status_kpi,
+    to_number,
+)
 # ======================
 # Estado da aplicação
 # ======================
 
-if "files_data" not in st.session_state:
-    st.session_state.files_data = {}
-
 if "active_file" not in st.session_state:
     st.session_state.active_file = None
 
+# file_id do upload -> nome exibido / nome exibido -> hash do conteúdo
+if "upload_ids" not in st.session_state:
+    st.session_state.upload_ids = {}
+
+if "file_hashes" not in st.session_state:
+    st.session_state.file_hashes = {}
+
+# Medições de desempenho deste rerun (ver KPI_DESEMPENHO)
+st.session_state.desempenho = []
+if "id_desempenho" not in st.session_state:
+    st.session_state.id_desempenho = uuid.uuid4().hex[:12]
+
 # =========================
 # Configuração da página
 # =========================
@@ -104,44 +172,61 @@ def kpi_card(title, value, icon="📊", color="blue"):
         """,
         unsafe_allow_html=True
     )
-def to_number(series): # Converte uma série para números float, tratando diversos formatos
-    def parse_value(val):
-        if pd.isna(val):
-            return np.nan
 
-        # 1. Tudo vira string
-        s = str(val).strip().lower()
 
-        # 2. Valores explicitamente inválidos
-        if s in ["", "nan", "none", "erro", "texto", "-", "--", "%"]:
-            return np.nan
+@st.cache_resource
+def cache_ingestao(): # Cache único por processo, compartilhado entre sessões
+    return CacheIngestao(
+        max_bytes=int(os.environ.get("KPI_CACHE_MAX_MB", "512")) * 1024**2,
+        pasta=os.environ.get("KPI_CACHE_DIR")
+    )
 
-        # 3. Normalização
-        s = s.replace(" ", "")
-        s = s.replace(",", ".")
-        s = s.replace("%", "")
 
-        # 4. Extração do primeiro número válido
-        match = re.search(r"-?\d+(\.\d+)?", s)
+@st.cache_resource
+def pool_leitura(): # Pool de processos para ler arquivos/abas em paralelo
+    # spawn: fork a partir das threads do servidor Streamlit pode travar
+    return ProcessPoolExecutor(
+        max_workers=int(os.environ.get("KPI_WORKERS", os.cpu_count() or 1)),
+        mp_context=multiprocessing.get_context("spawn")
+    )
 
-        if not match:
-            return np.nan
 
-        try:
-            return float(match.group())
-        except:
-            return np.nan
+@st.cache_resource
+def pool_tarefas(): # Threads para as tarefas em segundo plano de todas as sessões
+    return ThreadPoolExecutor(
+        max_workers=int(os.environ.get("KPI_TAREFAS", "4")),
+        thread_name_prefix="kpi-tarefa"
+    )
 
-    return series.apply(parse_value)
 
+@st.cache_resource
+def armazem_datasets(): # Datasets salvos em disco, compartilhados entre sessões
+    return ArmazemDatasets(os.environ.get("KPI_ARMAZEM_DIR", "kpi_datasets"))
+
+
+# Nome de um dataset do armazém na lista de planilhas
+PREFIXO_SALVO = "💾 "
+
+
+def planilhas_sessao(): # Planilhas de uma sessão, dentro dos orçamentos de memória
+    return PlanilhasSessao(
+        cache_ingestao(),
+        max_bytes=int(os.environ.get("KPI_SESSAO_MAX_MB", "1024")) * 1024**2,
+        max_bytes_processo=int(os.environ.get("KPI_PROCESSO_MAX_MB", "4096")) * 1024**2
+    )
+
+
+def nome_livre(nome): # Arquivos/abas diferentes com o mesmo nome não se sobrescrevem
+    candidato = nome
+    sufixo = 2
+    while (
+        candidato in st.session_state.files_data
+        or candidato in st.session_state.file_hashes
+    ):
+        candidato = f"{nome} ({sufixo})"
+        sufixo += 1
+    return candidato
 
-def calcular_status(valor, meta, regra):
-    if pd.isna(valor):
-        return "⚪ Sem dado"
-    if regra == "Maior é melhor":
-        return "🟢 Dentro da meta" if valor >= meta else "🔴 Fora da meta"
-    else:
-        return "🟢 Dentro da meta" if valor <= meta else "🔴 Fora da meta"
 
 def format_kpi(valor, is_percent):
     if pd.isna(valor):
@@ -153,7 +238,993 @@ def format_kpi(valor, is_percent):
         return f"{valor:,.0f}"
     except:
         return "—"
-    
+
+
+# =========================
+# Pipeline em etapas (memoizado)
+# =========================
+# Cada etapa é cacheada só pelo que realmente a afeta: hash do conteúdo do
+# arquivo, colunas escolhidas, unidade, meta e regra. Mudar a meta não refaz
+# limpeza, conversão do KPI nem parse de datas. Parâmetros com "_" não entram
+# na chave (o Streamlit não faz hash de DataFrames grandes) e os resultados são
+# compartilhados: nenhuma etapa altera o que recebe.
+
+ETAPAS = [
+    "limpeza", "kpi", "tempo", "série", "agregados", "janelas", "status",
+    "rollups", "fora da meta por período", "segmentos", "fora da meta por segmento",
+    "gráfico de linha", "gráfico de barras", "gráficos por segmento", "tabela", "matriz"
+]
+
+
+# Tarefa em segundo plano rodando nesta thread (ver em_segundo_plano): o que
+# ela recalcula e mede fica com ela até um rerun receber o resultado
+_fio = threading.local()
+
+
+def recalculadas_atuais(): # Etapas recalculadas da tarefa desta thread, ou do rerun
+    tarefa = getattr(_fio, "tarefa", None)
+    return tarefa.recalculadas if tarefa is not None else st.session_state.etapas_recalculadas
+
+
+def marcar_recalculo(etapa): # Só roda dentro da etapa, ou seja, em cache miss
+    recalculadas_atuais().add(etapa)
+
+
+# =========================
+# Desempenho por etapa (opcional)
+# =========================
+# Com KPI_DESEMPENHO=1 cada etapa do rerun registra tempo, linhas de entrada
+# e saída, variação de memória do processo e se veio do cache; os registros
+# aparecem no painel "⏱ Desempenho" e saem como uma linha JSON cada no logger
+# "kpi.desempenho". Desligado, as etapas nem são envolvidas.
+
+DESEMPENHO = os.environ.get("KPI_DESEMPENHO", "").lower() in ("1", "true", "sim")
+
+logger_desempenho = logging.getLogger("kpi.desempenho")
+if DESEMPENHO and not logger_desempenho.handlers:
+    _saida_log = logging.StreamHandler()
+    _saida_log.setFormatter(logging.Formatter("%(message)s"))
+    logger_desempenho.addHandler(_saida_log)
+    logger_desempenho.setLevel(logging.INFO)
+    logger_desempenho.propagate = False
+
+
+def memoria_processo(): # Memória residente do processo em bytes (None fora do Linux)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def linhas_de(valor): # Linhas de um frame/série/array (ou do primeiro item de uma tupla)
+    if isinstance(valor, tuple):
+        valor = valor[0] if valor else None
+    if isinstance(valor, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(valor)
+    return None
+
+
+class Medicao:
+    """Mede o bloco `with` como uma etapa do rerun atual.
+
+    `saida` pode ser preenchida dentro do bloco com o número de linhas
+    produzidas. Sem KPI_DESEMPENHO não mede nem registra nada.
+    """
+
+    def __init__(self, etapa, entrada=None):
+        self.etapa = etapa
+        self.entrada = entrada
+        self.saida = None
+
+    def __enter__(self):
+        if DESEMPENHO:
+            self._tarefa = getattr(_fio, "tarefa", None)
+            # Já recalculada neste rerun (ex.: por uma tarefa recebida): aqui é hit
+            self._ja_recalculada = (
+                self.etapa in recalculadas_atuais()
+                if self._tarefa is not None or "etapas_recalculadas" in st.session_state else False
+            )
+            self._memoria = memoria_processo()
+            self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *erro):
+        if not DESEMPENHO:
+            return
+        segundos = time.perf_counter() - self._inicio
+        memoria = memoria_processo()
+
+        registro = {
+            "etapa": self.etapa,
+            "segundos": round(segundos, 4),
+            "linhas_entrada": None if self.entrada is None else int(self.entrada),
+            "linhas_saida": None if self.saida is None else int(self.saida),
+            "memoria_mb": (
+                round((memoria - self._memoria) / 1024**2, 1)
+                if memoria is not None and self._memoria is not None else None
+            ),
+        }
+        if self.etapa in ETAPAS and (self._tarefa is not None or "etapas_recalculadas" in st.session_state):
+            registro["cache"] = self._ja_recalculada or self.etapa not in recalculadas_atuais()
+        registro["segundo_plano"] = self._tarefa is not None
+
+        # Na thread da tarefa o st.session_state fica de fora: ler dali durante
+        # um rerun pode levantar a StopException do script
+        sessao = _fio.sessao if self._tarefa is not None else st.session_state.id_desempenho
+        (self._tarefa.desempenho if self._tarefa is not None else st.session_state.desempenho).append(registro)
+        logger_desempenho.info(json.dumps(
+            {"evento": "etapa", "sessao": sessao, **registro},
+            ensure_ascii=False
+        ))
+
+
+def medida(etapa): # Envolve uma etapa cacheada numa Medicao (hits e misses)
+    def decorador(funcao):
+        if not DESEMPENHO:
+            return funcao
+
+        @functools.wraps(funcao)
+        def medida_(*args, **kwargs):
+            entradas = [linhas_de(a) for a in (*args, *kwargs.values())]
+            entradas = [n for n in entradas if n is not None]
+            with Medicao(etapa, max(entradas) if entradas else None) as medicao:
+                resultado = funcao(*args, **kwargs)
+                medicao.saida = linhas_de(resultado)
+            return resultado
+
+        return medida_
+    return decorador
+
+
+def mostrar_desempenho(painel): # Tabela do rerun no painel lateral + resumo no log
+    if not DESEMPENHO:
+        return
+    registros = st.session_state.desempenho
+    total = sum(r["segundos"] for r in registros)
+    logger_desempenho.info(json.dumps(
+        {"evento": "rerun", "sessao": st.session_state.id_desempenho,
+         "segundos": round(total, 4), "etapas": len(registros)},
+        ensure_ascii=False
+    ))
+
+    with painel.container(), st.expander("⏱ Desempenho", expanded=False):
+        st.caption(f"{len(registros)} etapas medidas · {total:.3f} s neste rerun")
+        if registros:
+            tabela = pd.DataFrame(registros).rename(columns={
+                "etapa": "Etapa", "segundos": "Tempo (s)", "linhas_entrada": "Linhas (entrada)",
+                "linhas_saida": "Linhas (saída)", "memoria_mb": "Memória (MB)", "cache": "Do cache",
+                "segundo_plano": "Em segundo plano",
+            }).astype({"Linhas (entrada)": "Int64", "Linhas (saída)": "Int64"})
+            st.dataframe(tabela, hide_index=True, use_container_width=True)
+
+
+@medida("limpeza")
+@st.cache_resource(max_entries=16, show_spinner=False)
+def etapa_limpeza(chave, _df): # Colunas/linhas vazias ou explicativas e nomes de colunas
+    marcar_recalculo("limpeza")
+    return limpar_planilha(_df)
+
+
+@medida("kpi")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_kpi(chave, kpi_col, is_percent, _df): # KPI numérico, em % quando vier como fração
+    marcar_recalculo("kpi")
+
+    # Colunas já convertidas na leitura em blocos não passam de novo pelo parse
+    serie = _df[kpi_col]
+    if serie.dtype != "float64":
+        serie = to_number(serie)
+
+    convertido = False
+    if is_percent:
+        serie, convertido = fracao_para_percentual(serie)
+
+    # Meta sugerida automática, já na escala exibida
+    meta_sugerida = calcular_meta_sugerida(serie, menor_e_melhor(kpi_col))
+
+    return serie, convertido, meta_sugerida
+
+
+@medida("tempo")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_tempo(chave, time_col, _df): # Coluna de tempo como datetime
+    marcar_recalculo("tempo")
+    # Formato inferido de uma amostra, mês/ano em português (ex: fev/25) e
+    # descarte de números puros que virariam epoch (1970)
+    return parsear_datas(_df[time_col])
+
+
+@medida("série")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_serie(chave, kpi_col, time_col, is_percent, _kpi, _datas): # Série ordenada para gráficos
+    marcar_recalculo("série")
+    return serie_temporal(_kpi, _datas, kpi_col, time_col)
+
+
+@medida("agregados")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_agregados(chave, kpi_col, time_col, is_percent, _kpi, _datas, _serie): # Números dos cards
+    marcar_recalculo("agregados")
+    return calcular_agregados(_kpi, _datas, _serie, kpi_col, time_col)
+
+
+@medida("janelas")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_janelas(chave, kpi_col, time_col, is_percent, _serie): # Últimos valores válidos para as janelas móveis
+    marcar_recalculo("janelas")
+    return janelas_iniciar(_serie[kpi_col])
+
+
+@medida("status")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_status(chave, kpi_col, is_percent, meta, regra, _kpi): # Status por registro
+    marcar_recalculo("status")
+    status = status_kpi(_kpi, meta, regra)
+    return status, (status == FORA_META).sum()
+
+
+# Metas e regras por coluna para a matriz de KPIs (ver `carregar_metas`)
+ARQUIVO_METAS = os.environ.get("KPI_METAS", "metas_kpi.json")
+
+
+@medida("matriz")
+@st.cache_resource(max_entries=16, show_spinner=False)
+def etapa_matriz(chave, time_col, chave_metas, _df, _datas, _metas): # Todos os KPIs da planilha de uma vez
+    marcar_recalculo("matriz")
+    return matriz_kpis(_df, colunas_kpi(_df, time_col), _datas, _metas)
+
+
+# Granularidade extra, sem agregação: cada registro vira um ponto
+REGISTROS = "Registros"
+
+
+@medida("rollups")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_rollups(chave, kpi_col, time_col, is_percent, _kpi, _datas): # Hora/turno/dia/semana/mês de uma vez
+    """Rollups de todas as granularidades e se a série é mensal (um registro
+    por mês, sempre no dia 1). Trocar de granularidade na tela só escolhe
+    uma das tabelas já prontas.
+    """
+    marcar_recalculo("rollups")
+    rollups = calcular_rollups(_kpi, _datas)
+
+    horas = rollups["tabelas"]["Hora"]
+    horas = horas[horas["contagem"] > 0]
+    mensal = (
+        not horas.empty
+        and (horas["contagem"] == 1).all()
+        and (horas.index == horas.index.to_period("M").to_timestamp()).all()
+    )
+    return rollups, mensal
+
+
+@medida("fora da meta por período")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_fora_periodo(chave, kpi_col, time_col, is_percent, meta, regra, _rollups, _status): # Fora da meta por período
+    marcar_recalculo("fora da meta por período")
+    return fora_meta_por_periodo(_rollups, _status)
+
+
+# Pontos enviados ao navegador no gráfico de linha; acima de LIMITE_WEBGL
+# pontos desenhados o traço passa para WebGL
+PONTOS_GRAFICO = int(os.environ.get("KPI_PONTOS_GRAFICO", "2000"))
+LIMITE_WEBGL = int(os.environ.get("KPI_LIMITE_WEBGL", "1000"))
+METODO_REDUCAO = os.environ.get("KPI_METODO_REDUCAO", "lttb")
+
+
+@medida("gráfico de linha")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_grafico_linha(chave, kpi_col, time_col, is_percent, meta, janela, granularidade, _serie, _periodos): # Evolução do KPI
+    """Figura do gráfico de linha e (pontos exibidos, pontos no período).
+
+    Fora de REGISTROS, a linha é a média de cada período do rollup
+    (`_periodos`). Séries mensais seguem com o eixo mês a mês de sempre.
+    Séries mais densas (sensores, minuto a minuto) são reduzidas a
+    PONTOS_GRAFICO pontos por LTTB (ou min/max por balde) dentro da `janela`
+    (início, fim) escolhida no zoom, então dar zoom traz mais detalhe do
+    mesmo trecho.
+    """
+    marcar_recalculo("gráfico de linha")
+
+    if granularidade == REGISTROS:
+        plot_df = (
+            _serie[[time_col, kpi_col]]
+            .dropna(subset=[time_col, kpi_col])
+            .sort_values(time_col)
+            .set_index(time_col)
+        )
+    else:
+        plot_df = _periodos[["media"]].dropna().rename(columns={"media": kpi_col})
+
+    if janela is not None:
+        plot_df = plot_df.loc[janela[0]:janela[1]]
+    if plot_df.empty:
+        return None
+
+    mensal = granularidade == "Mês" or (
+        granularidade == REGISTROS
+        and plot_df.index.is_unique
+        and (plot_df.index == plot_df.index.to_period("M").to_timestamp()).all()
+    )
+    total_pontos = len(plot_df)
+
+    if mensal:
+        last_year = plot_df.index.max().year
+
+        full_range = pd.date_range(
+            start=plot_df.index.min(),
+            end=(
+                plot_df.index.max() if janela is not None
+                else pd.Timestamp(year=last_year, month=12, day=1)
+            ),
+            freq="MS"
+        )
+
+        plot_df = plot_df.reindex(full_range)
+    else:
+        posicoes = reduzir_serie(
+            plot_df.index.to_numpy(), plot_df[kpi_col].to_numpy(), PONTOS_GRAFICO, METODO_REDUCAO
+        )
+        plot_df = plot_df.iloc[posicoes]
+
+    fig = px.line(
+        plot_df,
+        x=plot_df.index,
+        y=kpi_col,
+        markers=True,
+        title="Evolução do KPI ao longo do tempo",
+        render_mode="webgl" if plot_df[kpi_col].notna().sum() > LIMITE_WEBGL else "svg"
+    )
+
+    #  eixo mensal correto (SEM datas fantasmas)
+    if mensal:
+        fig.update_xaxes(
+            type="date",
+            tickformat="%b/%Y",
+            dtick="M1",
+            ticklabelmode="period",
+            range=[
+                plot_df.index.min(),
+                plot_df.index.max()
+            ]
+        )
+    else:
+        fig.update_xaxes(
+            type="date",
+            range=[
+                plot_df.index.min(),
+                plot_df.index.max()
+            ]
+        )
+
+    fig.add_hline(
+        y=meta,
+        line_dash="dash",
+        line_color="red",
+        annotation_text="Meta",
+        annotation_position="top right"
+    )
+
+    # Seleção em caixa = zoom com nova consulta (ver "Evolução do KPI")
+    fig.update_layout(dragmode="select", selectdirection="h")
+    return fig, plot_df[kpi_col].notna().sum(), total_pontos
+
+
+@medida("gráfico de barras")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_grafico_barras(chave, kpi_col, time_col, is_percent, meta, regra, granularidade, _periodos): # Últimos 6 períodos
+    marcar_recalculo("gráfico de barras")
+
+    # Últimos 6 períodos com dado, direto do rollup
+    bar_df = (
+        _periodos.loc[_periodos["contagem"] > 0]
+        .tail(6)
+        .rename(columns={"media": kpi_col})
+        .reset_index()
+    )
+    if bar_df.empty:
+        return None
+
+    # Mesma regra de status da tabela e dos cards, aplicada à média do período
+    bar_df["Status"] = status_kpi(bar_df[kpi_col], meta, regra).map(
+        {DENTRO_META: "Dentro da meta", FORA_META: "Fora da meta"}
+    )
+
+    fig_bar = px.bar(
+        bar_df,
+        x="Período",
+        y=kpi_col,
+        color="Status",
+        color_discrete_map={
+            "Dentro da meta": "#4CAF50",
+            "Fora da meta": "#F44336"
+        },
+        custom_data=["Status", "contagem", "fora_meta"],
+        template="plotly_dark",
+        text_auto=".2f"
+    )
+
+    fig_bar.update_traces(
+        hovertemplate=
+            "<b>Período:</b> %{x}<br>"
+            "<b>KPI (média):</b> %{y:.2f}<br>"
+            f"<b>Meta:</b> {meta:.2f}<br>"
+            "<b>Status:</b> %{customdata[0]}<br>"
+            "<b>Registros:</b> %{customdata[1]} (%{customdata[2]} fora da meta)"
+            "<extra></extra>"
+    )
+
+    fig_bar.add_hline(
+        y=meta,
+        line_dash="dash",
+        line_color="red",
+        annotation_text="Meta",
+        annotation_position="top right"
+    )
+
+    fig_bar.update_layout(
+        title="KPI por período (comparação direta)",
+        title_x=0.5,
+        yaxis_title="Valor do KPI",
+        xaxis_title=f"Período ({granularidade.lower()})",
+        margin=dict(l=20, r=20, t=60, b=20)
+    )
+    return fig_bar
+
+
+@medida("segmentos")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_segmentos(chave, kpi_col, time_col, is_percent, seg_col, janelas, _kpi, _datas, _segmentos): # Números por linha/máquina/turno
+    marcar_recalculo("segmentos")
+    return kpi_por_segmento(_kpi, _segmentos, _datas, janelas)
+
+
+@medida("fora da meta por segmento")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_fora_segmento(chave, kpi_col, time_col, is_percent, seg_col, meta, regra, _segmentado, _status): # Fora da meta por segmento
+    marcar_recalculo("fora da meta por segmento")
+    return fora_meta_por_segmento(_segmentado, _status, meta, regra)
+
+
+# Gráficos pequenos: só os segmentos com mais registros fora da meta, cada
+# um reduzido a PONTOS_MULTIPLOS pontos
+MULTIPLOS_SEGMENTOS = 12
+PONTOS_MULTIPLOS = 300
+
+
+@medida("gráficos por segmento")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_graficos_segmento(chave, kpi_col, time_col, is_percent, seg_col, meta, regra, _segmentado, _resumo, _kpi, _datas): # Um gráfico pequeno por segmento
+    marcar_recalculo("gráficos por segmento")
+
+    destaque = (
+        _resumo
+        .assign(posicao=np.arange(len(_resumo)))
+        .sort_values(["Fora da meta", "Registros"], ascending=False)
+        .head(MULTIPLOS_SEGMENTOS)
+    )
+
+    # Cada segmento já está contíguo e em ordem de tempo na ordenação do resumo
+    ordem, limites = _segmentado["ordem"], _segmentado["limites"]
+    valores = _kpi.to_numpy(dtype=float, na_value=np.nan)
+    tempos = _datas.to_numpy() if _datas is not None else None
+
+    partes = []
+    for nome, i in zip(destaque.index, destaque["posicao"]):
+        linhas = ordem[limites[i]:limites[i + 1]]
+        x = tempos[linhas] if tempos is not None else np.arange(len(linhas))
+        y = valores[linhas]
+        manter = reduzir_serie(x, y, PONTOS_MULTIPLOS, METODO_REDUCAO)
+        partes.append(pd.DataFrame({seg_col: str(nome), "x": x[manter], kpi_col: y[manter]}))
+
+    if not partes:
+        return None
+
+    linhas_grafico = -(-len(partes) // 4)
+    fig = px.line(
+        pd.concat(partes, ignore_index=True),
+        x="x",
+        y=kpi_col,
+        facet_col=seg_col,
+        facet_col_wrap=4,
+        facet_row_spacing=0.12 / linhas_grafico,
+        height=220 * linhas_grafico,
+        render_mode="webgl" if len(partes) * PONTOS_MULTIPLOS > LIMITE_WEBGL else "svg"
+    )
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=", 1)[-1]))
+    fig.update_xaxes(title_text="", type="date" if tempos is not None else "linear")
+    fig.add_hline(y=meta, line_dash="dash", line_color="red")
+    fig.update_layout(margin=dict(l=20, r=20, t=40, b=20))
+    return fig
+
+
+@medida("tabela")
+@st.cache_resource(max_entries=32, show_spinner=False)
+def etapa_tabela(chave, kpi_col, time_col, is_percent, meta, regra, filtros, ordem, _df, _kpi, _datas, _status): # Linhas filtradas e ordenadas
+    """Posições (iloc) das linhas de "Dados Consolidados" depois de filtros e
+    ordenação. Só as posições são cacheadas; a página visível é montada a
+    cada interação a partir delas.
+    """
+    marcar_recalculo("tabela")
+
+    status_sel, periodo, faixa = filtros
+    mascara = np.ones(len(_kpi), dtype=bool)
+
+    if status_sel is not None:
+        mascara &= np.isin(_status.to_numpy(), status_sel)
+    if periodo is not None and _datas is not None:
+        inicio, fim = periodo
+        datas = _datas.to_numpy()
+        mascara &= (datas >= np.datetime64(inicio)) & (datas < np.datetime64(fim) + np.timedelta64(1, "D"))
+    if faixa is not None:
+        valores = _kpi.to_numpy()
+        mascara &= (valores >= faixa[0]) & (valores <= faixa[1])
+
+    posicoes = np.flatnonzero(mascara)
+
+    coluna, crescente = ordem
+    if coluna is not None:
+        if coluna == kpi_col:
+            valores = _kpi
+        elif coluna == time_col and _datas is not None:
+            valores = _datas
+        elif coluna == "Status KPI":
+            valores = _status
+        else:
+            valores = _df[coluna]
+        ordenados = (
+            valores.iloc[posicoes]
+            .reset_index(drop=True)
+            .sort_values(ascending=crescente, na_position="last", kind="stable")
+        )
+        posicoes = posicoes[ordenados.index.to_numpy()]
+
+    return posicoes
+
+
+def pagina_tabela(df, posicoes, colunas, kpi_col, time_col, kpi, datas, status): # Só as linhas visíveis, com os valores da análise
+    pagina = df.iloc[posicoes]
+    valores = {kpi_col: kpi.iloc[posicoes], "Status KPI": rotulos_status(status.iloc[posicoes])}
+    if datas is not None:
+        valores[time_col] = datas.iloc[posicoes]
+    return pagina.assign(**valores)[colunas]
+
+
+# =========================
+# Tarefas em segundo plano
+# =========================
+# Leitura dos uploads e as etapas pesadas da análise (conversão do KPI,
+# datas, rollups, matriz) rodam no pool de threads, presas à sessão. O rerun
+# só acompanha: mostra o progresso, não recomeça o que já está rodando e,
+# se as entradas mudaram, a tarefa antiga é cancelada e o resultado dela
+# descartado. As etapas continuam cacheadas: a tarefa só aquece o cache, e
+# o rerun seguinte pega o resultado pronto.
+
+# Tarefa que termina dentro deste prazo nem aparece (cache quente, planilha pequena)
+ESPERA_SEGUNDO_PLANO = 0.5
+INTERVALO_SEGUNDO_PLANO = 1.0
+
+
+def em_segundo_plano(nome, chave, funcao, ao_fim=None): # Inicia (ou reencontra) uma tarefa da sessão, com as etapas cacheadas disponíveis na thread
+    contexto = get_script_run_ctx()
+    sessao = st.session_state.id_desempenho
+
+    def rodar(tarefa):
+        # O contexto só serve às etapas cacheadas; o st.session_state não é
+        # usado daqui (ver Medicao)
+        add_script_run_ctx(threading.current_thread(), contexto)
+        _fio.tarefa, _fio.sessao = tarefa, sessao
+        try:
+            return funcao(tarefa)
+        finally:
+            _fio.tarefa = _fio.sessao = None
+            add_script_run_ctx(threading.current_thread(), None)
+
+    return st.session_state.segundo_plano.iniciar(nome, chave, rodar, ao_fim)
+
+
+def receber_medicoes(tarefa): # Etapas recalculadas e medições da tarefa entram neste rerun (uma vez só)
+    if tarefa.recalculadas:
+        st.session_state.etapas_recalculadas |= tarefa.recalculadas
+    st.session_state.desempenho.extend(tarefa.desempenho)
+    tarefa.recalculadas, tarefa.desempenho = set(), []
+
+
+def por_passos(passos): # Função de tarefa a partir de um gerador que produz (fração, texto) antes de cada passo
+    def rodar(tarefa):
+        for fracao, texto in passos:
+            tarefa.informar(fracao, texto)
+    return rodar
+
+
+def passos_analise(chave, kpi_col, time_col, is_percent, df): # KPI, datas e rollups, na ordem em que a página usa
+    yield 0.0, "Convertendo o KPI..."
+    kpi, _, _ = etapa_kpi(chave, kpi_col, is_percent, df)
+    if time_col == "Nenhuma" or time_col not in df.columns:
+        return
+    yield 1 / 3, "Lendo as datas..."
+    datas = etapa_tempo(chave, time_col, df)
+    yield 2 / 3, "Agrupando por período..."
+    etapa_rollups(chave, kpi_col, time_col, is_percent, kpi, datas)
+
+
+def passos_matriz(chave, time_col, chave_metas, df, metas): # Datas e todos os KPIs da planilha
+    datas = None
+    if time_col != "Nenhuma":
+        yield 0.0, "Lendo as datas..."
+        datas = etapa_tempo(chave, time_col, df)
+    yield 0.5, "Calculando todos os KPIs..."
+    etapa_matriz(chave, time_col, chave_metas, df, datas, metas)
+
+
+def acompanhar_tarefa(nome, rotulo): # Progresso e botão de cancelar; recarrega a página quando a tarefa termina
+    tarefa = st.session_state.segundo_plano.tarefa(nome)
+    if tarefa is None or tarefa.pronta():
+        st.rerun()
+
+    if tarefa.cancelada():
+        st.caption(f"⏹ Cancelando {rotulo.lower()} (terminando o passo atual)...")
+        return
+    st.progress(tarefa.fracao, text=f"{tarefa.texto or rotulo + '...'} · {tarefa.segundos():.0f} s")
+    if st.button("✖ Cancelar", key=f"cancelar_{nome}"):
+        tarefa.cancelar()
+        st.rerun()
+
+
+def aguardar_segundo_plano(nome, chave, passos, rotulo): # Roda os passos fora do rerun; a página para aqui até terminarem
+    tarefa = em_segundo_plano(nome, chave, por_passos(passos))
+
+    if tarefa.cancelada():
+        st.warning(f"⏹ {rotulo} cancelada.")
+        if st.button("▶ Calcular de novo", key=f"recalcular_{nome}"):
+            st.session_state.segundo_plano.descartar(nome)
+            st.rerun()
+        st.stop()
+
+    # Terminou (ou falhou: as etapas rodam de novo a seguir e mostram o erro)
+    if tarefa.aguardar(ESPERA_SEGUNDO_PLANO):
+        receber_medicoes(tarefa)
+        return
+
+    st.fragment(acompanhar_tarefa, run_every=INTERVALO_SEGUNDO_PLANO)(nome, rotulo)
+    st.stop()
+
+
+def leitura_em_segundo_plano(tarefas, chaves, executor, cache): # Tarefa de leitura dos uploads: (nome, df, erro) de cada um
+    def rodar(tarefa):
+        lidas = []
+
+        def progresso(nome, fracao):
+            tarefa.informar((len(lidas) + fracao) / len(tarefas), f"Lendo {nome}... {fracao:.0%}")
+
+        leituras = ler_em_paralelo(tarefas, executor, progresso)
+        try:
+            with Medicao("leitura") as medicao:
+                medicao.saida = 0
+                for nome, df, erro in leituras:
+                    if erro is None:
+                        contar_leitura(df)
+                        # Outras sessões esperando o mesmo arquivo já podem usá-lo
+                        cache.guardar(chaves[nome], df)
+                        medicao.saida += len(df)
+                    lidas.append((nome, df, erro))
+                    tarefa.informar(
+                        len(lidas) / len(tarefas), f"Lendo planilhas... {len(lidas)}/{len(tarefas)}"
+                    )
+        finally:
+            leituras.close()
+        return lidas
+
+    return rodar
+
+
+def iniciar_leitura(tarefas, cache): # Tarefa de leitura das planilhas já reservadas no cache
+    chaves = {tarefa[0]: st.session_state.file_hashes[tarefa[0]] for tarefa in tarefas}
+
+    # Reservas soltas ao fim da tarefa de qualquer jeito, inclusive cancelada
+    # ainda na fila: ninguém fica esperando para sempre por este arquivo
+    def concluir():
+        for chave in chaves.values():
+            cache.concluir(chave)
+
+    return em_segundo_plano(
+        f"leitura {next(iter(chaves.values()))[:12]}",
+        tuple(chaves.items()),
+        leitura_em_segundo_plano(tarefas, chaves, pool_leitura(), cache),
+        concluir
+    )
+
+
+# Esperando outra sessão há mais tempo que isso: desiste e lê aqui
+ESPERA_OUTRA_SESSAO = 600
+
+
+def espera_em_segundo_plano(aguardando, chaves, cache): # Tarefa que espera outra sessão terminar de ler os mesmos arquivos
+    def rodar(tarefa):
+        prazo = time.monotonic() + ESPERA_OUTRA_SESSAO
+        for i, (nome, chave) in enumerate(chaves.items()):
+            tarefa.informar(i / len(chaves), f"Aguardando a leitura de {nome} em outra sessão...")
+            # Acorda a cada intervalo só para atender a um cancelamento
+            while not cache.aguardar(chave, timeout=INTERVALO_SEGUNDO_PLANO) and time.monotonic() < prazo:
+                tarefa.informar(i / len(chaves))
+        return aguardando
+
+    return rodar
+
+
+def iniciar_espera(aguardando, cache): # Tarefa de espera pelas planilhas que outra sessão está lendo
+    chaves = {tarefa[0]: st.session_state.file_hashes[tarefa[0]] for tarefa in aguardando}
+    return em_segundo_plano(
+        f"espera {next(iter(chaves.values()))[:12]}",
+        tuple(chaves.items()),
+        espera_em_segundo_plano(aguardando, chaves, cache)
+    )
+
+
+def esquecer_planilhas(tarefa): # Planilhas de uma tarefa que não terminou bem não contam como carregadas
+    for nome, chave in tarefa.chave:
+        if nome not in st.session_state.files_data and st.session_state.file_hashes.get(nome) == chave:
+            del st.session_state.file_hashes[nome]
+    if tarefa.estado == "erro":
+        st.sidebar.error(f"❌ Leitura interrompida: {tarefa.erro}")
+    else:
+        st.sidebar.warning("⏹ Leitura cancelada. Remova e envie os arquivos de novo para lê-los.")
+
+
+def receber_leitura(leitura): # Planilhas de uma leitura terminada entram na sessão
+    st.session_state.segundo_plano.descartar(leitura.nome)
+    receber_medicoes(leitura)
+    if leitura.estado != "concluída":
+        esquecer_planilhas(leitura)
+        return
+
+    chaves = dict(leitura.chave)
+    for nome, df, erro in leitura.resultado:
+        if erro is not None:
+            st.session_state.file_hashes.pop(nome, None)
+            st.sidebar.error(f"❌ Não foi possível ler {nome}: {erro}")
+        else:
+            st.session_state.files_data.guardar(nome, chaves[nome], df)
+
+
+def receber_espera(espera, cache): # Usa o que a outra sessão leu; o que ela não conseguiu ler é lido aqui
+    st.session_state.segundo_plano.descartar(espera.nome)
+    if espera.estado != "concluída":
+        esquecer_planilhas(espera)
+        return
+
+    chaves = dict(espera.chave)
+    faltando = [t for t in espera.resultado if st.session_state.files_data.carregar(t[0], chaves[t[0]]) is None]
+    tarefas = [t for t in faltando if cache.reservar(chaves[t[0]])]
+    ainda_lendo = [t for t in faltando if t not in tarefas]
+    if tarefas:
+        iniciar_leitura(tarefas, cache)
+    if ainda_lendo:
+        iniciar_espera(ainda_lendo, cache)
+
+
+# =========================
+# Modo contínuo (pasta monitorada)
+# =========================
+
+PASTA_CONTINUA = os.environ.get("KPI_PASTA_CONTINUA", "")
+INTERVALO_CONTINUO = float(os.environ.get("KPI_CONTINUO_INTERVALO", "10"))
+
+# Blocos de linhas novas guardados para refazer a série quando a coluna muda;
+# acima disso são juntados num só
+MAX_BLOCOS_CONTINUO = 64
+
+
+def anexar_continuo(estado, novas, kpi_col, time_col): # Converte só as linhas novas e junta à série
+    if kpi_col not in novas.columns or time_col not in novas.columns:
+        estado["registros"] += len(novas)
+        return
+    anexar_serie(estado, to_number(novas[kpi_col]), parsear_datas(novas[time_col]))
+
+
+def ler_continuo(): # Linhas anexadas desde a última leitura, já juntadas à série ativa
+    continuo = st.session_state.continuo
+    monitor = continuo["monitor"]
+    try:
+        novas, reiniciado = monitor.novas_linhas()
+    except Exception as e:
+        # Ex.: arquivo apagado entre a listagem e a leitura; tenta de novo no próximo ciclo
+        st.warning(f"Não foi possível ler as linhas novas de {monitor.caminho}: {e}")
+        return 0
+    for aviso in monitor.avisos:
+        st.warning(aviso)
+
+    if reiniciado:
+        continuo["blocos"] = []
+        continuo["serie"] = None
+    if novas.empty:
+        return 0
+
+    continuo["blocos"].append(novas)
+    if len(continuo["blocos"]) > MAX_BLOCOS_CONTINUO:
+        continuo["blocos"] = [pd.concat(continuo["blocos"], ignore_index=True)]
+
+    if continuo["serie"] is not None:
+        anexar_continuo(continuo["serie"], novas, *continuo["chave"])
+    continuo["lidas"] += len(novas)
+    return len(novas)
+
+
+def serie_ativa_continua(kpi_col, time_col, is_percent): # Série da coluna escolhida; refeita dos blocos só ao trocar
+    continuo = st.session_state.continuo
+    chave = (kpi_col, time_col, is_percent)
+    if continuo["serie"] is None or continuo["chave_serie"] != chave:
+        continuo["serie"] = serie_continua(is_percent)
+        continuo["chave"] = (kpi_col, time_col)
+        continuo["chave_serie"] = chave
+        if continuo["blocos"]:
+            anexar_continuo(
+                continuo["serie"], pd.concat(continuo["blocos"], ignore_index=True), kpi_col, time_col
+            )
+    return continuo["serie"]
+
+
+def painel_continuo(kpi_col, time_col, is_percent, meta, regra): # Cards e gráfico atualizados a cada intervalo
+    novas = ler_continuo()
+    estado = serie_ativa_continua(kpi_col, time_col, is_percent)
+    n = estado["n"]
+
+    if n == 0:
+        st.info("⏳ Aguardando registros com KPI e data válidos...")
+        return
+
+    moveis = estatisticas_moveis(estado["janelas"])
+    ultimo = moveis["ultimo"]
+    codigo = status_kpi(pd.Series([ultimo]), meta, regra).iloc[0]
+    cor = "green" if codigo == DENTRO_META else "red"
+    cor_tendencia = (
+        "green" if "↑" in moveis["tendencia"] else "red" if "↓" in moveis["tendencia"] else "yellow"
+    )
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        kpi_card("KPI Atual", format_kpi(ultimo, is_percent), "📊", cor)
+    with c2:
+        kpi_card("Meta", format_kpi(meta, is_percent), "🎯", "blue")
+    with c3:
+        kpi_card("Status", ROTULOS_STATUS[codigo], "🚦", cor)
+    with c4:
+        kpi_card("Tendência", moveis["tendencia"], "📉", cor_tendencia)
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Registros", f"{estado['registros']:,}", f"+{novas:,}" if novas else None)
+    c2.metric("Confiabilidade", f"{estado['validos'] / estado['registros']:.0%}")
+    c3.metric("Fora da meta", f"{fora_meta_continua(estado, meta, regra):,}")
+    c4.metric("KPI operacional", format_kpi(moveis["media_movel"], is_percent))
+
+    # Só a cauda entra no gráfico: o custo de desenhar não cresce com o arquivo
+    inicio = max(0, n - PONTOS_GRAFICO)
+    plot_df = pd.DataFrame(
+        {kpi_col: estado["valores"][inicio:n]}, index=pd.DatetimeIndex(estado["tempos"][inicio:n], name=time_col)
+    )
+    fig = px.line(
+        plot_df,
+        x=plot_df.index,
+        y=kpi_col,
+        title=f"Últimos {len(plot_df):,} registros",
+        render_mode="webgl" if len(plot_df) > LIMITE_WEBGL else "svg"
+    )
+    fig.add_hline(y=meta, line_dash="dash", line_color="red", annotation_text="Meta", annotation_position="top right")
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.caption(
+        f"🔄 Atualizado às {pd.Timestamp.now():%H:%M:%S} · "
+        f"{len(st.session_state.continuo['monitor'].arquivos())} arquivo(s) monitorado(s)"
+    )
+
+
+def aguardar_continuo(caminho): # Arquivo ainda vazio: recarrega a página quando a primeira linha chegar
+    if ler_continuo():
+        st.rerun()
+    st.info(f"⏳ Nenhuma linha completa em {caminho} ainda.")
+
+
+def modo_continuo(): # Página do modo contínuo: escolhe a pasta/arquivo e as colunas, o painel se atualiza sozinho
+    st.sidebar.markdown("## 📡 Pasta monitorada")
+    caminho = st.sidebar.text_input(
+        "Pasta ou arquivo CSV", value=PASTA_CONTINUA, key="caminho_continuo"
+    ).strip()
+    intervalo = st.sidebar.number_input(
+        "Atualizar a cada (s)", 1.0, 3600.0, INTERVALO_CONTINUO, step=1.0, key="intervalo_continuo"
+    )
+
+    if not caminho:
+        st.info("Informe a pasta (ou o arquivo CSV) que a linha vai alimentando.")
+        st.stop()
+    if not os.path.exists(caminho):
+        st.error(f"❌ {caminho} não existe.")
+        st.stop()
+
+    continuo = st.session_state.get("continuo")
+    if continuo is None or continuo["monitor"].caminho != caminho:
+        continuo = st.session_state.continuo = {
+            "monitor": MonitorCsv(caminho),
+            "blocos": [],
+            "serie": None,
+            "chave": None,
+            "chave_serie": None,
+            "lidas": 0,
+        }
+        ler_continuo()
+
+    if not continuo["blocos"]:
+        st.fragment(aguardar_continuo, run_every=intervalo)(caminho)
+        st.stop()
+
+    section("Monitoramento contínuo", "📡")
+
+    colunas = list(dict.fromkeys(c for bloco in continuo["blocos"] for c in bloco.columns))
+    time_cols = colunas_tempo(colunas)
+    if not time_cols:
+        st.error("❌ O modo contínuo precisa de uma coluna de data/hora.")
+        st.stop()
+
+    kpi_col = st.selectbox(
+        "Selecione a coluna do KPI", [c for c in colunas if c not in time_cols], key="kpi_continuo"
+    )
+    time_col = st.selectbox("Coluna de tempo", time_cols, key="tempo_continuo")
+
+    c1, c2, c3 = st.columns(3)
+    regra = "Menor é melhor" if menor_e_melhor(kpi_col) else c1.radio(
+        "Como interpretar o KPI?", ["Maior é melhor", "Menor é melhor"], key="regra_continuo"
+    )
+    is_percent = c2.selectbox(
+        "Unidade do KPI", ["Percentual (%)", "Valor absoluto"], key="unidade_continuo"
+    ) == "Percentual (%)"
+
+    # Meta sugerida só na primeira vez que a coluna aparece
+    chave_meta = f"meta_continuo_{kpi_col}"
+    if chave_meta not in st.session_state:
+        estado = serie_ativa_continua(kpi_col, time_col, is_percent)
+        st.session_state[chave_meta] = float(calcular_meta_sugerida(
+            pd.Series(estado["valores"][:estado["n"]]), regra == "Menor é melhor"
+        ))
+    meta = c3.number_input("Meta do KPI", step=0.1, key=chave_meta)
+
+    st.fragment(painel_continuo, run_every=intervalo)(kpi_col, time_col, is_percent, meta, regra)
+
+
+def abrir_dataset_salvo(nome): # Abre (ou troca o período de) um dataset do armazém como planilha da sessão
+    armazem = armazem_datasets()
+    manifesto = armazem.manifesto(nome[len(PREFIXO_SALVO):])
+    if manifesto is None:
+        st.sidebar.error(f"❌ {nome} não está mais no armazém.")
+        st.stop()
+
+    # Período: só as partições (meses) que cruzam o intervalo são lidas
+    inicio = fim = None
+    meses = [p for p in manifesto["particoes"] if p["mes"] is not None]
+    if meses:
+        primeiro = pd.Timestamp(meses[0]["inicio"]).date()
+        ultimo = pd.Timestamp(meses[-1]["fim"]).date()
+        periodo = st.sidebar.date_input(
+            f"Período ({manifesto['coluna_tempo']})",
+            (primeiro, ultimo),
+            min_value=primeiro,
+            max_value=ultimo,
+            key=f"periodo_{nome}"
+        )
+        if len(periodo) < 2 and nome in st.session_state.files_data:
+            return  # ainda escolhendo o fim do intervalo
+        if len(periodo) == 2 and tuple(periodo) != (primeiro, ultimo):
+            inicio = pd.Timestamp(periodo[0])
+            fim = pd.Timestamp(periodo[1]) + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+
+    chave = chave_aba(f"{manifesto['chave']}|{manifesto['salvo_em']}", f"{inicio}|{fim}")
+    if st.session_state.file_hashes.get(nome) == chave and nome in st.session_state.files_data:
+        return
+
+    st.session_state.file_hashes[nome] = chave
+    if st.session_state.files_data.carregar(nome, chave) is None:
+        st.session_state.files_data.guardar(nome, chave, armazem.abrir(manifesto["nome"], inicio, fim))
+
+
 st.sidebar.markdown(
     """
     <div style="text-align:center;">
@@ -166,12 +1237,30 @@ st.sidebar.markdown(
 
 st.sidebar.markdown("---")
 
+# Pasta monitorada: painel próprio, que se atualiza sozinho
+fonte_dados = st.sidebar.radio(
+    "Fonte dos dados",
+    ["Upload de arquivos", "Pasta monitorada (modo contínuo)"],
+    key="fonte_dados"
+)
+if fonte_dados != "Upload de arquivos":
+    modo_continuo()
+    st.stop()
+
 # =========================
 # Upload de arquivos (Sidebar)
 # =========================
 
 st.sidebar.markdown("## ☁️ Upload de dados")
 
+# Só a planilha ativa (e as recentes, dentro do orçamento) fica em memória;
+# as outras voltam do disco quando selecionadas
+if "files_data" not in st.session_state:
+    st.session_state.files_data = planilhas_sessao()
+
+if "segundo_plano" not in st.session_state:
+    st.session_state.segundo_plano = TarefasSessao(pool_tarefas())
+
 files = st.sidebar.file_uploader(
     "Envie arquivos Excel ou CSV",
     type=["csv", "xlsx", "xls"],
@@ -180,41 +1269,112 @@ files = st.sidebar.file_uploader(
 )
 
 if files:
+    cache = cache_ingestao()
+    tarefas = []  # uma por arquivo CSV ou por aba de Excel ainda não lida
+    aguardando = []  # sendo lidas agora por outra sessão
+
     for file in files:
-        if file.name not in st.session_state.files_data:
-            if file.name.lower().endswith(".csv"):
-                df = pd.read_csv(
-                    file,
-                    sep=None,
-                    engine="python",
-                    encoding="latin-1",
-                    dtype=str
-                )
-            else:
-                df = pd.read_excel(file)
+        if file.file_id in st.session_state.upload_ids:
+            continue
 
+        # CSVs grandes são lidos em blocos, sem montar o frame de texto inteiro
+        em_blocos = (
+            file.name.lower().endswith(".csv")
+            and file.size > int(os.environ.get("KPI_CSV_BLOCOS_MB", "100")) * 1024**2
+        )
 
-            df.columns = [c.strip() for c in df.columns]
-            df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+        buffer = file.getbuffer()
+        chave = chave_conteudo(file.name, buffer, em_blocos=em_blocos)
+        buffer.release()
 
-            st.session_state.files_data[file.name] = df
+        # Leitura em blocos usa o próprio upload; o resto vai em bytes para os workers
+        dados = file if em_blocos else file.getvalue()
+        try:
+            abas = listar_abas(file.name, dados) if not em_blocos else [None]
+        except Exception as erro:
+            st.sidebar.error(f"❌ Não foi possível ler {file.name}: {erro}")
+            st.session_state.upload_ids[file.file_id] = file.name
+            continue
+
+        for aba in abas:
+            chave_da_aba = chave_aba(chave, aba)
+
+            # Mesmo conteúdo já carregado nesta sessão (ex.: reenvio do arquivo)
+            if chave_da_aba in st.session_state.file_hashes.values():
+                continue
+
+            nome = nome_livre(file.name if len(abas) == 1 else f"{file.name} · {aba}")
+            st.session_state.file_hashes[nome] = chave_da_aba
+
+            # Já lido por esta ou outra sessão: usa o mesmo frame, sem nova leitura
+            tarefa = (nome, file.name, dados, aba, em_blocos)
+            if st.session_state.files_data.carregar(nome, chave_da_aba) is not None:
+                continue
+            if cache.reservar(chave_da_aba):
+                tarefas.append(tarefa)
+            else:
+                aguardando.append(tarefa)
+
+        st.session_state.upload_ids[file.file_id] = file.name
+
+    # A leitura roda em segundo plano: cliques durante a leitura não a
+    # recomeçam, e uploads novos viram outra tarefa
+    if tarefas:
+        iniciar_leitura(tarefas, cache).aguardar(ESPERA_SEGUNDO_PLANO)
+
+    # Mesmo arquivo sendo lido por outra sessão: espera (também em segundo
+    # plano) e reaproveita o resultado; se aquela leitura falhou, lê aqui
+    if aguardando:
+        iniciar_espera(aguardando, cache)
+
+# Leituras e esperas terminadas entram na sessão; as canceladas (inclusive
+# por reset) já foram esquecidas e o resultado delas nunca chega aqui
+for tarefa in st.session_state.segundo_plano.listar("leitura "):
+    if tarefa.pronta():
+        receber_leitura(tarefa)
+for tarefa in st.session_state.segundo_plano.listar("espera "):
+    if tarefa.pronta():
+        receber_espera(tarefa, cache_ingestao())
+
+leituras_rodando = (
+    st.session_state.segundo_plano.listar("leitura ")
+    + st.session_state.segundo_plano.listar("espera ")
+)
+for leitura in leituras_rodando:
+    with st.sidebar:
+        st.fragment(acompanhar_tarefa, run_every=INTERVALO_SEGUNDO_PLANO)(leitura.nome, "Leitura")
 
-    if st.session_state.active_file is None:
-        st.session_state.active_file = list(st.session_state.files_data.keys())[0]
+if st.session_state.active_file is None and st.session_state.files_data:
+    st.session_state.active_file = list(st.session_state.files_data.keys())[0]
 
 # =========================
 # Session State - Upload
 # =========================
-if st.session_state.files_data:
+# Datasets do armazém local aparecem junto dos uploads e só são abertos
+# quando escolhidos
+salvos = []
+if ARMAZEM_DISPONIVEL:
+    salvos = [
+        PREFIXO_SALVO + manifesto["nome"]
+        for manifesto in armazem_datasets().listar()
+        if PREFIXO_SALVO + manifesto["nome"] not in st.session_state.files_data
+    ]
+planilhas = list(st.session_state.files_data.keys()) + salvos
+
+if planilhas:
     st.sidebar.markdown("### 📁 Planilha ativa")
 
+    if st.session_state.active_file not in planilhas:
+        st.session_state.active_file = planilhas[0]
     st.session_state.active_file = st.sidebar.selectbox(
         "Selecione a planilha",
-        list(st.session_state.files_data.keys()),
-        index=list(st.session_state.files_data.keys()).index(
-            st.session_state.active_file
-        )
+        planilhas,
+        index=planilhas.index(st.session_state.active_file),
+        key="planilha_ativa"
     )
+
+    if st.session_state.active_file.startswith(PREFIXO_SALVO) and ARMAZEM_DISPONIVEL:
+        abrir_dataset_salvo(st.session_state.active_file)
     # =========================
 # Estado por planilha
 # =========================
@@ -228,82 +1388,137 @@ if st.session_state.active_file not in st.session_state.file_states:
 st.sidebar.markdown("---")
 
 if st.sidebar.button("🔄 Resetar análise"):
-    st.session_state.files_data = {}
+    st.session_state.segundo_plano.cancelar_todas()
+    st.session_state.files_data.limpar()
+    st.session_state.upload_ids = {}
+    st.session_state.file_hashes = {}
     st.session_state.active_file = None
     st.rerun()
 
+painel_desempenho = st.sidebar.empty()
+
 # =========================
 # Carregamento do DataFrame ativo
 if st.session_state.files_data and st.session_state.active_file:
-    current_df = st.session_state.files_data[st.session_state.active_file]
+    try:
+        bruto_df = st.session_state.files_data[st.session_state.active_file]
+    except KeyError as erro:
+        st.error(f"❌ {erro.args[0]}. Envie o arquivo novamente.")
+        st.stop()
+    chave_df = st.session_state.file_hashes[st.session_state.active_file]
+elif leituras_rodando:
+    st.info("⏳ Lendo as planilhas em segundo plano; acompanhe o progresso na barra lateral.")
+    st.stop()
 else:
     st.info("Envie pelo menos uma planilha para começar.")
     st.stop()
 
-    # =========================
+st.session_state.etapas_recalculadas = set()
+
+# =========================
 # Normalização defensiva (CSV / Excel)
 # =========================
+current_df, linhas_removidas, dup_cols = etapa_limpeza(chave_df, bruto_df)
 
-
-
-# 1. Remove colunas totalmente vazias
-current_df = current_df.dropna(axis=1, how="all")
-
-# 2. Remove linhas sem nenhum número (texto solto do Excel)
-current_df = current_df[
-    current_df.apply(lambda row: row.astype(str).str.contains(r"\d").any(), axis=1)
-]
-
-# 3. Limpa nomes de colunas
-current_df.columns = (
-    current_df.columns
-        .astype(str)
-        .str.strip()
-        .str.replace("\n", " ")
-)
-
-# 4. Remove linhas explicativas tipo "Para lembrar"
-current_df = current_df[
-    ~current_df.apply(
-        lambda r: r.astype(str).str.contains("para lembrar", case=False).any(),
-        axis=1
-    )
-]
 # ==========================
 # Blindagem: nomes de colunas únicos
 # ==========================
-    
-current_df.columns = (
-    current_df.columns
-    .astype(str)
-    .str.strip()
-)
-
-if current_df.columns.duplicated().any():
-    dup_cols = current_df.columns[current_df.columns.duplicated()].tolist()
+if dup_cols:
     st.error(f"❌ Colunas duplicadas detectadas: {dup_cols}")
     st.stop()
 
+# Planilha já tratada vai para o armazém local, particionada por mês
+if ARMAZEM_DISPONIVEL and not st.session_state.active_file.startswith(PREFIXO_SALVO):
+    with st.sidebar.expander("💾 Salvar no armazém local"):
+        coluna_particao = st.selectbox(
+            "Particionar por mês de",
+            colunas_tempo(current_df.columns) + ["Nenhuma"],
+            key="coluna_particao"
+        )
+        if st.button("Salvar dataset", key="salvar_dataset"):
+            # Rerun para o dataset já aparecer em "Planilha ativa"
+            st.session_state.dataset_salvo = armazem_datasets().salvar(
+                st.session_state.active_file,
+                current_df,
+                None if coluna_particao == "Nenhuma" else coluna_particao,
+                chave=chave_df
+            )
+            st.rerun()
+
+        manifesto = st.session_state.pop("dataset_salvo", None)
+        if manifesto is not None:
+            st.success(
+                f"✅ {manifesto['linhas']:,} linhas em {len(manifesto['particoes'])} partições; "
+                f"disponível em \"Planilha ativa\" como {PREFIXO_SALVO}{manifesto['nome']}"
+            )
+
 # =========================
 # Mapeamento do KPI
 # =========================
 section("Mapeamento do KPI", "🧭")
 
 #  1. Colunas candidatas a tempo (PRIMEIRO!)
-time_cols = [
-    c for c in current_df.columns
-    if "data" in c.lower() or "mês" in c.lower() or "mes" in c.lower()
-]
+time_cols = colunas_tempo(current_df.columns)
 
 #  2. Colunas candidatas a KPI
 numeric_cols = current_df.select_dtypes(
-    include=[np.number, "object"]
+    include=[np.number, "object", "category", "str"]
 ).columns.tolist()
 
 if not numeric_cols:
     st.error("Não encontrei colunas utilizáveis no arquivo.")
     st.stop()
 
+modo_analise = st.radio(
+    "Modo de análise", ["KPI único", "Matriz de KPIs"], horizontal=True, key="modo_analise"
+)
+
+if modo_analise == "Matriz de KPIs":
+    time_col = st.selectbox(
+        "Selecione a coluna de tempo (opcional)",
+        ["Nenhuma"] + time_cols
+    )
+
+    try:
+        metas = carregar_metas(ARQUIVO_METAS)
+    except ValueError as erro:
+        st.error(f"❌ Arquivo de metas inválido: {erro}")
+        metas = {}
+    chave_metas = json.dumps(metas, sort_keys=True)
+
+    aguardar_segundo_plano(
+        "análise",
+        (chave_df, "matriz", time_col, chave_metas),
+        passos_matriz(chave_df, time_col, chave_metas, current_df, metas),
+        "Matriz de KPIs"
+    )
+    datas = etapa_tempo(chave_df, time_col, current_df) if time_col != "Nenhuma" else None
+    matriz = etapa_matriz(chave_df, time_col, chave_metas, current_df, datas, metas)
+
+    section("Matriz de KPIs", "🧮")
+    st.caption(
+        f"{len(matriz)} KPIs · metas e regras "
+        + (f"de {ARQUIVO_METAS} ({len(metas)} colunas), o resto " if metas else "")
+        + "sugeridas automaticamente · clique no cabeçalho para ordenar"
+    )
+
+    matriz = matriz.assign(Confiabilidade=matriz["Confiabilidade"] * 100)
+    with Medicao("matriz (st.dataframe)", len(matriz)):
+        st.dataframe(
+            matriz.sort_values("Fora da meta", ascending=False),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                **{
+                    col: st.column_config.NumberColumn(format="%.2f")
+                    for col in ["KPI atual", "Média", "Mínimo", "Meta"]
+                },
+                "Confiabilidade": st.column_config.NumberColumn(format="%.0f%%"),
+            }
+        )
+    mostrar_desempenho(painel_desempenho)
+    st.stop()
+
 #  3. Seleção do KPI
 kpi_col = st.selectbox(
     "Selecione a coluna do KPI",
@@ -313,12 +1528,7 @@ kpi_col = st.selectbox(
 # Tipo de KPI (detecção automática)
 # =========================
 
-kpi_name = kpi_col.lower()
-
-is_recovery = any(
-    key in kpi_name
-    for key in ["recovery", "perda", "perdas", "refugo", "scrap"]
-)
+is_recovery = menor_e_melhor(kpi_col)
 
 
 #  4. Seleção da coluna de tempo
@@ -327,6 +1537,12 @@ time_col = st.selectbox(
     ["Nenhuma"] + time_cols
 )
 
+#  Segmentação opcional (linha, máquina, turno...)
+seg_col = st.selectbox(
+    "Segmentar por (opcional)",
+    ["Nenhum"] + colunas_segmento(current_df, [kpi_col, time_col])
+)
+
 #  5. Bloqueio de segurança (AGORA FUNCIONA)
 if time_col != "Nenhuma" and kpi_col == time_col:
     st.error("❌ A coluna de tempo não pode ser usada como KPI.")
@@ -339,152 +1555,163 @@ else:
         "Como interpretar o KPI?",
         ["Maior é melhor", "Menor é melhor"]
     )
-if "meta_sugerida" not in locals():
-    meta_sugerida = 0.0
-#  6. Definição da meta do KPI
-
 kpi_unit = st.selectbox(
     "Unidade do KPI",
     ["Percentual (%)", "Valor absoluto"]
 )
+is_percent_kpi = kpi_unit == "Percentual (%)"
+
+#  6. Janelas do KPI operacional, tendência, inclinação e EWMA
+with st.expander("📐 Janelas do KPI operacional e da tendência", expanded=False):
+    j1, j2, j3, j4 = st.columns(4)
+    janelas_kpi = {
+        "operacional": j1.number_input(
+            "KPI operacional (últimos N)", 1, JANELA_MAXIMA, JANELAS_PADRAO["operacional"], key="janela_operacional"
+        ),
+        "tendencia": j2.number_input(
+            "Tendência (N contra os N anteriores)", 1, JANELA_MAXIMA // 2, JANELAS_PADRAO["tendencia"], key="janela_tendencia"
+        ),
+        "inclinacao": j3.number_input(
+            "Inclinação (últimos N)", 2, JANELA_MAXIMA, JANELAS_PADRAO["inclinacao"], key="janela_inclinacao"
+        ),
+        "ewma": j4.number_input("EWMA (span)", 1, 30, JANELAS_PADRAO["ewma"], key="janela_ewma"),
+    }
+    janelas_kpi["minimo_operacional"] = min(JANELAS_PADRAO["minimo_operacional"], janelas_kpi["operacional"])
+
+
+
+# Conversão do KPI, datas e rollups em segundo plano (ver "Tarefas em
+# segundo plano"); trocar coluna ou unidade cancela o cálculo anterior
+aguardar_segundo_plano(
+    "análise",
+    (chave_df, kpi_col, time_col, is_percent_kpi),
+    passos_analise(chave_df, kpi_col, time_col, is_percent_kpi, current_df),
+    "Análise"
+)
 
-file_state = st.session_state.file_states[st.session_state.active_file]
+# =========================
+# Normalização do KPI
+# =========================
+kpi_serie, kpi_convertido, meta_sugerida = etapa_kpi(
+    chave_df, kpi_col, is_percent_kpi, current_df
+)
 
-if kpi_unit == "Percentual (%)":
-    is_percent_kpi = True
+#  7. Definição da meta do KPI: sugerida a partir do próprio KPI, guardada por coluna
+file_state = st.session_state.file_states[st.session_state.active_file]
+metas_arquivo = file_state.setdefault("metas_kpi", {})
 
+if is_percent_kpi:
     meta_kpi = st.number_input(
         "Meta do KPI (%)",
-        value=file_state.get("meta_kpi", float(meta_sugerida)),
+        value=metas_arquivo.get(kpi_col, float(meta_sugerida)),
         step=0.1,
-        key=f"meta_{st.session_state.active_file}"
+        key=f"meta_{st.session_state.active_file}_{kpi_col}"
     )
 
 else:
-    is_percent_kpi = False
-
     meta_kpi = st.number_input(
         "Meta do KPI (valor)",
-        value=file_state.get("meta_kpi", float(meta_sugerida)),
+        value=metas_arquivo.get(kpi_col, float(meta_sugerida)),
         step=max(1.0, meta_sugerida * 0.05),
-        key=f"meta_{st.session_state.active_file}"
+        key=f"meta_{st.session_state.active_file}_{kpi_col}"
     )
 
-file_state["meta_kpi"] = meta_kpi
-
-
-
-# =========================
-# Normalização do KPI
-# =========================
-current_df[kpi_col] = to_number(current_df[kpi_col])
-
-# =========================
-# Meta sugerida automática
-# =========================
-
-valid_values = current_df[kpi_col].dropna()
-
-if is_recovery:
-    meta_sugerida = valid_values.max() if not valid_values.empty else 0.0
-else:
-    meta_sugerida = valid_values.mean() if not valid_values.empty else 0.0
-
+metas_arquivo[kpi_col] = meta_kpi
 
-vals = current_df[kpi_col].dropna()
-
-if is_percent_kpi and len(vals) > 0:
-    # Se a maioria dos valores estiver entre 0 e 1, assume fração
-    frac_ratio = ((vals >= 0) & (vals <= 1)).mean()
-
-    if frac_ratio >= 0.7:
-        current_df[kpi_col] = current_df[kpi_col] * 100
-        st.info("🔎 KPI percentual detectado como fração (0.x). Convertido para escala % (0–100).")
+if kpi_convertido:
+    st.info("🔎 KPI percentual detectado como fração (0.x). Convertido para escala % (0–100).")
 
 # =========================
-# Status do KPI
+# Tratamento de tempo (robusto)
 # =========================
-current_df["Status KPI"] = current_df[kpi_col].apply(
-    lambda x: calcular_status(x, meta_kpi, kpi_rule)
-)
-
-# ===============================
-# Blindagem: nomes de colunas únicos
-# ===============================
-current_df.columns = (
-    current_df.columns
-    .astype(str)
-    .str.strip()
-)
-
-if current_df.columns.duplicated().any():
-    dup_cols = current_df.columns[current_df.columns.duplicated()].tolist()
-    st.error(f"❌ Colunas duplicadas detectadas: {dup_cols}")
-    st.stop()
+datas = None
+if time_col != "Nenhuma" and time_col in current_df.columns:
+    datas = etapa_tempo(chave_df, time_col, current_df)
 
+chart_df = etapa_serie(chave_df, kpi_col, time_col, is_percent_kpi, kpi_serie, datas)
 
 # =========================
-# Tratamento de tempo (robusto)
+# Status do KPI e métricas
 # =========================
-if time_col != "Nenhuma" and time_col in current_df.columns:
-
-    # Remove números puros que viram epoch (1970)
-    current_df[time_col] = current_df[time_col].apply(
-    lambda x: np.nan if str(x).strip().isdigit() else x
+status_serie, fora_meta = etapa_status(
+    chave_df, kpi_col, is_percent_kpi, meta_kpi, kpi_rule, kpi_serie
 )
-# Conversão para datetime
-    current_df[time_col] = pd.to_datetime(
-    current_df[time_col],
-    errors="coerce",
-    dayfirst=True
-)
-
-
-    # Tentativa 2: formato mês/ano em português (ex: fev/25)
-    if current_df[time_col].isna().all():
-
-        meses = {
-            "jan": "01", "fev": "02", "mar": "03", "abr": "04",
-            "mai": "05", "jun": "06", "jul": "07", "ago": "08",
-            "set": "09", "out": "10", "nov": "11", "dez": "12"
-        }
-
-        def parse_mes_ano(val):
-            if pd.isna(val):
-                return pd.NaT
-            s = str(val).lower().strip()
-            for m, num in meses.items():
-                if s.startswith(m):
-                    return pd.to_datetime(f"20{s[-2:]}-{num}-01", errors="coerce")
-            return pd.NaT
-
-        current_df[time_col] = current_df[time_col].apply(parse_mes_ano)
 
-# Ordenação segura
-if time_col != "Nenhuma":
-    chart_df = (
-    current_df
-    .dropna(subset=[time_col])
-    .loc[current_df[time_col] >= pd.Timestamp("2000-01-01")]
-    .sort_values(time_col)
+agregados = etapa_agregados(
+    chave_df, kpi_col, time_col, is_percent_kpi, kpi_serie, datas, chart_df
 )
+total = agregados["total"]
+valid_kpi = agregados["valid_kpi"]
+invalid_kpi = agregados["invalid_kpi"]
+confiabilidade = agregados["confiabilidade"]
+media_kpi = agregados["media"]
+minimo = agregados["minimo"]
+
+# Atual, operacional e tendência saem das janelas móveis: trocar o tamanho
+# de uma janela não relê a série
+estado_janelas = etapa_janelas(chave_df, kpi_col, time_col, is_percent_kpi, chart_df)
+moveis = estatisticas_moveis(estado_janelas, janelas_kpi)
+codigo_status = status_serie.iloc[-1]
+
+tem_grafico = datas is not None and chart_df[time_col].notna().sum() > 0
+
+# Rollups por período: gráficos e cards leem da granularidade escolhida
+granularidade = REGISTROS
+periodos = None
+if datas is not None:
+    rollups, serie_mensal = etapa_rollups(
+        chave_df, kpi_col, time_col, is_percent_kpi, kpi_serie, datas
+    )
+    periodos_por_granularidade = etapa_fora_periodo(
+        chave_df, kpi_col, time_col, is_percent_kpi, meta_kpi, kpi_rule, rollups, status_serie
+    )
 
+    opcoes_granularidade = [REGISTROS] + GRANULARIDADES
+    granularidade = st.selectbox(
+        "Granularidade dos gráficos e cards",
+        opcoes_granularidade,
+        index=opcoes_granularidade.index("Mês" if serie_mensal else REGISTROS)
+    )
+    # Registros: barras por mês; linha e cards usam cada registro
+    periodos = periodos_por_granularidade["Mês" if granularidade == REGISTROS else granularidade]
+
+    if granularidade != REGISTROS:
+        moveis = cards_por_periodo(periodos, meta_kpi, kpi_rule, janelas_kpi)
+        codigo_status = moveis["status"]
+
+kpi_atual = moveis["ultimo"]
+kpi_operacional = moveis["media_movel"]
+tendencia = moveis["tendencia"]
+
+# Números por segmento: um groupby vetorizado; a meta só refaz a contagem
+resumo_segmentos = None
+if seg_col != "Nenhum":
+    segmentado = etapa_segmentos(
+        chave_df, kpi_col, time_col, is_percent_kpi, seg_col, janelas_kpi, kpi_serie, datas, current_df[seg_col]
+    )
+    resumo_segmentos = etapa_fora_segmento(
+        chave_df, kpi_col, time_col, is_percent_kpi, seg_col, meta_kpi, kpi_rule, segmentado, status_serie
+    )
 
-else:
-    chart_df = current_df.copy()
+fig = fig_bar = None
+if tem_grafico:
+    # Zoom vale só para a mesma planilha/coluna de tempo em que foi feito
+    zoom = st.session_state.get("zoom_kpi")
+    janela = zoom["janela"] if zoom and zoom["origem"] == (chave_df, time_col) else None
+    fig = etapa_grafico_linha(
+        chave_df, kpi_col, time_col, is_percent_kpi, meta_kpi, janela, granularidade, chart_df, periodos
+    )
+if datas is not None:
+    fig_bar = etapa_grafico_barras(
+        chave_df, kpi_col, time_col, is_percent_kpi, meta_kpi, kpi_rule,
+        "Mês" if granularidade == REGISTROS else granularidade, periodos
+    )
 
 # =========================
 # Diagnóstico dos dados
 # =========================
 st.subheader("🧪 Diagnóstico dos dados")
 
-total = len(current_df)
-valid_kpi = current_df[kpi_col].notna().sum()
-invalid_kpi = total - valid_kpi
-
-# Confiabilidade do dado
-confiabilidade = valid_kpi / total if total > 0 else 0
-
 with st.expander("🧪 Diagnóstico técnico dos dados", expanded=False):
 
     st.info(f"📊 KPI válido: {valid_kpi} de {total} registros")
@@ -502,47 +1729,71 @@ with st.expander("🧪 Diagnóstico técnico dos dados", expanded=False):
             f"⚠️ {invalid_kpi} registros do KPI foram ignorados por dados inválidos"
         )
 
+    for regra, qtd in linhas_removidas.items():
+        if qtd > 0:
+            st.caption(f"🧹 {qtd} linhas removidas: {regra}")
+
+    leitura = bruto_df.attrs.get("leitura")
+    if leitura:
+        detalhes = []
+        if "encoding" in leitura:
+            detalhes.append(f"encoding {leitura['encoding']}")
+        if "sep" in leitura:
+            detalhes.append(f"separador '{leitura['sep']}', decimal '{leitura['decimal']}'")
+        if "blocos" in leitura:
+            detalhes.append(f"{leitura['blocos']} blocos")
+
+        st.caption(
+            f"📥 Lido com motor {leitura['motor']}"
+            + (f" ({', '.join(detalhes)})" if detalhes else "")
+            + " · leituras no processo: "
+            + ", ".join(f"{motor} {qtd}" for motor, qtd in CONTADORES_LEITURA.items())
+        )
+
+    stats_cache = cache_ingestao().estatisticas()
+    st.caption(
+        f"🗄️ Cache de ingestão: {stats_cache['hits']} hits, "
+        f"{stats_cache['hits_disco']} hits em disco, {stats_cache['misses']} misses, "
+        f"{stats_cache['despejos']} despejos · "
+        f"{stats_cache['bytes'] / 1024**2:.1f} de {stats_cache['max_bytes'] / 1024**2:.0f} MB · "
+        f"{stats_cache['em_uso']} planilhas em uso, {stats_cache['compartilhados']} compartilhadas entre sessões"
+    )
+
+    # Memória de cada planilha: como foi lida x tipos compactos
+    memoria = []
+    for nome, bytes_memoria in st.session_state.files_data.memoria().items():
+        memoria.append({
+            "Planilha": nome,
+            "Antes (MB)": round(bytes_memoria["antes"] / 1024**2, 2),
+            "Depois (MB)": round(bytes_memoria["depois"] / 1024**2, 2),
+            "Redução": f"{1 - bytes_memoria['depois'] / max(bytes_memoria['antes'], 1):.0%}",
+        })
+
+    if memoria:
+        st.caption("💾 Memória por planilha (texto lido → tipos compactos)")
+        st.dataframe(pd.DataFrame(memoria), hide_index=True, use_container_width=True)
+
+    uso_sessao = st.session_state.files_data.estatisticas()
+    uso_processo = PlanilhasSessao.uso_processo()
+    st.caption(
+        f"🧠 Sessão: {uso_sessao['bytes'] / 1024**2:.1f} de {uso_sessao['max_bytes'] / 1024**2:.0f} MB "
+        f"({uso_sessao['residentes']} de {uso_sessao['planilhas']} planilhas em memória, "
+        f"{uso_sessao['despejos']} despejos, {uso_sessao['recargas']} recargas) · "
+        f"processo: {uso_processo['bytes'] / 1024**2:.1f} de "
+        f"{st.session_state.files_data.max_bytes_processo / 1024**2:.0f} MB em {uso_processo['sessoes']} sessões"
+    )
+
+    # Preenchido no fim da página, depois da última etapa (tabela)
+    painel_etapas = st.empty()
+
 if time_col != "Nenhuma":
-    valid_dates = current_df[time_col].notna().sum()
+    valid_dates = agregados["valid_dates"]
 
     if valid_dates == 0:
         st.warning("⚠️ Nenhuma data válida detectada. Gráfico temporal desativado.")
     else:
         st.info(f"📅 Datas válidas: {valid_dates} de {total}")
 
-# =========================
-# Métricas principais
-# =========================
-# KPI Atual correto (último valor válido)
-serie_valida = chart_df.dropna(subset=[kpi_col])
-
-if time_col != "Nenhuma" and time_col in chart_df.columns:
-    serie_valida = chart_df.dropna(subset=[kpi_col, time_col]).sort_values(time_col)
-
-kpi_atual = serie_valida[kpi_col].iloc[-1] if not serie_valida.empty else np.nan
-
-ultimos_validos = serie_valida[kpi_col].tail(5)
-
-kpi_operacional = (
-    ultimos_validos.mean()
-    if len(ultimos_validos) >= 3
-    else np.nan
-)
-
-media_kpi = chart_df[kpi_col].mean()
-minimo = chart_df[kpi_col].min()
-fora_meta = (current_df["Status KPI"] == "🔴 Fora da meta").sum()
-
-# Tendência
-tendencia = "→ Estável"
-if len(chart_df[kpi_col].dropna()) >= 6:
-    recente = chart_df[kpi_col].dropna().tail(3).mean()
-    anterior = chart_df[kpi_col].dropna().iloc[:-3].tail(3).mean()
-    if recente > anterior:
-        tendencia = "↑ Melhorando"
-    elif recente < anterior:
-        tendencia = "↓ Piorando"
-
 # =========================
 # Visão Executiva
 # =========================
@@ -550,12 +1801,9 @@ section("Visão Executiva", "📌")
 
 c1, c2, c3, c4 = st.columns(4)
 
-# Cor por status
-status_color = "green" if "Dentro" in current_df["Status KPI"].iloc[-1] else "red"
-
-# Cor por status
-status = current_df["Status KPI"].iloc[-1]
-status_color = "green" if "Dentro" in status else "red"
+# Cor por status (último registro, ou último período do rollup)
+status = ROTULOS_STATUS[codigo_status]
+status_color = "green" if codigo_status == DENTRO_META else "red"
 
 # Cor por tendência
 if "↑" in tendencia:
@@ -623,109 +1871,179 @@ c2.metric("Média", format_kpi(media_kpi, is_percent_kpi))
 c3.metric("Mínimo", format_kpi(minimo, is_percent_kpi))
 c4.metric("Registros fora da meta", fora_meta)
 
-# =========================
-# Preparação para exibição (display)
-# =========================
-display_df = current_df.copy()
-
-if time_col != "Nenhuma" and time_col in display_df.columns:
-    display_df[time_col] = display_df[time_col].dt.strftime("%Y-%m-%d")
+passo = "registro" if granularidade == REGISTROS else granularidade.lower()
+m1, m2, m3 = st.columns(3)
+m1.metric(f"KPI operacional (últimos {janelas_kpi['operacional']})", format_kpi(kpi_operacional, is_percent_kpi))
+m2.metric(f"EWMA (span {janelas_kpi['ewma']})", format_kpi(moveis["ewma"], is_percent_kpi))
+m3.metric(
+    f"Inclinação (últimos {janelas_kpi['inclinacao']})",
+    "—" if pd.isna(moveis["inclinacao"]) else f"{moveis['inclinacao']:+.3f} por {passo}"
+)
+st.caption(f"📐 Janelas contadas em valores válidos por {passo}, do mais recente para trás.")
 
+if time_col != "Nenhuma":
     st.subheader("📄 Dados utilizados na análise")
 st.caption("Somente registros válidos foram considerados nos cálculos.")
 
 # =========================
-# Tabela
-# =========================
-section("Dados Consolidados", "📄")
-
-
-# Colunas opcionais (texto / observações)
-optional_cols = ["Para lembrar:", "observações", "Observações"]
-
-df_table = current_df.copy()
-
-# =========================
-# Ajuste de exibição numérica (auditoria)
+# KPI por segmento
 # =========================
-numeric_cols = df_table.select_dtypes(include=["number"]).columns
+if resumo_segmentos is not None:
+    section(f"KPI por {seg_col}", "🏭")
+    st.caption(
+        f"{len(resumo_segmentos)} segmentos, do que tem mais registros fora da meta "
+        "para o que tem menos · clique no cabeçalho para reordenar"
+    )
+    st.dataframe(
+        resumo_segmentos
+        .assign(Confiabilidade=resumo_segmentos["Confiabilidade"] * 100)
+        .sort_values("Fora da meta", ascending=False),
+        use_container_width=True,
+        column_config={
+            **{
+                col: st.column_config.NumberColumn(format="%.2f")
+                for col in ["KPI atual", "KPI operacional", "Média"]
+            },
+            "Confiabilidade": st.column_config.NumberColumn(format="%.0f%%"),
+        }
+    )
 
-for col in numeric_cols:
-    df_table[col] = df_table[col].round(0)
+    fig_segmentos = etapa_graficos_segmento(
+        chave_df, kpi_col, time_col, is_percent_kpi, seg_col, meta_kpi, kpi_rule,
+        segmentado, resumo_segmentos, kpi_serie, datas
+    )
+    if fig_segmentos is not None:
+        if len(resumo_segmentos) > MULTIPLOS_SEGMENTOS:
+            st.caption(f"📈 Gráficos dos {MULTIPLOS_SEGMENTOS} segmentos com mais registros fora da meta")
+        with Medicao("gráficos por segmento (st.plotly_chart)"):
+            st.plotly_chart(fig_segmentos, use_container_width=True)
 
 # =========================
-# Remove colunas opcionais sem conteúdo
+# Tabela
 # =========================
-for col in optional_cols:
-    if col in df_table.columns:
-        if df_table[col].isna().all():
-            df_table = df_table.drop(columns=[col])
+section("Dados Consolidados", "📄")
 
+# Colunas opcionais (texto / observações) sem conteúdo não aparecem
+optional_cols = ["Para lembrar:", "observações", "Observações"]
+colunas_tabela = [
+    c for c in current_df.columns
+    if not (c in optional_cols and current_df[c].isna().all())
+]
+if "Status KPI" not in colunas_tabela:
+    colunas_tabela.append("Status KPI")
 
-st.dataframe(
-    df_table,
-    use_container_width=True
-)
+# Filtros e ordenação rodam no servidor; o navegador recebe só uma página
+f1, f2, f3 = st.columns(3)
 
-# =========================
-# Gráfico
-# =========================
-if (
-    time_col != "Nenhuma"
-    and time_col in chart_df.columns
-    and chart_df[time_col].notna().sum() > 0
-):
-    section("Evolução do KPI", "📈")
-
-    plot_df = (
-    chart_df[[time_col, kpi_col]]
-    .dropna(subset=[time_col, kpi_col])
-    .sort_values(time_col)
-    .set_index(time_col)
+status_sel = f1.multiselect("Status", ROTULOS_STATUS, default=ROTULOS_STATUS, key="tabela_status")
+filtro_status = (
+    None if len(status_sel) == len(ROTULOS_STATUS)
+    else tuple(ROTULOS_STATUS.index(r) for r in status_sel)
 )
 
-    last_year = plot_df.index.max().year
-
-    full_range = pd.date_range(
-    start=plot_df.index.min(),
-    end=pd.Timestamp(year=last_year, month=12, day=1),
-    freq="MS"
+filtro_periodo = None
+if datas is not None and agregados["valid_dates"] > 0:
+    primeira, ultima = datas.min().date(), datas.max().date()
+    periodo = f2.date_input(
+        "Período", value=(primeira, ultima), min_value=primeira, max_value=ultima, key="tabela_periodo"
+    )
+    if len(periodo) == 2 and tuple(periodo) != (primeira, ultima):
+        filtro_periodo = tuple(periodo)
+
+filtro_faixa = None
+finitos = kpi_serie[np.isfinite(kpi_serie)]
+if not finitos.empty and finitos.min() < finitos.max():
+    menor, maior = float(finitos.min()), float(finitos.max())
+    faixa = f3.slider("Valor do KPI", menor, maior, (menor, maior), key="tabela_faixa")
+    if faixa != (menor, maior):
+        filtro_faixa = faixa
+
+o1, o2, o3, o4 = st.columns(4)
+ordenar_por = o1.selectbox("Ordenar por", ["(ordem original)"] + colunas_tabela, key="tabela_ordem")
+crescente = o2.radio("Ordem", ["Crescente", "Decrescente"], horizontal=True, key="tabela_sentido") == "Crescente"
+tamanho_pagina = o3.selectbox("Linhas por página", [50, 100, 500, 1000], index=1, key="tabela_tamanho")
+
+posicoes = etapa_tabela(
+    chave_df, kpi_col, time_col, is_percent_kpi, meta_kpi, kpi_rule,
+    (filtro_status, filtro_periodo, filtro_faixa),
+    (None if ordenar_por == "(ordem original)" else ordenar_por, crescente),
+    current_df, kpi_serie, datas, status_serie
 )
 
-    plot_df = plot_df.reindex(full_range)
+total_paginas = max(1, -(-len(posicoes) // tamanho_pagina))
+pagina = o4.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1, key="tabela_pagina")
+pagina = min(pagina, total_paginas)
+inicio = (pagina - 1) * tamanho_pagina
+visiveis = posicoes[inicio:inicio + tamanho_pagina]
 
-
-    if not plot_df.empty:
-        fig = px.line(
-        plot_df,
-    x=plot_df.index,
-    y=kpi_col,
-    markers=True,
-    title="Evolução do KPI ao longo do tempo"
+df_table = pagina_tabela(
+    current_df, visiveis, colunas_tabela, kpi_col, time_col, kpi_serie, datas, status_serie
 )
 
-#  eixo mensal correto (SEM datas fantasmas)
-        fig.update_xaxes(
-    type="date",
-    tickformat="%b/%Y",
-    dtick="M1",
-    ticklabelmode="period",
-    range=[
-        plot_df.index.min(),
-        plot_df.index.max()
-    ]
+# Ajuste de exibição numérica (auditoria): arredondamento só na formatação
+with Medicao("tabela (st.dataframe)", len(df_table)):
+    st.dataframe(
+        df_table,
+        use_container_width=True,
+        column_config={
+            col: st.column_config.NumberColumn(format="%.0f")
+            for col in df_table.select_dtypes(include=["number"]).columns
+        }
+    )
+st.caption(
+    f"Linhas {inicio + 1 if len(visiveis) else 0}–{inicio + len(visiveis)} de {len(posicoes)} "
+    f"filtradas ({total} no total)"
 )
 
+# Quais etapas rodaram nesta interação e quais vieram do cache
+recalculadas = st.session_state.etapas_recalculadas
+contagem = st.session_state.setdefault("etapas_contagem", {"cache": 0, "recalculadas": 0})
+contagem["recalculadas"] += len(recalculadas)
+contagem["cache"] += len(ETAPAS) - len(recalculadas)
 
-        fig.add_hline(
-    y=meta_kpi,
-    line_dash="dash",
-    line_color="red",
-    annotation_text="Meta",
-    annotation_position="top right"
+painel_etapas.caption(
+    "⚙️ Etapas recalculadas nesta interação: "
+    + (", ".join(e for e in ETAPAS if e in recalculadas) or "nenhuma")
+    + f" · sessão: {contagem['cache']} do cache, {contagem['recalculadas']} recalculadas"
 )
 
-        st.plotly_chart(fig, use_container_width=True)
+# =========================
+# Gráfico
+# =========================
+if tem_grafico:
+    section("Evolução do KPI", "📈")
+
+    if fig is not None:
+        fig, pontos_exibidos, pontos_total = fig
+        versao = st.session_state.get("zoom_versao", 0)
+
+        # Plotly no Streamlit não avisa o servidor sobre zoom; a seleção em
+        # caixa faz esse papel e refaz a consulta com mais resolução no trecho
+        with Medicao("gráfico de linha (st.plotly_chart)", pontos_exibidos):
+            evento = st.plotly_chart(
+                fig,
+                use_container_width=True,
+                on_select="rerun",
+                selection_mode="box",
+                key=f"grafico_kpi_{versao}"
+            )
+        caixas = evento.selection.get("box", []) if evento else []
+        if caixas and caixas[0].get("x"):
+            x0, x1 = sorted(pd.to_datetime(caixas[0]["x"][:2]))
+            if (x0, x1) != janela:
+                st.session_state.zoom_kpi = {"origem": (chave_df, time_col), "janela": (x0, x1)}
+                st.session_state.zoom_versao = versao + 1
+                st.rerun()
+
+        z1, z2 = st.columns([4, 1])
+        if pontos_exibidos < pontos_total:
+            z1.caption(
+                f"📉 {pontos_exibidos} de {pontos_total} pontos exibidos "
+                f"({METODO_REDUCAO}); selecione um trecho para ver mais detalhe"
+            )
+        if janela is not None and z2.button("🔍 Período completo"):
+            st.session_state.zoom_kpi = None
+            st.rerun()
 
     else:
         st.info("ℹ️ Dados insuficientes para gerar gráfico temporal.")
@@ -733,70 +2051,11 @@ if (
         section("Comparação do KPI por Período", "📊")
         
 
-# Preparar dados (últimos N meses)
-bar_df = (
-    chart_df[[time_col, kpi_col]]
-    .dropna(subset=[time_col, kpi_col])
-    .sort_values(time_col)
-    .tail(6)  # últimos 6 períodos
-)
-
-if kpi_rule == "Maior é melhor":
-    bar_df["Status"] = bar_df[kpi_col].apply(
-        lambda x: "Dentro da meta" if x >= meta_kpi else "Fora da meta"
-    )
-else:  # Menor é melhor (recovery, perdas, defeitos)
-    bar_df["Status"] = bar_df[kpi_col].apply(
-        lambda x: "Dentro da meta" if x <= meta_kpi else "Fora da meta"
-    )
-
-
-if not bar_df.empty:
-
-    fig_bar = px.bar(
-        bar_df,
-        x=time_col,
-        y=kpi_col,
-        color="Status",
-        color_discrete_map={
-            "Dentro da meta": "#4CAF50",
-            "Fora da meta": "#F44336"
-        },
-        template="plotly_dark",
-        text_auto=".2f"
-    )
-
-    fig_bar.update_traces(
-        customdata=bar_df[["Status"]].values,
-        hovertemplate=
-            "<b>Período:</b> %{x}<br>"
-            "<b>KPI:</b> %{y:.2f}<br>"
-            f"<b>Meta:</b> {meta_kpi:.2f}<br>"
-            "<b>Status:</b> %{customdata[0]}"
-            "<extra></extra>"
-    )
-
-    fig_bar.add_hline(
-        y=meta_kpi,
-        line_dash="dash",
-        line_color="red",
-        annotation_text="Meta",
-        annotation_position="top right"
-    )
-
-    fig_bar.update_layout(
-        title="KPI por período (comparação direta)",
-        title_x=0.5,
-        yaxis_title="Valor do KPI",
-        xaxis_title="Período",
-        margin=dict(l=20, r=20, t=60, b=20)
-    )
-
-    st.plotly_chart(fig_bar, use_container_width=True)
+if fig_bar is not None:
+    with Medicao("gráfico de barras (st.plotly_chart)"):
+        st.plotly_chart(fig_bar, use_container_width=True)
 
 else:
     st.info("📉 Dados insuficientes para exibir gráfico de colunas.")
 
-
-
-
+mostrar_desempenho(painel_desempenho)
@@ -0,0 +1,149 @@
+"""Calcula os resumos de KPI de uma pasta de planilhas, sem abrir o dashboard.
+
+Uso:
+    python batch.py exportacoes/ --saida resumos/ --formato parquet
+
+Cada arquivo vira um resumo por aba e por coluna de KPI, com os mesmos
+números do dashboard (KPI atual, operacional, média, mínimo, tendência,
+confiabilidade, registros fora da meta). Não importa Streamlit nem Plotly.
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from ingestion import ler_upload, listar_abas
+from kpi_engine import carregar_metas, colunas_kpi, colunas_tempo, limpar_planilha, resumo_kpi
+
+EXTENSOES = (".csv", ".xlsx", ".xls")
+
+
+def resumir_planilha(df, opcoes): # Resumo de cada KPI de uma aba já lida
+    df, linhas_removidas, dup_cols = limpar_planilha(df)
+    if dup_cols:
+        raise ValueError(f"colunas duplicadas: {dup_cols}")
+
+    if opcoes["tempo"]:
+        time_col = opcoes["tempo"] if opcoes["tempo"] in df.columns else None
+    else:
+        time_col = next(iter(colunas_tempo(df.columns)), None)
+
+    kpis = [c for c in opcoes["kpis"] if c in df.columns] if opcoes["kpis"] else colunas_kpi(df, time_col)
+
+    # O arquivo de metas vale por coluna; as opções da linha de comando, para o resto
+    config = {c: opcoes["metas"].get(c, {}) for c in kpis}
+    return [
+        {
+            **resumo_kpi(
+                df,
+                kpi_col,
+                time_col,
+                is_percent=config[kpi_col].get("percentual", opcoes["unidade"] == "percentual"),
+                meta=config[kpi_col].get("meta", opcoes["meta"]),
+                regra=config[kpi_col].get("regra", opcoes["regra"]),
+            ),
+            "linhas_removidas": sum(linhas_removidas.values()),
+        }
+        for kpi_col in kpis
+    ]
+
+
+def colunas_lidas(opcoes): # Com --kpi, só as colunas que o resumo usa (None: todas)
+    if not opcoes["kpis"]:
+        return None
+    if opcoes["tempo"]:
+        return [*opcoes["kpis"], opcoes["tempo"]]
+    # Sem --tempo a coluna de tempo sai do nome: lê também as candidatas
+    kpis = set(opcoes["kpis"])
+    return lambda nome: nome in kpis or bool(colunas_tempo([nome]))
+
+
+def resumir_arquivo(caminho, opcoes): # Uma tarefa do pool: lê todas as abas, resume e grava
+    nome = os.path.basename(caminho)
+
+    # CSVs grandes seguem o mesmo corte do dashboard para a leitura em blocos
+    em_blocos = (
+        nome.lower().endswith(".csv")
+        and os.path.getsize(caminho) > opcoes["blocos_mb"] * 1024**2
+    )
+
+    resumos = []
+    with open(caminho, "rb") as f:
+        dados = f if em_blocos else f.read()
+        abas = [None] if em_blocos else listar_abas(nome, dados)
+
+        for aba in abas:
+            base = {"arquivo": nome, "aba": aba}
+            try:
+                df = ler_upload(nome, dados, aba, em_blocos, colunas=colunas_lidas(opcoes))
+                resumos += [{**base, **r} for r in resumir_planilha(df, opcoes)]
+            except Exception as erro:
+                resumos.append({**base, "erro": str(erro)})
+
+    tabela = pd.DataFrame(resumos)
+    destino = os.path.join(opcoes["saida"], f"{nome}.{opcoes['formato']}")
+    if opcoes["formato"] == "parquet":
+        tabela.to_parquet(destino, index=False)
+    else:
+        tabela.to_json(destino, orient="records", force_ascii=False, indent=2)
+    return destino, len(resumos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pasta", help="pasta com arquivos .csv, .xlsx ou .xls")
+    parser.add_argument("--saida", default="resumos", help="pasta dos resumos (padrão: resumos)")
+    parser.add_argument("--formato", choices=["json", "parquet"], default="json")
+    parser.add_argument("--kpi", nargs="+", help="colunas de KPI (padrão: todas as numéricas)")
+    parser.add_argument("--tempo", help="coluna de tempo (padrão: primeira com data/mês no nome)")
+    parser.add_argument("--meta", type=float, help="meta do KPI (padrão: meta sugerida)")
+    parser.add_argument("--regra", choices=["Maior é melhor", "Menor é melhor"], help="padrão: pelo nome da coluna")
+    parser.add_argument("--unidade", choices=["percentual", "absoluto"], default="percentual")
+    parser.add_argument(
+        "--metas", default=os.environ.get("KPI_METAS", "metas_kpi.json"),
+        help="JSON com meta/regra por coluna (padrão: metas_kpi.json, se existir)"
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.environ.get("KPI_WORKERS", os.cpu_count() or 1))
+    )
+    args = parser.parse_args()
+
+    arquivos = sorted(
+        os.path.join(args.pasta, nome)
+        for nome in os.listdir(args.pasta)
+        if nome.lower().endswith(EXTENSOES)
+    )
+    os.makedirs(args.saida, exist_ok=True)
+
+    opcoes = {
+        "saida": args.saida,
+        "formato": args.formato,
+        "kpis": args.kpi,
+        "tempo": args.tempo,
+        "meta": args.meta,
+        "regra": args.regra,
+        "unidade": args.unidade,
+        "metas": carregar_metas(args.metas),
+        "blocos_mb": int(os.environ.get("KPI_CSV_BLOCOS_MB", "100")),
+    }
+
+    falhas = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futuros = {executor.submit(resumir_arquivo, c, opcoes): c for c in arquivos}
+        for i, futuro in enumerate(as_completed(futuros), start=1):
+            try:
+                destino, qtd = futuro.result()
+                print(f"[{i}/{len(arquivos)}] {destino} ({qtd} resumos)")
+            except Exception as erro:
+                falhas += 1
+                print(f"[{i}/{len(arquivos)}] ❌ {futuros[futuro]}: {erro}", file=sys.stderr)
+
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Compara a leitura de Excel atual com os leitores de ingestion.py.
+
+Uso:
+    python benchmarks/bench_excel.py --linhas 10000 100000 500000
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import LEITORES_EXCEL, ler_excel  # noqa: E402
+
+
+def gerar_planilha(linhas, seed=0): # Planilha parecida com as exportações de linha
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Data": pd.date_range("2024-01-01", periods=linhas, freq="min"),
+        "OEE (%)": rng.uniform(0.5, 1.0, linhas).round(4),
+        "Turno": rng.choice(["A", "B", "C"], linhas),
+        "Linha": rng.choice([f"L{i}" for i in range(8)], linhas),
+        "Produzido": rng.integers(0, 500, linhas),
+        "Observações": rng.choice(["", "ok", "erro", "parada"], linhas),
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def cronometrar(funcao): # Tempo de parede de uma chamada, em segundos
+    inicio = time.perf_counter()
+    funcao()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    resultados = []
+    for linhas in args.linhas:
+        dados = gerar_planilha(linhas)
+
+        casos = {"pd.read_excel (atual)": lambda: pd.read_excel(io.BytesIO(dados))}
+        for motor, disponivel in LEITORES_EXCEL.items():
+            if disponivel:
+                casos[f"ler_excel[{motor}]"] = lambda m=motor: ler_excel(dados, motor=m)
+                casos[f"ler_excel[{motor}] 2 colunas"] = lambda m=motor: ler_excel(
+                    dados, colunas=["Data", "OEE (%)"], motor=m
+                )
+
+        for caso, funcao in casos.items():
+            segundos = cronometrar(funcao)
+            resultados.append({"linhas": linhas, "caso": caso, "segundos": round(segundos, 4)})
+            print(f"{linhas:>10,} linhas  {caso:<32} {segundos:8.3f} s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
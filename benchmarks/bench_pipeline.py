@@ -0,0 +1,254 @@
+"""Mede cada etapa do pipeline e o pipeline completo em planilhas sujas.
+
+Uso:
+    python benchmarks/bench_pipeline.py --linhas 10000 100000 1000000 --json base.json
+    python benchmarks/bench_pipeline.py --linhas 10000000 --etapas to_number parsear_datas
+    python benchmarks/bench_pipeline.py --comparar base.json novo.json
+
+As planilhas vêm de `planilha_suja.py` (mesma semente, mesmo arquivo) e
+ficam guardadas em `--dados` para as próximas rodadas. Cada etapa recebe a
+entrada já pronta (ex.: to_number recebe a coluna de texto lida do CSV) e é
+medida `--repeticoes` vezes (vale o menor tempo), mais uma rodada só para o
+pico de memória alocado pela etapa (Python/numpy e Arrow).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ingestion import compactar, ler_csv, ler_excel, ler_planilha, ler_upload  # noqa: E402
+from kpi_engine import (  # noqa: E402
+    calcular_agregados,
+    calcular_rollups,
+    fora_meta_por_periodo,
+    fracao_para_percentual,
+    kpi_por_segmento,
+    limpar_linhas,
+    limpar_planilha,
+    parsear_datas,
+    reduzir_serie,
+    serie_temporal,
+    status_kpi,
+    to_number,
+)
+from planilha_suja import gerar_planilha_suja, para_csv, para_xlsx  # noqa: E402
+
+# O Excel não passa de 1.048.576 linhas; e gerar .xlsx grande demora minutos
+LIMITE_EXCEL = 1_048_575
+
+KPI = "OEE"
+TEMPO = "Data"
+SEGMENTO = "Linha"
+META = 85.0
+REGRA = "Maior é melhor"
+
+
+# =========================
+# Medição
+# =========================
+
+class PicoMemoria:
+    """Pico de memória (em bytes) alocado dentro do bloco `with`.
+
+    O tracemalloc vê o que o Python e o numpy alocam; o que o Arrow aloca
+    (texto do pandas 3, leitura pyarrow) fica no pool dele e é amostrado a
+    cada milissegundo. A memória residente do processo não serve: depois da
+    primeira etapa o alocador reaproveita páginas e o RSS quase não sobe.
+    """
+
+    def __init__(self, intervalo=0.001):
+        self.intervalo = intervalo
+        self.pico = 0
+
+    def __enter__(self):
+        self._arrow_inicio = self._arrow_maximo = _alocado_arrow()
+        self._parar = threading.Event()
+        self._amostrador = threading.Thread(target=self._amostrar, daemon=True)
+        self._amostrador.start()
+        tracemalloc.start()
+        return self
+
+    def _amostrar(self):
+        while not self._parar.is_set():
+            self._arrow_maximo = max(self._arrow_maximo, _alocado_arrow())
+            time.sleep(self.intervalo)
+
+    def __exit__(self, *erro):
+        _, pico_python = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self._parar.set()
+        self._amostrador.join()
+        self._arrow_maximo = max(self._arrow_maximo, _alocado_arrow())
+        self.pico = pico_python + self._arrow_maximo - self._arrow_inicio
+
+
+def _alocado_arrow(): # Bytes alocados agora no pool padrão do Arrow (0 sem pyarrow)
+    return pa.total_allocated_bytes() if pa is not None else 0
+
+
+def medir(funcao, repeticoes): # (menor tempo em s, pico em bytes)
+    # Tempo sem tracemalloc (que deixa o código Python mais lento) e uma
+    # rodada a mais só para a memória
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    with PicoMemoria() as memoria:
+        funcao()
+    return min(tempos), memoria.pico
+
+
+# =========================
+# Dados e etapas
+# =========================
+
+def planilha(linhas, formato, pasta, seed=0): # Bytes da planilha suja, gerada uma vez e guardada
+    caminho = os.path.join(pasta, f"suja_{linhas}_{seed}.{formato}")
+    if not os.path.exists(caminho):
+        os.makedirs(pasta, exist_ok=True)
+        df = gerar_planilha_suja(linhas, seed)
+        dados = para_xlsx(df) if formato == "xlsx" else para_csv(df)
+        with open(caminho + ".tmp", "wb") as f:
+            f.write(dados)
+        os.replace(caminho + ".tmp", caminho)
+    with open(caminho, "rb") as f:
+        return f.read()
+
+
+def analise(df): # Tudo que o dashboard calcula depois da leitura, para um KPI
+    limpo, _, _ = limpar_planilha(df)
+    kpi = limpo[KPI] if limpo[KPI].dtype == "float64" else to_number(limpo[KPI])
+    kpi, _ = fracao_para_percentual(kpi)
+    datas = parsear_datas(limpo[TEMPO])
+    serie = serie_temporal(kpi, datas, KPI, TEMPO)
+    calcular_agregados(kpi, datas, serie, KPI, TEMPO)
+    status = status_kpi(kpi, META, REGRA)
+    fora_meta_por_periodo(calcular_rollups(kpi, datas), status)
+    kpi_por_segmento(kpi, limpo[SEGMENTO], datas)
+    reduzir_serie(serie[TEMPO].to_numpy(), serie[KPI].to_numpy(), 2000)
+
+
+def etapas(linhas, pasta, max_excel): # nome -> função sem argumentos, com as entradas já prontas
+    csv = planilha(linhas, "csv", pasta)
+    bruto = ler_planilha("suja.csv", csv)
+    sem_lixo, _ = limpar_linhas(bruto)
+    lido = ler_upload("suja.csv", csv)
+
+    casos = {
+        "leitura csv": lambda: ler_csv(csv),
+        "limpar_linhas": lambda: limpar_linhas(bruto),
+        "compactar": lambda: compactar(sem_lixo),
+        "to_number": lambda: to_number(sem_lixo[KPI]),
+        "to_number (%)": lambda: to_number(sem_lixo["Disponibilidade (%)"]),
+        "parsear_datas": lambda: parsear_datas(sem_lixo[TEMPO]),
+        "parsear_datas (mês/ano)": lambda: parsear_datas(sem_lixo["Mês"]),
+        "ler_upload csv": lambda: ler_upload("suja.csv", csv),
+        "análise": lambda: analise(lido),
+        "pipeline completo csv": lambda: analise(ler_upload("suja.csv", csv)),
+    }
+
+    if linhas <= min(max_excel, LIMITE_EXCEL):
+        xlsx = planilha(linhas, "xlsx", pasta)
+        casos["leitura xlsx"] = lambda: ler_excel(xlsx)
+        casos["pipeline completo xlsx"] = lambda: analise(ler_upload("suja.xlsx", xlsx))
+
+    return casos
+
+
+# =========================
+# Resultados
+# =========================
+
+def ambiente(): # Commit, versões e máquina, para comparar rodadas
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "maquina": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def comparar(base, novo): # Tempo e pico de cada (linhas, etapa) presente nas duas rodadas
+    antes = {(r["linhas"], r["etapa"]): r for r in base["resultados"]}
+    print(f"base {base['ambiente']['commit']}  →  novo {novo['ambiente']['commit']}")
+    for r in novo["resultados"]:
+        b = antes.get((r["linhas"], r["etapa"]))
+        if b is None:
+            continue
+        razao = r["segundos"] / b["segundos"] if b["segundos"] else float("nan")
+        print(
+            f"{r['linhas']:>10,} linhas  {r['etapa']:<26} "
+            f"{b['segundos']:8.3f} s → {r['segundos']:8.3f} s ({razao:5.2f}x)  "
+            f"pico {b['pico_mb']:8.1f} → {r['pico_mb']:8.1f} MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--etapas", nargs="+", help="só estas etapas (padrão: todas)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--max-excel", type=int, default=100_000, help="maior planilha gerada também em .xlsx")
+    parser.add_argument("--dados", default=os.path.join(tempfile.gettempdir(), "kpi_bench"))
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NOVO"), help="compara dois arquivos --json")
+    args = parser.parse_args()
+
+    if args.comparar:
+        with open(args.comparar[0]) as f, open(args.comparar[1]) as g:
+            comparar(json.load(f), json.load(g))
+        return
+
+    resultados = []
+    for linhas in args.linhas:
+        for etapa, funcao in etapas(linhas, args.dados, args.max_excel).items():
+            if args.etapas and etapa not in args.etapas:
+                continue
+            segundos, pico = medir(funcao, args.repeticoes)
+            resultados.append({
+                "linhas": linhas,
+                "etapa": etapa,
+                "segundos": round(segundos, 4),
+                "pico_mb": round(pico / 1024**2, 1),
+            })
+            print(f"{linhas:>10,} linhas  {etapa:<26} {segundos:8.3f} s  pico {pico / 1024**2:8.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"ambiente": ambiente(), "resultados": resultados}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
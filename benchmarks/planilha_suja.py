@@ -0,0 +1,115 @@
+"""Gera exportações de linha "sujas", como as que chegam ao dashboard.
+
+Uso:
+    python benchmarks/planilha_suja.py --linhas 100000 --saida suja.csv
+    python benchmarks/planilha_suja.py --linhas 100000 --saida suja.xlsx
+
+Cada planilha mistura o que o pipeline precisa tratar: vírgula decimal,
+tokens "erro"/"--"/"-", sufixo "%", OEE em fração (0,853) ao lado de
+disponibilidade em percentual (85,3 %), datas "dd/mm/aaaa hh:mm" com lixo,
+mês no formato "fev/25", colunas sem nome (viram "Unnamed"), linhas vazias
+e rodapé "Para lembrar". A mesma semente gera sempre o mesmo arquivo.
+"""
+
+import argparse
+import io
+
+import numpy as np
+import pandas as pd
+
+MESES = ["jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez"]
+
+# Proporção de células com defeito em cada coluna de KPI
+SUJEIRA = 0.03
+
+RODAPE = [
+    "Para lembrar: meta de OEE 85%",
+    "Para lembrar: paradas acima de 10 min entram em Perdas",
+    "Fonte: exportação MES",
+]
+
+
+def _sujar(valores, rng, tokens, proporcao=SUJEIRA): # Troca uma fração das células por tokens inválidos
+    valores = valores.astype(object)
+    sujos = rng.random(len(valores)) < proporcao
+    valores[sujos] = rng.choice(tokens, int(sujos.sum()))
+    return valores
+
+
+def _com_virgula(numeros, casas): # "0.853" -> "0,853"; cada valor distinto é formatado uma vez
+    inteiros = np.round(numeros * 10**casas).astype(np.int64)
+    unicos, codigos = np.unique(inteiros, return_inverse=True)
+    textos = np.array([f"{u / 10**casas:.{casas}f}".replace(".", ",") for u in unicos], dtype=object)
+    return textos[codigos]
+
+
+def gerar_planilha_suja(linhas, seed=0): # DataFrame só de texto, no formato de uma exportação de linha
+    rng = np.random.default_rng(seed)
+
+    inicio = pd.Timestamp("2024-01-01 06:00")
+    datas = inicio + pd.to_timedelta(np.arange(linhas) * 60, unit="s")
+    # strftime linha a linha é lento em milhões de linhas: dia e hora são
+    # formatados uma vez cada e concatenados
+    codigos_dia, dias = pd.factorize(datas.normalize())
+    textos_dia = dias.strftime("%d/%m/%Y").to_numpy(dtype=object)
+    textos_hora = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)], dtype=object)
+    textos_data = textos_dia[codigos_dia] + " " + textos_hora[datas.hour * 60 + datas.minute]
+
+    # "fev/25": um rótulo por mês do período, espalhado pelos códigos
+    codigos = (datas.year - 2000) * 12 + datas.month - 1
+    rotulos = np.array([f"{MESES[c % 12]}/{c // 12:02d}" for c in range(codigos.max() + 1)], dtype=object)
+
+    oee = _com_virgula(rng.beta(8, 2, linhas), 3)  # fração
+    disponibilidade = _com_virgula(rng.uniform(70, 99.9, linhas), 1)
+    com_espaco = rng.random(linhas) < 0.5
+    disponibilidade = np.where(com_espaco, disponibilidade + " %", disponibilidade + "%")
+
+    df = pd.DataFrame({
+        "Data": _sujar(textos_data, rng, ["erro", "", "--"], 0.005),
+        "Mês": rotulos[codigos],
+        "Linha": rng.choice([f"L{i}" for i in range(1, 9)], linhas).astype(object),
+        "Turno": rng.choice(["A", "B", "C"], linhas).astype(object),
+        "OEE": _sujar(oee, rng, ["erro", "--", "-", "", "texto"]),
+        "Disponibilidade (%)": _sujar(disponibilidade, rng, ["erro", "--", "%", ""]),
+        "Produzido": _sujar(_com_virgula(rng.integers(0, 500, linhas), 0), rng, ["", "-"]),
+        "Perdas (kg)": _sujar(_com_virgula(rng.gamma(2, 3, linhas), 2), rng, ["erro", ""]),
+        "Observações": rng.choice(["", "", "", "ok", "parada programada", "falta de material"], linhas).astype(object),
+    })
+
+    # Colunas sem cabeçalho, vazias (na leitura viram "Unnamed: n")
+    df.insert(4, "", "")
+    df[" "] = ""
+
+    # Linhas vazias espalhadas e rodapé explicativo no fim
+    vazias = rng.choice(linhas, max(1, linhas // 1000), replace=False)
+    df.iloc[vazias, :] = ""
+    rodape = pd.DataFrame([[texto] + [""] * (df.shape[1] - 1) for texto in RODAPE], columns=df.columns)
+    return pd.concat([df, rodape], ignore_index=True)
+
+
+def para_csv(df): # Bytes como um CSV exportado em português (";" e latin-1)
+    return df.to_csv(index=False, sep=";").encode("latin-1")
+
+
+def para_xlsx(df): # Bytes de um .xlsx com todas as células como texto
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saida", required=True, help="arquivo .csv ou .xlsx")
+    args = parser.parse_args()
+
+    df = gerar_planilha_suja(args.linhas, args.seed)
+    dados = para_xlsx(df) if args.saida.lower().endswith(".xlsx") else para_csv(df)
+    with open(args.saida, "wb") as f:
+        f.write(dados)
+    print(f"{args.saida}: {len(df):,} linhas, {len(dados) / 1024**2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1383 @@
+import codecs
+import csv
+import functools
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import as_completed
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from kpi_engine import eh_coluna_numerica, limpar_linhas, limpar_nomes_colunas, parsear_datas, to_number
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# Leitura de planilhas
+# =========================
+
+# Opções de leitura entram na chave do cache: mudou a opção, muda a chave
+OPCOES_CSV = {"sep": None, "engine": "python", "encoding": "latin-1"}
+
+# Versão da normalização feita na leitura (limpeza, tipos, colunas). Entra na
+# chave do cache: subir a versão invalida frames gravados em disco por uma
+# versão anterior do código, que de outro modo continuariam sendo servidos
+VERSAO_LEITURA = 2
+
+# Tamanho da amostra usada para detectar separador, decimal e encoding
+AMOSTRA_CSV = 64 * 1024
+
+MOTOR_RAPIDO = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+# Quantas vezes cada motor de leitura foi usado (contado no processo
+# principal, já que a leitura pode acontecer nos workers)
+CONTADORES_LEITURA = {"pyarrow": 0, "c": 0, "python": 0}
+
+
+def contar_leitura(df): # Registra o motor usado numa leitura nova
+    leitura = df.attrs.get("leitura")
+    if leitura:
+        motor = leitura["motor"]
+        CONTADORES_LEITURA[motor] = CONTADORES_LEITURA.get(motor, 0) + 1
+
+
+def detectar_formato_csv(dados): # Detecta encoding, separador e decimal a partir da amostra
+    amostra = dados[:AMOSTRA_CSV]
+
+    if amostra.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            # final=False: a amostra pode cortar um caractere multibyte no meio
+            codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+
+    texto = amostra.decode(encoding, errors="ignore")
+    if len(dados) >= AMOSTRA_CSV and "\n" in texto:
+        texto = texto[:texto.rindex("\n")]  # descarta a última linha incompleta
+
+    try:
+        sep = csv.Sniffer().sniff(texto, delimiters=";,\t|").delimiter
+    except csv.Error:
+        # Sniffer falha com linhas irregulares ou arquivo de uma coluna só:
+        # usa o delimitador mais frequente do cabeçalho
+        cabecalho = texto.split("\n", 1)[0]
+        sep = max(";,\t|", key=cabecalho.count)
+
+    # Com separador "," a vírgula decimal só existiria entre aspas
+    virgulas = len(re.findall(r"\d,\d", texto)) if sep != "," else 0
+    pontos = len(re.findall(r"\d\.\d", texto))
+    decimal = "," if virgulas > pontos else "."
+
+    return {"encoding": encoding, "sep": sep, "decimal": decimal}
+
+
+# Células que o pd.read_csv lê como vazias (valores padrão de `na_values`)
+NULOS_CSV = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def _filtro_colunas(colunas): # usecols a partir de uma lista de nomes ou de uma função nome -> bool
+    if colunas is None:
+        return None
+    if callable(colunas):
+        return lambda c: colunas(str(c).strip())
+    nomes = set(colunas)
+    return lambda c: str(c).strip() in nomes
+
+
+def _ler_csv_pyarrow(dados, formato, usecols=None): # Todas as colunas como texto, direto no leitor do pyarrow
+    # O motor "pyarrow" do pd.read_csv infere os tipos antes de aplicar
+    # dtype=str ("007" volta como "7"); aqui os tipos já saem como texto
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    # Cabeçalho pelo leitor C: mesmos nomes ("Unnamed: n", "a.1") dos outros motores
+    nomes = pd.read_csv(
+        io.BytesIO(dados), sep=formato["sep"], engine="c", encoding=formato["encoding"], nrows=0
+    ).columns
+    ids = [f"c{i}" for i in range(len(nomes))]
+    lidas = [i for i, nome in zip(ids, nomes) if usecols is None or usecols(nome)]
+    if not lidas:
+        return pd.DataFrame()
+    tabela = pa_csv.read_csv(
+        io.BytesIO(dados),
+        read_options=pa_csv.ReadOptions(column_names=ids, skip_rows=1, encoding=formato["encoding"]),
+        parse_options=pa_csv.ParseOptions(delimiter=formato["sep"]),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={i: pa.string() for i in ids}, include_columns=lidas,
+            strings_can_be_null=True, null_values=NULOS_CSV
+        ),
+    )
+    df = tabela.to_pandas()
+    df.columns = [nome for i, nome in zip(ids, nomes) if i in lidas]
+    return df
+
+
+def ler_csv(dados, colunas=None): # Caminho rápido (pyarrow/C) com fallback para o leitor python
+    usecols = _filtro_colunas(colunas)
+    try:
+        formato = detectar_formato_csv(dados)
+        if MOTOR_RAPIDO == "pyarrow":
+            df = _ler_csv_pyarrow(dados, formato, usecols)
+        else:
+            df = pd.read_csv(
+                io.BytesIO(dados),
+                sep=formato["sep"],
+                engine="c",
+                encoding=formato["encoding"],
+                usecols=usecols,
+                dtype=str
+            )
+        leitura = {"motor": MOTOR_RAPIDO, **formato}
+    except Exception as erro:
+        logger.warning("Leitura rápida de CSV falhou (%s); usando motor python", erro)
+        df = pd.read_csv(io.BytesIO(dados), usecols=usecols, dtype=str, **OPCOES_CSV)
+        leitura = {"motor": "python", "encoding": OPCOES_CSV["encoding"]}
+
+    df.attrs["leitura"] = leitura
+    return df
+
+
+# Linhas lidas por bloco no modo de leitura em blocos (CSVs grandes)
+LINHAS_POR_BLOCO = 200_000
+
+
+# Texto que sobra fica em Arrow (o mesmo "str" padrão do pandas 3); sem
+# pyarrow continua object
+TEXTO_ARROW = (
+    pd.StringDtype("pyarrow", na_value=np.nan)
+    if importlib.util.find_spec("pyarrow")
+    else None
+)
+
+
+# Códigos com zero à esquerda ("007", "0012"): o número perderia o formato
+CODIGO = re.compile(r"\s*-?0\d")
+
+
+def _guardar_como_numero(serie): # True se a coluna de texto vira número sem perder nada
+    # Só quando todo valor preenchido é número: "erro", "--" e afins ficam
+    # guardados como estão (a análise converte com to_number); códigos com
+    # zero à esquerda continuam texto
+    if not eh_coluna_numerica(serie, aceitar_invalidos=False):
+        return False
+    unicos = pd.unique(serie.dropna())
+    return not any(CODIGO.match(str(valor)) for valor in unicos)
+
+
+def _tipo_texto(serie): # Categoria para texto repetitivo, texto Arrow para o resto
+    return "categoria" if serie.nunique() <= len(serie) * 0.5 else "texto"
+
+
+def _tipos_compactos(bloco): # Decide (no primeiro bloco, se em blocos) como cada coluna será guardada
+    tipos = {}
+    for col in bloco.columns:
+        nome = col.lower()
+        if bloco[col].dtype.kind in "iuf":
+            tipos[col] = "numero"
+        elif bloco[col].dtype.kind != "O":
+            tipos[col] = "manter"  # datas, booleanos e categorias já são compactos
+        elif "data" in nome or "mês" in nome or "mes" in nome:
+            tipos[col] = "tempo"
+        elif _guardar_como_numero(bloco[col]):
+            tipos[col] = "numero"
+        else:
+            tipos[col] = _tipo_texto(bloco[col])
+    return tipos
+
+
+def _numero_compacto(serie): # Menor tipo numérico que guarda os valores sem perda
+    if serie.dtype.kind in "iu":
+        return pd.to_numeric(serie, downcast="integer")
+
+    if serie.dtype.kind != "f":
+        serie = to_number(serie)
+    with np.errstate(over="ignore"):
+        reduzida = serie.astype(np.float32)
+    if np.array_equal(reduzida.to_numpy(dtype=np.float64), serie.to_numpy(), equal_nan=True):
+        return reduzida
+    return serie
+
+
+def compactar(df, tipos=None, antes=None): # Converte cada coluna para o tipo mais estreito que cabe
+    """Representação compacta de uma planilha já limpa.
+
+    Números viram float32 quando isso não perde precisão (senão float64),
+    mas só em colunas em que todo valor preenchido é número: com "erro", "--"
+    ou códigos com zero à esquerda ("007") a coluna fica como texto e a
+    análise converte com to_number. Texto repetitivo (turno, linha, máquina)
+    vira categoria, colunas de tempo
+    viram datetime64 quando todos os valores são datas e o resto vira texto
+    Arrow. `attrs["memoria"]` guarda os bytes antes e depois, para o
+    relatório do dashboard.
+    """
+    if antes is None:
+        antes = int(df.memory_usage(deep=True).sum())
+    if tipos is None:
+        tipos = _tipos_compactos(df)
+
+    colunas = {}
+    for col in df.columns:
+        serie = df[col]
+        tipo = tipos.get(col, "manter")
+
+        if tipo == "numero":
+            serie = _numero_compacto(serie)
+        elif tipo == "categoria" and serie.dtype.kind == "O":
+            serie = serie.astype("category")
+        elif tipo == "tempo":
+            # Só converte se nenhuma data se perder; senão o parse fica para a
+            # análise. Compactar é otimização: um erro no parse nunca derruba a leitura
+            try:
+                datas = parsear_datas(serie)
+            except Exception as erro:
+                logger.warning("Datas de %s ficam como texto (%s)", col, erro)
+                datas = None
+            if datas is not None and datas.notna().sum() == serie.notna().sum():
+                serie = datas
+            elif serie.dtype.kind == "O" and _tipo_texto(serie) == "categoria":
+                serie = serie.astype("category")
+            elif serie.dtype.kind == "O" and TEXTO_ARROW is not None:
+                serie = serie.astype(TEXTO_ARROW)
+        elif tipo == "texto" and TEXTO_ARROW is not None:
+            serie = serie.astype(TEXTO_ARROW)
+
+        colunas[col] = serie
+
+    compacto = pd.DataFrame(colunas, index=df.index)
+    compacto.attrs = {
+        **df.attrs,
+        "memoria": {"antes": antes, "depois": int(compacto.memory_usage(deep=True).sum())},
+    }
+    return compacto
+
+
+def ler_csv_em_blocos(arquivo, linhas_por_bloco=LINHAS_POR_BLOCO, progresso=None, colunas=None): # Lê e limpa um CSV bloco a bloco
+    """Leitura em blocos para CSVs grandes.
+
+    Cada bloco passa pela mesma limpeza da leitura normal (nomes de colunas,
+    "Unnamed", regras de linha) e é reduzido na hora: colunas numéricas viram
+    float64 via to_number e texto repetitivo vira categoria; `compactar`
+    termina o serviço no frame final. O frame de texto completo nunca existe
+    em memória, só um bloco por vez mais a saída compacta.
+
+    Os tipos saem do primeiro bloco. Se um bloco seguinte traz texto numa
+    coluna tratada como número ("erro", "--", código com zero à esquerda),
+    a coluna passa a texto e o arquivo é relido do começo, já que os blocos
+    anteriores não têm mais o texto original.
+
+    `progresso`, se dado, é chamado a cada bloco com a fração do arquivo já
+    lida (aproximada: o leitor lê um pouco adiante). `colunas` limita a
+    leitura, como em `ler_upload`.
+
+    Como em `ler_csv`, o formato vem da amostra do início do arquivo; se o
+    motor C falhar em algum ponto (ex.: um "ç" em latin-1 depois da amostra
+    num arquivo que parecia UTF-8), o arquivo é relido do zero com o leitor
+    python em latin-1, também em blocos.
+    """
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell() or 1
+    arquivo.seek(0)
+    amostra = arquivo.read(AMOSTRA_CSV)
+    arquivo.seek(0)
+    formato = detectar_formato_csv(amostra)
+    usecols = _filtro_colunas(colunas)
+
+    try:
+        leitor = functools.partial(
+            pd.read_csv,
+            arquivo,
+            sep=formato["sep"],
+            engine="c",
+            encoding=formato["encoding"],
+            usecols=usecols,
+            dtype=str,
+            chunksize=linhas_por_bloco
+        )
+        leitura = {"motor": "c", **formato}
+        partes, tipos, removidas, antes = _ler_blocos(leitor, arquivo, tamanho, progresso)
+    except TarefaCancelada:
+        raise
+    except Exception as erro:
+        logger.warning("Leitura em blocos com motor C falhou (%s); usando motor python", erro)
+        leitor = functools.partial(
+            pd.read_csv, arquivo, usecols=usecols, dtype=str, chunksize=linhas_por_bloco, **OPCOES_CSV
+        )
+        leitura = {"motor": "python", "encoding": OPCOES_CSV["encoding"]}
+        partes, tipos, removidas, antes = _ler_blocos(leitor, arquivo, tamanho, progresso)
+
+    if not partes:
+        return pd.DataFrame()
+
+    # Categorias diferentes entre blocos virariam object no concat:
+    # alinha todos os blocos às mesmas categorias antes de juntar
+    for col, tipo in tipos.items():
+        if tipo == "categoria":
+            categorias = union_categoricals([p[col] for p in partes]).categories
+            for p in partes:
+                p[col] = p[col].cat.set_categories(categorias)
+
+    df = pd.concat(partes, ignore_index=True)
+
+    df.attrs["leitura"] = {**leitura, "blocos": len(partes)}
+    df.attrs["linhas_removidas"] = removidas
+    return compactar(df, tipos, antes)
+
+
+def _ler_blocos(abrir, arquivo, tamanho, progresso): # Lê o arquivo inteiro em blocos; relê se um tipo mudar
+    tipos = None
+    while True:
+        arquivo.seek(0)
+        # Fechar o leitor pelo `with` devolve o arquivo aberto para a releitura
+        with abrir() as leitor:
+            partes, tipos, removidas, antes, rebaixadas = _reduzir_blocos(leitor, arquivo, tamanho, progresso, tipos)
+        if not rebaixadas:
+            return partes, tipos, removidas, antes
+        logger.info("Colunas %s têm texto depois do primeiro bloco; relendo como texto", rebaixadas)
+
+
+def _reduzir_blocos(leitor, arquivo, tamanho, progresso, tipos): # Limpa e reduz cada bloco do leitor
+    partes = []
+    removidas = {}
+    antes = 0  # bytes que o texto ocuparia, somados bloco a bloco
+
+    for bloco in leitor:
+        bloco.columns = [str(c).strip() for c in bloco.columns]
+        bloco = bloco.loc[:, ~bloco.columns.str.contains("^Unnamed")]
+        bloco, contagem = limpar_linhas(bloco)
+
+        for regra, qtd in contagem.items():
+            removidas[regra] = removidas.get(regra, 0) + qtd
+
+        if tipos is None:
+            tipos = _tipos_compactos(bloco)
+        else:
+            # Coluna numérica até aqui que agora traz texto: passa a texto
+            rebaixadas = [
+                col for col, tipo in tipos.items()
+                if tipo == "numero" and col in bloco and bloco[col].dtype.kind == "O"
+                and bloco[col].notna().any() and not _guardar_como_numero(bloco[col])
+            ]
+            if rebaixadas:
+                tipos = {**tipos, **{col: _tipo_texto(bloco[col]) for col in rebaixadas}}
+                return [], tipos, {}, 0, rebaixadas
+
+        antes += int(bloco.memory_usage(deep=True).sum())
+        for col, tipo in tipos.items():
+            if tipo == "numero":
+                bloco[col] = to_number(bloco[col])
+            elif tipo == "categoria":
+                bloco[col] = bloco[col].astype("category")
+
+        partes.append(bloco)
+        if progresso is not None:
+            progresso(min(arquivo.tell() / tamanho, 1.0))
+
+    return partes, tipos, removidas, antes, []
+
+
+# =========================
+# Modo contínuo: CSVs que só crescem
+# =========================
+
+class MonitorCsv:
+    """Acompanha um CSV (ou os CSVs de uma pasta) em que um CLP/MES vai
+    anexando linhas, e devolve só as linhas novas desde a última leitura.
+
+    Por arquivo guarda o byte em que termina a última linha completa, o
+    formato detectado na primeira leitura e o cabeçalho. Linha ainda sendo
+    escrita (sem quebra de linha no fim) fica para a próxima vez. Se algum
+    arquivo encolher ou for trocado, tudo é relido do começo e
+    `novas_linhas` avisa com `reiniciado=True`.
+
+    Um trecho que não decodifica no encoding detectado (ex.: linha latin-1
+    anexada a um arquivo que começou só com ASCII) é lido em latin-1, como
+    na leitura normal. Linhas que não dá para interpretar são descartadas,
+    guardadas em `descartadas` (as últimas MAX_DESCARTADAS) e descritas em
+    `avisos` até a próxima leitura; o offset avança do mesmo jeito, para o
+    monitor não ficar preso no mesmo trecho.
+    """
+
+    MAX_DESCARTADAS = 100
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._arquivos = {}  # caminho -> {"offset", "inode", "formato", "colunas"}
+        self.avisos = []  # problemas da última chamada a novas_linhas
+        self.descartadas = []  # (arquivo, linha) das últimas linhas descartadas
+
+    def arquivos(self): # O próprio arquivo, ou os .csv da pasta
+        if os.path.isdir(self.caminho):
+            return sorted(
+                os.path.join(self.caminho, nome)
+                for nome in os.listdir(self.caminho)
+                if nome.lower().endswith(".csv")
+            )
+        return [self.caminho] if os.path.isfile(self.caminho) else []
+
+    def novas_linhas(self): # (linhas anexadas já limpas, reiniciado)
+        self.avisos = []
+        arquivos = self.arquivos()
+
+        reiniciado = any(
+            os.stat(a).st_size < estado["offset"] or os.stat(a).st_ino != estado["inode"]
+            for a, estado in self._arquivos.items()
+            if a in arquivos
+        )
+        if reiniciado:
+            logger.info("Arquivo monitorado encolheu ou foi trocado; relendo %s do começo", self.caminho)
+            self._arquivos.clear()
+
+        partes = []
+        for arquivo in arquivos:
+            parte = self._ler_cauda(arquivo)
+            if parte is not None:
+                partes.append(parte)
+
+        if not partes:
+            return pd.DataFrame(), reiniciado
+
+        novas = pd.concat(partes, ignore_index=True)
+        novas, _ = limpar_linhas(novas)
+        return novas, reiniciado
+
+    def _ler_cauda(self, arquivo): # Linhas completas depois do último offset (None se não há)
+        estado = self._arquivos.get(arquivo)
+        with open(arquivo, "rb") as f:
+            f.seek(estado["offset"] if estado else 0)
+            dados = f.read()
+
+        fim = dados.rfind(b"\n")
+        if fim < 0:
+            return None
+        dados = dados[:fim + 1]
+
+        if estado is None:
+            formato = detectar_formato_csv(dados)
+            quebra = dados.find(b"\n") + 1
+            cabecalho = pd.read_csv(
+                io.StringIO(self._decodificar(arquivo, dados[:quebra], formato)),
+                sep=formato["sep"], engine="c", dtype=str, nrows=0
+            )
+            estado = {
+                "offset": quebra,
+                "inode": os.stat(arquivo).st_ino,
+                "formato": formato,
+                "colunas": list(limpar_nomes_colunas(cabecalho.columns)),
+            }
+            self._arquivos[arquivo] = estado
+            dados = dados[quebra:]
+
+        df = self._interpretar(arquivo, dados, estado["formato"], estado["colunas"])
+        estado["offset"] += len(dados)
+        return df
+
+    @staticmethod
+    def _decodificar(arquivo, dados, formato): # Texto do trecho; o que não for do encoding detectado cai no latin-1
+        try:
+            return dados.decode(formato["encoding"])
+        except UnicodeDecodeError:
+            logger.info("Trecho de %s fora de %s; lendo em latin-1", arquivo, formato["encoding"])
+            return dados.decode("latin-1")
+
+    def _interpretar(self, arquivo, dados, formato, colunas): # Frame das linhas; as inválidas são descartadas
+        texto = self._decodificar(arquivo, dados, formato)
+        opcoes = {"sep": formato["sep"], "engine": "c", "dtype": str, "header": None}
+
+        # Sem `names` o leitor C recusa linhas com campos a mais em vez de
+        # jogá-los no índice; linhas com campos a menos completam com NaN
+        try:
+            df = pd.read_csv(io.StringIO(texto), **opcoes)
+            if df.shape[1] <= len(colunas):
+                df = df.reindex(columns=range(len(colunas)))
+                df.columns = colunas
+                return df
+            erro = f"{df.shape[1]} campos para {len(colunas)} colunas"
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=colunas, dtype=str)
+        except Exception as e:
+            erro = e
+        logger.warning("Linhas inválidas em %s (%s); descartando", arquivo, erro)
+
+        # Separa linha a linha as que não dá para interpretar e relê as boas
+        boas, ruins = [], []
+        for linha in texto.splitlines():
+            try:
+                campos = next(csv.reader([linha], delimiter=formato["sep"], strict=True), [])
+                (boas if len(campos) <= len(colunas) else ruins).append(linha)
+            except csv.Error:
+                ruins.append(linha)
+
+        self.descartadas = (self.descartadas + [(arquivo, linha) for linha in ruins])[-self.MAX_DESCARTADAS:]
+        self.avisos.append(
+            f"{os.path.basename(arquivo)}: {len(ruins)} linha(s) inválida(s) descartada(s)"
+        )
+        if not boas:
+            return pd.DataFrame(columns=colunas, dtype=str)
+        return pd.read_csv(io.StringIO("\n".join(boas) + "\n"), names=colunas, **opcoes)
+
+
+# Leitores de Excel, do mais rápido para o mais lento. O openpyxl do pandas
+# já abre o arquivo em modo read-only e descarta linhas/colunas vazias do fim;
+# o calamine (Rust) faz o mesmo trabalho várias vezes mais rápido.
+LEITORES_EXCEL = {
+    "calamine": importlib.util.find_spec("python_calamine") is not None,
+    "openpyxl": True,
+}
+
+MOTOR_EXCEL = os.environ.get("KPI_EXCEL_ENGINE") or next(
+    motor for motor, disponivel in LEITORES_EXCEL.items() if disponivel
+)
+
+
+def ler_excel(dados, aba=0, colunas=None, motor=None): # Lê uma aba, opcionalmente só algumas colunas
+    df = pd.read_excel(
+        io.BytesIO(dados),
+        sheet_name=aba,
+        usecols=_filtro_colunas(colunas),
+        engine=motor or MOTOR_EXCEL
+    )
+    df.attrs["leitura"] = {"motor": motor or MOTOR_EXCEL}
+    return df
+
+
+def ler_planilha(nome, dados, aba=0, colunas=None): # Lê bytes de CSV/Excel e aplica a limpeza básica de colunas
+    if nome.lower().endswith(".csv"):
+        df = ler_csv(dados, colunas)
+    else:
+        df = ler_excel(dados, aba, colunas)
+
+    df.columns = [str(c).strip() for c in df.columns]
+    # Cabeçalho vazio: o motor C/python chama de "Unnamed: n", o pyarrow deixa ""
+    df = df.loc[:, ~(df.columns.str.contains("^Unnamed") | (df.columns == ""))]
+    return df
+
+
+def listar_abas(nome, dados): # Abas de um Excel; CSV tem uma única "aba" (None)
+    if nome.lower().endswith(".csv"):
+        return [None]
+    with pd.ExcelFile(io.BytesIO(dados), engine=MOTOR_EXCEL) as xls:
+        return xls.sheet_names
+
+
+def ler_upload(nome, dados, aba=None, em_blocos=False, progresso=None, colunas=None): # Uma tarefa de leitura (arquivo ou aba)
+    # `colunas`: nomes das colunas a ler, ou função que recebe o nome (já sem
+    # espaços) e diz se a coluna é lida; None lê todas
+    if em_blocos:
+        arquivo = dados if hasattr(dados, "read") else io.BytesIO(dados)
+        return ler_csv_em_blocos(arquivo, progresso=progresso, colunas=colunas)
+
+    # Mesma limpeza de linhas da leitura em blocos, antes de decidir os tipos:
+    # uma linha "Para lembrar" não impede a coluna do KPI de virar número
+    df = ler_planilha(nome, dados, 0 if aba is None else aba, colunas)
+    df, removidas = limpar_linhas(df)
+    df.attrs["linhas_removidas"] = removidas
+    return compactar(df)
+
+
+def ler_em_paralelo(tarefas, executor, progresso=None): # Executa as tarefas e devolve cada uma ao terminar
+    """Lê as tarefas `(id, nome, dados, aba, em_blocos)` no pool de processos.
+
+    Gera `(id, df, erro)` na ordem em que as leituras terminam. Leituras em
+    blocos rodam no processo atual (copiar arquivos enormes para um worker
+    anularia a economia de memória) e uma única tarefa não paga o custo do pool.
+    `progresso(id, fração)` acompanha as leituras em blocos. Se quem consome
+    parar no meio (cancelamento), as leituras que ainda não começaram no pool
+    são canceladas.
+    """
+    no_processo = [t for t in tarefas if t[4] or len(tarefas) == 1]
+    no_pool = [t for t in tarefas if not (t[4] or len(tarefas) == 1)]
+
+    futuros = {
+        executor.submit(ler_upload, nome, dados, aba, em_blocos): id_tarefa
+        for id_tarefa, nome, dados, aba, em_blocos in no_pool
+    }
+
+    try:
+        for id_tarefa, nome, dados, aba, em_blocos in no_processo:
+            fracao = None if progresso is None else functools.partial(progresso, id_tarefa)
+            try:
+                yield id_tarefa, ler_upload(nome, dados, aba, em_blocos, fracao), None
+            except TarefaCancelada:
+                raise
+            except Exception as erro:
+                yield id_tarefa, None, erro
+
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result(), None
+            except Exception as erro:
+                yield futuros[futuro], None, erro
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+
+
+def chave_conteudo(nome, dados, em_blocos=False): # Hash do conteúdo + opções de leitura (o nome não entra)
+    h = hashlib.sha256(dados)
+    tipo = "csv" if nome.lower().endswith(".csv") else "excel"
+    opcoes = {**OPCOES_CSV, "amostra": AMOSTRA_CSV} if tipo == "csv" else {}
+    opcoes["compacto"] = True
+    opcoes["versao"] = VERSAO_LEITURA
+    if em_blocos:
+        opcoes["linhas_por_bloco"] = LINHAS_POR_BLOCO
+    h.update(repr((tipo, sorted(opcoes.items()))).encode())
+    return h.hexdigest()
+
+
+def chave_aba(chave, aba): # Chave de cache de uma aba específica do arquivo
+    if aba is None:
+        return chave
+    return hashlib.sha256(f"{chave}|{aba}".encode()).hexdigest()
+
+
+# =========================
+# Cache de ingestão (LRU em memória + disco)
+# =========================
+
+class CacheIngestao:
+    """Cache de DataFrames normalizados, chaveado pelo hash do conteúdo.
+
+    Mantém os frames em memória até `max_bytes`; os menos usados são
+    despejados para `pasta` em Parquet e recarregados de lá no próximo
+    acesso. Colunas object com tipos misturados, que o Arrow não
+    representa, vão para o disco como texto. Sem `pasta`, o cache usa uma
+    pasta temporária privada (0700) criada pelo processo: nada gravado ali
+    por outro usuário é lido de volta.
+
+    É também o armazém compartilhado entre sessões: quem usa um frame o
+    `adquire` e depois o `libera`. Enquanto houver donos o frame não sai da
+    memória, então N sessões com o mesmo arquivo apontam para uma única
+    cópia. Os frames são somente leitura: ninguém altera o que recebe daqui.
+    """
+
+    def __init__(self, max_bytes=512 * 1024**2, pasta=None):
+        self.max_bytes = max_bytes
+        self.pasta = pasta or tempfile.mkdtemp(prefix="kpi_cache_")
+        self._frames = OrderedDict()  # chave -> (df, bytes)
+        self._donos = {}  # chave -> donos (sessões) que usam o frame agora
+        self._em_leitura = {}  # chave -> Event de quem está lendo o arquivo
+        self._gravando = {}  # chave -> frame despejado ainda sendo gravado em disco
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.contadores = {
+            "hits": 0,
+            "hits_disco": 0,
+            "misses": 0,
+            "despejos": 0,
+            "gravacoes_disco": 0,
+        }
+
+    def obter(self, chave, carregar): # Retorna o frame da chave, chamando carregar() só em miss
+        df = self.buscar(chave)
+        if df is None:
+            df = carregar()
+            self.guardar(chave, df)
+        return df
+
+    def buscar(self, chave): # Frame da chave (memória ou disco), ou None em miss
+        with self._lock:
+            if chave in self._frames:
+                self._frames.move_to_end(chave)
+                self.contadores["hits"] += 1
+                return self._frames[chave][0]
+            # Despejado há pouco e ainda indo para o disco: volta direto
+            df = self._gravando.get(chave)
+            if df is not None:
+                self.contadores["hits"] += 1
+                despejados = self._guardar(chave, df)
+        if df is not None:
+            self._gravar_despejados(despejados)
+            return df
+
+        df = self._ler_disco(chave)
+
+        despejados = []
+        with self._lock:
+            if df is None:
+                self.contadores["misses"] += 1
+            else:
+                self.contadores["hits_disco"] += 1
+                despejados = self._guardar(chave, df)
+        self._gravar_despejados(despejados)
+        return df
+
+    def guardar(self, chave, df): # Guarda um frame recém-lido
+        with self._lock:
+            despejados = self._guardar(chave, df)
+        self._gravar_despejados(despejados)
+
+    def adquirir(self, chave, dono): # Como buscar(), registrando o dono do frame
+        df = self.buscar(chave)
+        if df is not None:
+            despejados = []
+            with self._lock:
+                # Pode ter sido despejado entre a busca e agora: volta para a memória
+                if chave not in self._frames:
+                    despejados = self._guardar(chave, df)
+                self._donos.setdefault(chave, set()).add(dono)
+            self._gravar_despejados(despejados)
+        return df
+
+    def guardar_adquirido(self, chave, df, dono): # Guarda um frame recém-lido já com dono
+        with self._lock:
+            self._donos.setdefault(chave, set()).add(dono)
+            despejados = self._guardar(chave, df)
+        self._gravar_despejados(despejados)
+
+    def liberar(self, chave, dono): # O dono não usa mais o frame; sem donos, volta ao LRU
+        with self._lock:
+            donos = self._donos.get(chave)
+            if donos is not None:
+                donos.discard(dono)
+                if not donos:
+                    del self._donos[chave]
+            despejados = self._despejar_excesso()
+        self._gravar_despejados(despejados)
+
+    def liberar_dono(self, dono): # Solta tudo de um dono (sessão encerrada ou resetada)
+        with self._lock:
+            for chave in [c for c, donos in self._donos.items() if dono in donos]:
+                self._donos[chave].discard(dono)
+                if not self._donos[chave]:
+                    del self._donos[chave]
+            despejados = self._despejar_excesso()
+        self._gravar_despejados(despejados)
+
+    def reservar(self, chave): # True se quem chama deve ler o arquivo; False se outra sessão já está lendo
+        with self._lock:
+            if chave in self._em_leitura:
+                return False
+            self._em_leitura[chave] = threading.Event()
+            return True
+
+    def concluir(self, chave): # Fim da leitura (com ou sem erro): acorda quem esperava
+        with self._lock:
+            evento = self._em_leitura.pop(chave, None)
+        if evento is not None:
+            evento.set()
+
+    def aguardar(self, chave, timeout=None): # Espera a leitura de outra sessão terminar; True se terminou
+        with self._lock:
+            evento = self._em_leitura.get(chave)
+        return evento is None or evento.wait(timeout)
+
+    def estatisticas(self): # Contadores + ocupação atual, para monitoramento
+        with self._lock:
+            return {
+                **self.contadores,
+                "itens": len(self._frames),
+                "em_uso": len(self._donos),
+                "compartilhados": sum(len(donos) > 1 for donos in self._donos.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _guardar(self, chave, df):
+        if chave in self._frames:
+            self._bytes -= self._frames.pop(chave)[1]
+
+        tamanho = int(df.memory_usage(deep=True).sum())
+        self._frames[chave] = (df, tamanho)
+        self._bytes += tamanho
+        return self._despejar_excesso()
+
+    def _despejar_excesso(self): # Tira da memória (com o lock); a gravação fica para depois, sem o lock
+        # Despeja os menos usados, mas nunca o frame que acabou de entrar nem
+        # um frame com donos (tirá-lo daqui não liberaria memória nenhuma)
+        mais_novo = next(reversed(self._frames), None)
+        livres = [c for c in self._frames if c != mais_novo and c not in self._donos]
+        despejados = []
+        for antiga in livres:
+            if self._bytes <= self.max_bytes:
+                break
+            df_antigo, tamanho_antigo = self._frames.pop(antiga)
+            self._bytes -= tamanho_antigo
+            self.contadores["despejos"] += 1
+            self._gravando[antiga] = df_antigo
+            despejados.append((antiga, df_antigo))
+        return despejados
+
+    def _gravar_despejados(self, despejados):
+        # Fora do lock: gravar centenas de MB não pode travar as outras sessões
+        for chave, df in despejados:
+            try:
+                self._gravar_disco(chave, df)
+            except Exception:
+                logger.exception("Falha ao gravar %s no cache em disco", chave)
+            finally:
+                with self._lock:
+                    if self._gravando.get(chave) is df:
+                        del self._gravando[chave]
+
+    def _caminho(self, chave, ext):
+        return os.path.join(self.pasta, f"{chave}.{ext}")
+
+    def _gravar_disco(self, chave, df):
+        # Conteúdo endereçado pelo hash: se já está no disco, não muda
+        parquet = self._caminho(chave, "parquet")
+        if os.path.exists(parquet):
+            return
+
+        os.makedirs(self.pasta, mode=0o700, exist_ok=True)
+        # Nome temporário + os.replace: outro processo (ou thread) nunca lê
+        # um Parquet pela metade
+        temporario = f"{parquet}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                df.to_parquet(temporario)
+            except Exception:
+                _mistas_como_texto(df).to_parquet(temporario)
+            os.replace(temporario, parquet)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        with self._lock:
+            self.contadores["gravacoes_disco"] += 1
+
+    def _ler_disco(self, chave):
+        parquet = self._caminho(chave, "parquet")
+        if os.path.exists(parquet):
+            return pd.read_parquet(parquet)
+        return None
+
+
+def _mistas_como_texto(df): # Colunas object com tipos misturados viram texto (nulos continuam nulos)
+    mistas = {
+        col: df[col].where(df[col].isna(), df[col].astype(str))
+        for col in df.columns
+        if df[col].dtype == object
+    }
+    return df.assign(**mistas)
+
+
+# =========================
+# Planilhas da sessão (orçamento de memória)
+# =========================
+
+class PlanilhasSessao:
+    """Planilhas carregadas numa sessão, com orçamento de memória.
+
+    Funciona como o antigo dicionário `nome -> DataFrame`, mas só mantém em
+    memória as planilhas selecionadas mais recentemente: até `max_bytes` na
+    sessão e até `max_bytes_processo` somando todas as sessões do processo
+    (frames compartilhados contam uma vez). As demais são liberadas para o
+    `CacheIngestao`, que as manda para o disco quando precisar, e voltam
+    quando selecionadas de novo. A última planilha acessada nunca é despejada.
+
+    Os frames em si vêm do cache compartilhado: a sessão só guarda nomes,
+    chaves e referências. Estado por sessão (meta, regra) fica em `file_states`.
+    """
+
+    _sessoes = weakref.WeakSet()
+    _lock_processo = threading.Lock()
+    _acessos = itertools.count()
+
+    def __init__(self, cache, max_bytes=1024 * 1024**2, max_bytes_processo=4096 * 1024**2):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.max_bytes_processo = max_bytes_processo
+        self._chaves = {}  # nome -> chave do cache, na ordem de carga
+        self._memoria = {}  # nome -> attrs["memoria"], para o relatório sem recarregar
+        self._residentes = OrderedDict()  # nome -> (df, bytes, último acesso)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.contadores = {"despejos": 0, "recargas": 0}
+        PlanilhasSessao._sessoes.add(self)
+
+        # Sessão encerrada sem reset: devolve os frames ao cache mesmo assim
+        self._dono = object()
+        weakref.finalize(self, cache.liberar_dono, self._dono)
+
+    def carregar(self, nome, chave): # Usa o frame já lido (por qualquer sessão), ou None
+        df = self.cache.adquirir(chave, self._dono)
+        if df is not None:
+            self._registrar(nome, chave, df)
+        return df
+
+    def guardar(self, nome, chave, df): # Registra uma planilha recém-lida por esta sessão
+        self.cache.guardar_adquirido(chave, df, self._dono)
+        self._registrar(nome, chave, df)
+
+    def _registrar(self, nome, chave, df):
+        with self._lock:
+            # Mesmo nome com outro conteúdo (ex.: outro período do dataset salvo)
+            anterior = self._chaves.get(nome)
+            if anterior is not None and anterior != chave:
+                self.cache.liberar(anterior, self._dono)
+            self._chaves[nome] = chave
+            self._memoria[nome] = df.attrs.get("memoria")
+            self._residir(nome, df)
+        self._respeitar_orcamentos(nome)
+
+    def __getitem__(self, nome): # Frame da planilha, recarregado do cache/disco se preciso
+        with self._lock:
+            if nome in self._residentes:
+                df, tamanho, _ = self._residentes.pop(nome)
+                self._residentes[nome] = (df, tamanho, next(self._acessos))
+            else:
+                df = self.cache.adquirir(self._chaves[nome], self._dono)
+                if df is None:
+                    raise KeyError(f"{nome} não está mais em memória nem em disco")
+                self.contadores["recargas"] += 1
+                self._residir(nome, df)
+        self._respeitar_orcamentos(nome)
+        return df
+
+    def __contains__(self, nome):
+        return nome in self._chaves
+
+    def __len__(self):
+        return len(self._chaves)
+
+    def __iter__(self):
+        return iter(list(self._chaves))
+
+    def keys(self):
+        return list(self._chaves)
+
+    def memoria(self): # nome -> bytes antes/depois da compactação
+        return {nome: m for nome, m in self._memoria.items() if m}
+
+    def limpar(self): # "Resetar análise": solta tudo da sessão
+        with self._lock:
+            self._chaves.clear()
+            self._memoria.clear()
+            self._residentes.clear()
+            self._bytes = 0
+        self.cache.liberar_dono(self._dono)
+
+    def estatisticas(self): # Uso da sessão, para monitoramento
+        with self._lock:
+            return {
+                **self.contadores,
+                "planilhas": len(self._chaves),
+                "residentes": len(self._residentes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    @classmethod
+    def uso_processo(cls): # Soma de todas as sessões vivas, cada frame compartilhado uma vez
+        sessoes = list(cls._sessoes)
+        frames = {
+            id(df): tamanho
+            for sessao in sessoes
+            for df, tamanho, _ in list(sessao._residentes.values())
+        }
+        return {
+            "sessoes": len(sessoes),
+            "bytes": sum(frames.values()),
+        }
+
+    def _residir(self, nome, df):
+        if nome in self._residentes:
+            self._bytes -= self._residentes.pop(nome)[1]
+        tamanho = int(df.memory_usage(deep=True).sum())
+        self._residentes[nome] = (df, tamanho, next(self._acessos))
+        self._bytes += tamanho
+
+    def _despejar(self, nome):
+        _, tamanho, _ = self._residentes.pop(nome)
+        self._bytes -= tamanho
+        self.contadores["despejos"] += 1
+        self.cache.liberar(self._chaves[nome], self._dono)
+        logger.info("Planilha %s despejada da sessão (%.1f MB)", nome, tamanho / 1024**2)
+
+    def _respeitar_orcamentos(self, ativa):
+        # Sessão: despeja as menos recentes, nunca a que acabou de ser usada
+        with self._lock:
+            while self._bytes > self.max_bytes and len(self._residentes) > 1:
+                self._despejar(next(n for n in self._residentes if n != ativa))
+
+        # Processo: despeja a planilha acessada há mais tempo entre todas as
+        # sessões. Nenhum lock de sessão fica preso enquanto outro é pedido.
+        with PlanilhasSessao._lock_processo:
+            while self.uso_processo()["bytes"] > self.max_bytes_processo:
+                candidatas = []
+                for sessao in list(PlanilhasSessao._sessoes):
+                    with sessao._lock:
+                        for nome, (_, _, acesso) in sessao._residentes.items():
+                            if not (sessao is self and nome == ativa):
+                                candidatas.append((acesso, sessao, nome))
+                                break  # a primeira é a menos recente da sessão
+                if not candidatas:
+                    break
+                _, sessao, nome = min(candidatas, key=lambda c: c[0])
+                with sessao._lock:
+                    if nome in sessao._residentes:
+                        sessao._despejar(nome)
+
+
+# =========================
+# Tarefas em segundo plano (por sessão)
+# =========================
+
+class TarefaCancelada(Exception):
+    """Levantada por `Tarefa.informar` depois que o cancelamento foi pedido."""
+
+
+class Tarefa:
+    """Um cálculo pesado rodando numa thread do pool, fora do rerun.
+
+    A função recebe a própria tarefa e chama `informar(fração, texto)` entre
+    um passo e outro: é por ali que o progresso chega à interface e que o
+    cancelamento acontece (cooperativo: `informar` levanta TarefaCancelada, e
+    o passo que já está rodando termina antes). `chave` identifica as
+    entradas que geraram a tarefa. `ao_fim`, se dado, roda uma única vez
+    quando a tarefa acaba de qualquer jeito, inclusive cancelada ainda na
+    fila, sem nunca ter rodado (ex.: soltar reservas do cache).
+    """
+
+    def __init__(self, nome, chave, ao_fim=None):
+        self.nome = nome
+        self.chave = chave
+        self.estado = "na fila"  # rodando, concluída, cancelada ou erro
+        self.fracao = 0.0
+        self.texto = ""
+        self.resultado = None
+        self.erro = None
+        # O que a função quiser entregar junto ao rerun que recebe o resultado
+        # (o app guarda aqui etapas recalculadas e medições de desempenho)
+        self.recalculadas = set()
+        self.desempenho = []
+        self.inicio = time.monotonic()
+        self._cancelar = threading.Event()
+        self._fim = threading.Event()
+        self._futuro = None
+        self._ao_fim = ao_fim
+        self._lock = threading.Lock()
+
+    def informar(self, fracao, texto=None): # Atualiza o progresso; levanta TarefaCancelada se pediram para parar
+        if self._cancelar.is_set():
+            raise TarefaCancelada(self.nome)
+        self.fracao = min(max(float(fracao), 0.0), 1.0)
+        if texto is not None:
+            self.texto = texto
+
+    def cancelar(self): # Pede para parar; na fila, nem chega a rodar
+        self._cancelar.set()
+        if self._futuro is not None and self._futuro.cancel():
+            self.estado = "cancelada"
+            self._encerrar()
+
+    def cancelada(self): # Cancelamento pedido antes do fim (pode ainda estar no passo atual)
+        return self._cancelar.is_set() and self.estado != "concluída"
+
+    def pronta(self): # Terminou (de qualquer jeito)
+        return self._fim.is_set()
+
+    def aguardar(self, timeout=None): # True se terminou dentro do prazo
+        return self._fim.wait(timeout)
+
+    def segundos(self): # Tempo desde que foi criada
+        return time.monotonic() - self.inicio
+
+    def _rodar(self, funcao):
+        self.estado = "rodando"
+        try:
+            resultado = funcao(self)
+            # Cancelada depois do último informar: o resultado já é velho
+            if self._cancelar.is_set():
+                self.estado = "cancelada"
+            else:
+                self.resultado = resultado
+                self.fracao = 1.0
+                self.estado = "concluída"
+        except TarefaCancelada:
+            self.estado = "cancelada"
+        except BaseException as erro:
+            # Qualquer exceção, mesmo as que não herdam de Exception: a tarefa
+            # nunca fica "rodando" para sempre
+            logger.exception("Tarefa %s falhou", self.nome)
+            self.erro = erro
+            self.estado = "erro"
+        finally:
+            self._encerrar()
+
+    def _encerrar(self):
+        with self._lock:
+            ao_fim, self._ao_fim = self._ao_fim, None
+        try:
+            if ao_fim is not None:
+                ao_fim()
+        finally:
+            self._fim.set()
+
+
+class TarefasSessao:
+    """Tarefas em segundo plano de uma sessão, no pool de threads compartilhado.
+
+    Cada tarefa tem um nome ("análise", "leitura ...") e a chave das entradas
+    que a geraram. `iniciar` com o mesmo nome e a mesma chave devolve a tarefa
+    que já existe, então um rerun se reconecta a ela em vez de recomeçar; com
+    outra chave, a antiga é cancelada e o resultado dela nunca é entregue.
+    Reset ou sessão encerrada cancelam tudo.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self._tarefas = {}  # nome -> Tarefa
+        self._lock = threading.Lock()
+
+        # Sessão encerrada com tarefa rodando: pede para parar mesmo assim
+        weakref.finalize(self, _cancelar_tarefas, self._tarefas)
+
+    def iniciar(self, nome, chave, funcao, ao_fim=None): # Tarefa com estas entradas (reaproveitada ou nova)
+        with self._lock:
+            atual = self._tarefas.get(nome)
+            if atual is not None and atual.chave == chave:
+                return atual
+            if atual is not None:
+                atual.cancelar()
+
+            tarefa = Tarefa(nome, chave, ao_fim)
+            self._tarefas[nome] = tarefa
+            tarefa._futuro = self.executor.submit(tarefa._rodar, funcao)
+            return tarefa
+
+    def tarefa(self, nome): # A tarefa com esse nome, ou None
+        return self._tarefas.get(nome)
+
+    def listar(self, prefixo=""): # Tarefas cujo nome começa com o prefixo
+        with self._lock:
+            return [t for nome, t in self._tarefas.items() if nome.startswith(prefixo)]
+
+    def descartar(self, nome): # Cancela (se ainda roda) e esquece a tarefa
+        with self._lock:
+            tarefa = self._tarefas.pop(nome, None)
+        if tarefa is not None:
+            tarefa.cancelar()
+
+    def cancelar_todas(self): # "Resetar análise": nada do que está rodando é entregue
+        with self._lock:
+            _cancelar_tarefas(self._tarefas)
+
+    def __len__(self):
+        return len(self._tarefas)
+
+
+def _cancelar_tarefas(tarefas):
+    for tarefa in list(tarefas.values()):
+        tarefa.cancelar()
+    tarefas.clear()
+
+
+# =========================
+# Armazém local de datasets (Arrow por mês)
+# =========================
+
+ARMAZEM_DISPONIVEL = importlib.util.find_spec("pyarrow") is not None
+
+MANIFESTO = "manifesto.json"
+
+
+class ArmazemDatasets:
+    """Planilhas já tratadas guardadas em disco, para reabrir sem reler o Excel.
+
+    Cada dataset é uma pasta com um arquivo Arrow (IPC, sem compressão) por
+    mês da coluna de tempo, mais um para as linhas sem data, e um
+    `manifesto.json` com colunas, meses, início/fim de cada partição e os
+    `attrs` da leitura. Abrir mapeia os arquivos em memória (mmap): colunas
+    numéricas e de datas apontam direto para o arquivo, sem cópia (mais de
+    uma partição exige juntá-las num frame só, o que copia, mas sem parse).
+    Uma consulta por período só abre as partições que cruzam o intervalo.
+
+    Gravar escreve partições com nomes novos e troca o manifesto por último,
+    então quem já abriu a versão anterior continua lendo arquivos válidos.
+    Precisa do pyarrow (`ARMAZEM_DISPONIVEL`).
+    """
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def listar(self): # Manifestos de todos os datasets, por nome
+        if not os.path.isdir(self.pasta):
+            return []
+        manifestos = []
+        for pasta in sorted(os.listdir(self.pasta)):
+            manifesto = self._ler_manifesto(os.path.join(self.pasta, pasta))
+            if manifesto is not None:
+                manifestos.append(manifesto)
+        return sorted(manifestos, key=lambda m: m["nome"])
+
+    def manifesto(self, nome): # Manifesto do dataset, ou None se não existe
+        return self._ler_manifesto(self._pasta_dataset(nome))
+
+    def salvar(self, nome, df, time_col=None, chave=None): # Grava (ou substitui) o dataset particionado por mês
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        pasta = self._pasta_dataset(nome)
+        os.makedirs(pasta, exist_ok=True)
+
+        if time_col is not None:
+            if df[time_col].dtype.kind != "M":
+                df = df.assign(**{time_col: parsear_datas(df[time_col])})
+            meses = df[time_col].to_numpy().astype("datetime64[M]")
+        else:
+            meses = np.full(len(df), np.datetime64("NaT", "M"))
+
+        # Uma ordenação estável agrupa os meses; NaT (sem data) fica no fim
+        ordem = np.argsort(meses, kind="stable")
+        meses = meses[ordem]
+        inteiros = meses.view("i8")  # NaT == NaT, ao contrário de datetime64
+        cortes = np.flatnonzero(inteiros[1:] != inteiros[:-1]) + 1
+
+        geracao = hashlib.sha256(os.urandom(16)).hexdigest()[:8]
+        particoes = []
+        for inicio, fim in zip(np.r_[0, cortes], np.r_[cortes, len(df)]):
+            parte = df.iloc[ordem[inicio:fim]]
+            mes = None if fim == inicio or np.isnat(meses[inicio]) else str(meses[inicio])
+            arquivo = f"{mes or 'sem_data'}.{geracao}.arrow"
+
+            tabela = pa.Table.from_pandas(parte, preserve_index=False)
+            # NaN fica como valor (não como nulo): a coluna volta do mmap sem cópia
+            for i, col in enumerate(parte.columns):
+                if parte[col].dtype.kind == "f":
+                    tabela = tabela.set_column(
+                        i, tabela.schema.field(i), pa.array(parte[col].to_numpy(), from_pandas=False)
+                    )
+            with ipc.new_file(os.path.join(pasta, arquivo), tabela.schema) as escritor:
+                escritor.write_table(tabela)
+
+            particao = {"arquivo": arquivo, "mes": mes, "linhas": int(fim - inicio)}
+            if mes is not None:
+                particao["inicio"] = str(parte[time_col].min())
+                particao["fim"] = str(parte[time_col].max())
+            particoes.append(particao)
+
+        manifesto = {
+            "nome": nome,
+            "chave": chave,
+            "coluna_tempo": time_col,
+            "colunas": [str(c) for c in df.columns],
+            "linhas": len(df),
+            "particoes": particoes,
+            "attrs": _attrs_json(df.attrs),
+            "salvo_em": pd.Timestamp.now().isoformat(timespec="seconds"),
+        }
+        temporario = os.path.join(pasta, f"{MANIFESTO}.{geracao}")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, os.path.join(pasta, MANIFESTO))
+
+        # Partições da versão anterior: quem as mapeou continua lendo (o
+        # arquivo só some de fato quando o último mmap fecha)
+        atuais = {p["arquivo"] for p in particoes}
+        for arquivo in os.listdir(pasta):
+            if arquivo.endswith(".arrow") and arquivo not in atuais:
+                os.remove(os.path.join(pasta, arquivo))
+
+        logger.info("Dataset %s salvo: %d linhas em %d partições", nome, len(df), len(particoes))
+        return manifesto
+
+    def abrir(self, nome, inicio=None, fim=None): # Frame do dataset, opcionalmente só de um período
+        """`inicio`/`fim` (inclusivos) filtram pela coluna de tempo do
+        manifesto; linhas sem data só entram quando não há filtro.
+        """
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        pasta = self._pasta_dataset(nome)
+        manifesto = self._ler_manifesto(pasta)
+        if manifesto is None:
+            raise KeyError(f"Dataset {nome} não encontrado em {self.pasta}")
+
+        time_col = manifesto["coluna_tempo"]
+        filtrar = inicio is not None or fim is not None
+        inicio = pd.Timestamp(inicio) if inicio is not None else None
+        fim = pd.Timestamp(fim) if fim is not None else None
+
+        partes = []
+        lidas = 0
+        for particao in manifesto["particoes"]:
+            if filtrar and (
+                particao["mes"] is None
+                or (inicio is not None and pd.Timestamp(particao["fim"]) < inicio)
+                or (fim is not None and pd.Timestamp(particao["inicio"]) > fim)
+            ):
+                continue
+
+            mapa = pa.memory_map(os.path.join(pasta, particao["arquivo"]), "r")
+            parte = ipc.open_file(mapa).read_all().to_pandas(split_blocks=True)
+            lidas += 1
+
+            # Só as partições das pontas precisam de filtro por linha
+            if inicio is not None and pd.Timestamp(particao["inicio"]) < inicio:
+                parte = parte[parte[time_col] >= inicio]
+            if fim is not None and pd.Timestamp(particao["fim"]) > fim:
+                parte = parte[parte[time_col] <= fim]
+            partes.append(parte)
+
+        if not partes:
+            df = pd.DataFrame(columns=manifesto["colunas"])
+        elif len(partes) == 1:
+            df = partes[0].reset_index(drop=True)
+        else:
+            df = _juntar_partes(partes)
+
+        df.attrs = {
+            **manifesto["attrs"],
+            "armazem": {"nome": nome, "particoes": len(manifesto["particoes"]), "lidas": lidas},
+        }
+        return df
+
+    def remover(self, nome): # Apaga o dataset do disco
+        pasta = self._pasta_dataset(nome)
+        if os.path.isdir(pasta):
+            for arquivo in os.listdir(pasta):
+                os.remove(os.path.join(pasta, arquivo))
+            os.rmdir(pasta)
+
+    def _pasta_dataset(self, nome):
+        # Nomes diferentes podem virar o mesmo texto limpo ("linha A.csv" e
+        # "linha_A.csv"): o hash do nome original separa as pastas
+        legivel = re.sub(r"[^\w.-]+", "_", nome).strip("._") or "dataset"
+        return os.path.join(self.pasta, f"{legivel}-{hashlib.sha256(nome.encode()).hexdigest()[:8]}")
+
+    def _ler_manifesto(self, pasta):
+        caminho = os.path.join(pasta, MANIFESTO)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _attrs_json(attrs): # Só o que cabe no manifesto (leitura, linhas removidas, memória)
+    guardados = {}
+    for chave, valor in attrs.items():
+        try:
+            json.dumps(valor)
+        except TypeError:
+            continue
+        guardados[chave] = valor
+    return guardados
+
+
+def _juntar_partes(partes): # Concatena partições mantendo as categorias (cada mês tem as suas)
+    colunas = {}
+    for col in partes[0].columns:
+        series = [p[col] for p in partes]
+        if isinstance(series[0].dtype, pd.CategoricalDtype):
+            colunas[col] = pd.Series(union_categoricals(series, ignore_order=True), name=col)
+        else:
+            colunas[col] = pd.concat(series, ignore_index=True)
+    return pd.DataFrame(colunas)
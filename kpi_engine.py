@@ -0,0 +1,1109 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# =========================
+# Conversão numérica e limpeza de linhas (sem Streamlit)
+# =========================
+
+VALORES_INVALIDOS = ["", "nan", "none", "erro", "texto", "-", "--", "%"]
+
+NUMERO = r"-?\d+(?:\.\d+)?"
+
+
+def _normalizar_textos(valores): # Texto minúsculo sem espaços, vírgula decimal e "%"
+    # 1. Tudo vira string
+    s = pd.Series(valores, dtype=object).map(str).str.strip().str.lower()
+
+    # 2. Valores explicitamente inválidos
+    invalidos = s.isin(VALORES_INVALIDOS).to_numpy()
+
+    # 3. Normalização
+    s = (
+        s.str.replace(" ", "", regex=False)
+        .str.replace(",", ".", regex=False)
+        .str.replace("%", "", regex=False)
+    )
+    return s, invalidos
+
+
+def _parse_textos(valores): # Converte valores únicos (já como texto) de forma vetorizada
+    s, invalidos = _normalizar_textos(valores)
+
+    # 4. Extração do primeiro número válido
+    match = s.str.extract(f"({NUMERO})", expand=False)
+
+    resultado = np.full(len(s), np.nan)
+    encontrados = match.notna().to_numpy() & ~invalidos
+    resultado[encontrados] = match[encontrados].to_numpy(dtype=object).astype(float)
+    return resultado
+
+
+def to_number(series): # Converte uma série para números float, tratando diversos formatos
+    # Colunas já numéricas: float(str(x)) == x, exceto quando str() usa notação
+    # científica ou inf — esses poucos casos seguem pelo caminho de texto
+    # (float32 também: o valor lido é o float64 equivalente)
+    if series.dtype.kind in "iu":
+        valores = series.to_numpy(dtype=float, na_value=np.nan)
+        return pd.Series(valores, index=series.index, name=series.name)
+
+    if series.dtype.kind == "f":
+        valores = series.to_numpy(dtype=float, na_value=np.nan)
+        absolutos = np.abs(valores)
+        especiais = np.isinf(valores) | (
+            (valores != 0) & ((absolutos < 1e-4) | (absolutos >= 1e16))
+        )
+        if especiais.any():
+            valores = valores.copy()
+            valores[especiais] = _parse_textos(valores[especiais])
+        return pd.Series(valores, index=series.index, name=series.name)
+
+    # Planilhas repetem muito os mesmos valores: cada valor distinto é
+    # convertido uma única vez e o resultado é espalhado pelos códigos
+    codigos, unicos = pd.factorize(series, use_na_sentinel=True)
+    tabela = np.append(_parse_textos(np.asarray(unicos, dtype=object)), np.nan)
+    return pd.Series(tabela[codigos], index=series.index, name=series.name)
+
+
+def _so_numeros(valores, aceitar_invalidos=True): # (todos são número ou token inválido, algum é número)
+    s, invalidos = _normalizar_textos(valores)
+    numeros = s.str.fullmatch(NUMERO).to_numpy()
+    validos = numeros | invalidos if aceitar_invalidos else numeros
+    return bool(validos.all()), bool(numeros.any())
+
+
+def eh_coluna_numerica(series, aceitar_invalidos=True): # True se todo valor preenchido é um número (ou token inválido)
+    # aceitar_invalidos=False: "erro", "--" etc. também tornam a coluna não numérica
+    preenchidos = series.dropna()
+
+    # Colunas de texto costumam falhar logo nos primeiros valores
+    if not _so_numeros(preenchidos.head(1000).to_numpy(dtype=object), aceitar_invalidos)[0]:
+        return False
+
+    unicos = pd.unique(preenchidos)
+    if len(unicos) == 0:
+        return False
+
+    todos, algum = _so_numeros(unicos, aceitar_invalidos)
+    return todos and algum
+
+
+# Regras de remoção de linhas: (descrição, padrão regex, quando remover)
+# "nenhuma" -> remove a linha se nenhuma célula casar com o padrão
+# "alguma"  -> remove a linha se alguma célula casar com o padrão
+REGRAS_LINHAS = [
+    ("sem nenhum número", r"\d", "nenhuma"),
+    ("explicativas (Para lembrar)", r"(?i)para lembrar", "alguma"),
+]
+
+
+def limpar_linhas(df, regras=REGRAS_LINHAS): # Aplica todas as regras de linha numa única varredura por coluna
+    casou = np.zeros((len(regras), len(df)), dtype=bool)
+
+    for i in range(df.shape[1]):
+        # Cada valor distinto da coluna vira texto (vazio -> "nan") uma única vez
+        codigos, unicos = pd.factorize(df.iloc[:, i], use_na_sentinel=True)
+        textos = pd.Series(np.append(np.asarray(unicos, dtype=object), np.nan)).map(str)
+
+        for r, (_, padrao, _) in enumerate(regras):
+            casou[r] |= textos.str.contains(padrao, regex=True).to_numpy()[codigos]
+
+    remover = np.zeros(len(df), dtype=bool)
+    contagem = {}
+
+    # Cada linha removida é atribuída à primeira regra que a pegou
+    for r, (nome, _, quando) in enumerate(regras):
+        regra_remove = ~casou[r] if quando == "nenhuma" else casou[r]
+        contagem[nome] = int((regra_remove & ~remover).sum())
+        remover |= regra_remove
+
+    return df[~remover], contagem
+
+
+# =========================
+# Datas
+# =========================
+
+MESES = {
+    "jan": "01", "fev": "02", "mar": "03", "abr": "04",
+    "mai": "05", "jun": "06", "jul": "07", "ago": "08",
+    "set": "09", "out": "10", "nov": "11", "dez": "12"
+}
+
+# Mês/ano em português: "fev/25", "fevereiro-2025", "set 24"
+MES_ANO = r"^(?:" + "|".join(MESES) + r")[a-zç]*[\s./-]*(?:\d{2}|\d{4})$"
+
+AMOSTRA_DATAS = 200
+
+
+def _formato_provavel(textos): # Formato mais comum entre os palpites do pandas numa amostra
+    palpites = []
+    for t in textos.iloc[:AMOSTRA_DATAS].tolist():
+        # Ano na frente (ISO) nunca é dia/mês: "2024-01-05" é 5 de janeiro
+        palpites.append(guess_datetime_format(t, dayfirst=not re.match(r"\d{4}", t)))
+
+    palpites = pd.Series(palpites, dtype=object).dropna()
+    return palpites.mode().iloc[0] if not palpites.empty else None
+
+
+# Campos de largura fixa (com zero à esquerda): tamanho e nome para o pandas
+CAMPOS_DATA = {
+    "%d": (2, "day"), "%m": (2, "month"), "%Y": (4, "year"),
+    "%H": (2, "hour"), "%M": (2, "minute"), "%S": (2, "second"),
+}
+
+# Hora/minuto/segundo fora do limite somariam no dia seguinte: descarta
+LIMITES_HORA = {"hour": 23, "minute": 59, "second": 59}
+
+
+def _datas_largura_fixa(textos, partes): # Fatia os dígitos direto dos bytes, sem strptime por elemento
+    largura = sum(CAMPOS_DATA[p][0] if p in CAMPOS_DATA else 1 for p in partes)
+    encaixa = (textos.str.len() == largura).to_numpy(dtype=bool, na_value=False)
+    datas = pd.Series(pd.NaT, index=textos.index, dtype="datetime64[ns]")
+
+    try:
+        brutos = textos[encaixa].to_numpy(dtype=f"S{largura}")
+    except UnicodeEncodeError:
+        return datas, np.zeros(len(textos), dtype=bool)
+
+    matriz = brutos.view(np.uint8).reshape(-1, largura)
+    ok = np.ones(len(matriz), dtype=bool)
+    campos = {}
+    inicio = 0
+
+    for p in partes:
+        if p in CAMPOS_DATA:
+            tamanho, nome = CAMPOS_DATA[p]
+            digitos = matriz[:, inicio:inicio + tamanho] - np.uint8(48)  # fora de 0-9 estoura
+            ok &= (digitos <= 9).all(axis=1)
+            campos[nome] = (digitos * 10 ** np.arange(tamanho - 1, -1, -1)).sum(axis=1)
+            if nome in LIMITES_HORA:
+                ok &= campos[nome] <= LIMITES_HORA[nome]
+        else:
+            tamanho = 1
+            ok &= matriz[:, inicio] == ord(p)
+        inicio += tamanho
+
+    # Monta a data em aritmética de datetime64; dia fora do mês (31/02) vira NaT
+    campos = {nome: valores[ok].astype(np.int64) for nome, valores in campos.items()}
+    mes = (campos["year"] - 1970) * 12 + campos["month"] - 1
+    inicio_mes = mes.astype("datetime64[M]").astype("datetime64[D]")
+    dias_no_mes = ((mes + 1).astype("datetime64[M]").astype("datetime64[D]") - inicio_mes).astype(np.int64)
+    valida = (campos["month"] >= 1) & (campos["month"] <= 12)
+    valida &= (campos["day"] >= 1) & (campos["day"] <= dias_no_mes)
+
+    segundos = (
+        campos.get("hour", 0) * 3600 + campos.get("minute", 0) * 60 + campos.get("second", 0)
+    )
+    resultado = (
+        inicio_mes.astype("datetime64[s]")
+        + (campos["day"] - 1) * 86400
+        + segundos
+    ).astype("datetime64[ns]")
+    resultado[~valida] = np.datetime64("NaT")
+
+    indices = np.flatnonzero(encaixa)[ok]
+    datas.iloc[indices] = resultado
+
+    convertidos = np.zeros(len(textos), dtype=bool)
+    convertidos[indices] = True
+    return datas, convertidos
+
+
+def _aplicar_formato(textos, formato): # to_datetime com formato fixo
+    partes = re.findall(r"%.|[^%]", formato)
+
+    # Formatos só com dia/mês/ano/hora e separadores ASCII (ex: "%d/%m/%Y %H:%M")
+    if {"%d", "%m", "%Y"} <= set(partes) and all(
+        p in CAMPOS_DATA or (not p.startswith("%") and p.isascii()) for p in partes
+    ):
+        datas, convertidos = _datas_largura_fixa(textos, partes)
+    else:
+        datas = pd.Series(pd.NaT, index=textos.index, dtype="datetime64[ns]")
+        convertidos = np.zeros(len(textos), dtype=bool)
+
+    # Outros formatos e textos sem zero à esquerda ("5/1/2024"): strptime do pandas.
+    # Com fuso ("Z", "-03:00") o resultado vem com tz: guarda em UTC sem fuso
+    pendentes = ~convertidos
+    if pendentes.any():
+        convertidas = pd.to_datetime(textos[pendentes], format=formato, errors="coerce", utc=True)
+        datas[pendentes] = convertidas.dt.tz_localize(None)
+    return datas
+
+
+def _datas_livres(textos): # Último recurso, valor a valor (dateutil): "01/02/24", "Feb 2024"
+    # Ano na frente continua sendo ano-mês-dia, como em `_formato_provavel`
+    ano_primeiro = textos.str.match(r"\d{4}").to_numpy(dtype=bool, na_value=False)
+    datas = pd.Series(pd.NaT, index=textos.index, dtype="datetime64[ns]")
+    for mascara, dayfirst in ((ano_primeiro, False), (~ano_primeiro, True)):
+        if mascara.any():
+            convertidas = pd.to_datetime(
+                textos[mascara], format="mixed", dayfirst=dayfirst, errors="coerce", utc=True
+            )
+            datas[mascara] = convertidas.dt.tz_localize(None)
+    return datas
+
+
+def parsear_datas(series): # Converte a coluna de tempo para datetime, cada valor distinto uma vez
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    codigos, unicos = pd.factorize(series, use_na_sentinel=True)
+
+    if pd.api.types.is_string_dtype(unicos.dtype) and unicos.dtype != object:
+        textos = pd.Series(unicos).str.strip()
+        numericos = ja_datas = np.zeros(len(textos), dtype=bool)
+    else:
+        # Coluna object (Excel): pode misturar texto, números e datas
+        unicos = pd.Series(np.asarray(unicos, dtype=object))
+        textos = unicos.map(str).str.strip()
+        numericos = unicos.map(
+            lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)
+        ).to_numpy(dtype=bool)
+        ja_datas = unicos.map(lambda v: hasattr(v, "year")).to_numpy(dtype=bool)
+
+    # 1. Números puros (ou células numéricas) virariam epoch (1970): descarta
+    validos = ~(textos.str.isdigit().to_numpy(dtype=bool, na_value=False) | numericos)
+
+    datas = pd.Series(pd.NaT, index=textos.index, dtype="datetime64[ns]")
+
+    # 2. Formato inferido da amostra, aplicado de uma vez a todos os valores
+    formato = _formato_provavel(textos[validos])
+    if formato:
+        datas[validos] = _aplicar_formato(textos[validos], formato)
+
+    # 3. Mês/ano em português (ex: fev/25), só entre os que sobraram
+    restantes = np.flatnonzero(validos & datas.isna().to_numpy())
+    if len(restantes):
+        minusculos = textos.iloc[restantes].str.lower()
+        pt = minusculos[minusculos.str.match(MES_ANO).to_numpy(dtype=bool, na_value=False)]
+        datas[pt.index] = pd.to_datetime(
+            "20" + pt.str[-2:] + "-" + pt.str[:3].map(MESES) + "-01",
+            format="%Y-%m-%d",
+            errors="coerce"
+        )
+
+    # 4. Segundo formato mais comum entre os que sobraram (ex: ISO misturado)
+    restantes = validos & datas.isna().to_numpy()
+    formato = _formato_provavel(textos[restantes]) if restantes.any() else None
+    if formato:
+        datas[restantes] = _aplicar_formato(textos[restantes], formato)
+
+    # 5. Sem formato reconhecível ("01/02/24", "Feb 2024"): valor a valor, só
+    #    nos que têm algum dígito. Fica depois do mês em português porque o
+    #    dateutil leria "jan/24" como 24 de janeiro do ano corrente
+    #    Uma amostra vem antes: coluna de texto solto não paga o parse de tudo
+    restantes = validos & datas.isna().to_numpy()
+    restantes &= textos.str.contains(r"\d").to_numpy(dtype=bool, na_value=False)
+    posicoes = np.flatnonzero(restantes)
+    if len(posicoes):
+        amostra = _datas_livres(textos.iloc[posicoes[:AMOSTRA_DATAS]])
+        datas.iloc[posicoes[:AMOSTRA_DATAS]] = amostra
+        if amostra.notna().any() and len(posicoes) > AMOSTRA_DATAS:
+            resto = posicoes[AMOSTRA_DATAS:]
+            datas.iloc[resto] = _datas_livres(textos.iloc[resto])
+
+    # 6. Células que já são datas (Excel com tipos misturados)
+    if ja_datas.any():
+        datas[ja_datas] = pd.to_datetime(unicos[ja_datas], errors="coerce")
+
+    tabela = np.append(datas.to_numpy(), np.datetime64("NaT", "ns"))
+    return pd.Series(tabela[codigos], index=series.index, name=series.name)
+
+
+# =========================
+# Planilha e indicadores do KPI
+# =========================
+
+# KPIs em que um valor menor é melhor (perdas, refugo...)
+PALAVRAS_MENOR_MELHOR = ["recovery", "perda", "perdas", "refugo", "scrap"]
+
+DATA_MINIMA = pd.Timestamp("2000-01-01")
+
+# Status guardado como código int8; os rótulos só entram na exibição
+SEM_DADO, DENTRO_META, FORA_META = 0, 1, 2
+ROTULOS_STATUS = ["⚪ Sem dado", "🟢 Dentro da meta", "🔴 Fora da meta"]
+
+
+def limpar_planilha(df): # Colunas vazias, linhas sem número/explicativas e nomes de colunas
+    # 1. Remove colunas totalmente vazias
+    limpo = df.dropna(axis=1, how="all")
+
+    # 2. Remove linhas sem nenhum número (texto solto do Excel) e
+    #    linhas explicativas tipo "Para lembrar", numa única varredura
+    limpo, linhas_removidas = limpar_linhas(limpo)
+
+    # Leitura em blocos já aplicou as regras: soma o que foi removido lá
+    for regra, qtd in df.attrs.get("linhas_removidas", {}).items():
+        linhas_removidas[regra] = linhas_removidas.get(regra, 0) + qtd
+
+    # 3. Limpa nomes de colunas
+    limpo.columns = limpar_nomes_colunas(limpo.columns)
+
+    dup_cols = limpo.columns[limpo.columns.duplicated()].tolist()
+    return limpo, linhas_removidas, dup_cols
+
+
+def limpar_nomes_colunas(colunas): # Sem espaços nas pontas e sem quebras de linha
+    return (
+        pd.Index(colunas)
+        .astype(str)
+        .str.strip()
+        .str.replace("\n", " ")
+        .str.strip()
+    )
+
+
+def colunas_tempo(colunas): # Candidatas a coluna de tempo, pelo nome
+    return [
+        c for c in colunas
+        if "data" in c.lower() or "mês" in c.lower() or "mes" in c.lower()
+    ]
+
+
+def colunas_kpi(df, time_col): # Colunas numéricas (ou texto só com números) fora a de tempo
+    return [
+        c for c in df.columns
+        if c != time_col and (df[c].dtype.kind in "iuf" or eh_coluna_numerica(df[c]))
+    ]
+
+
+def menor_e_melhor(kpi_col): # Detecção automática do tipo de KPI pelo nome
+    return any(key in kpi_col.lower() for key in PALAVRAS_MENOR_MELHOR)
+
+
+def meta_sugerida(valores, menor_melhor): # Máximo para perdas/recovery, média para o resto
+    valid_values = valores.dropna()
+    if valid_values.empty:
+        return 0.0
+    return valid_values.max() if menor_melhor else valid_values.mean()
+
+
+def fracao_para_percentual(valores): # Se a maioria dos valores estiver entre 0 e 1, assume fração
+    vals = valores.dropna()
+    if len(vals) == 0:
+        return valores, False
+
+    frac_ratio = ((vals >= 0) & (vals <= 1)).mean()
+    if frac_ratio >= 0.7:
+        return valores * 100, True
+    return valores, False
+
+
+def confiabilidade(valores): # (válidos, total, fração válida) de um KPI já numérico
+    total = len(valores)
+    validos = valores.notna().sum()
+    return validos, total, validos / total if total > 0 else 0
+
+
+def serie_temporal(kpi, datas, kpi_col, time_col): # KPI com datas válidas (>= 2000), ordenado
+    if datas is None:
+        return pd.DataFrame({kpi_col: kpi})
+
+    df = pd.DataFrame({time_col: datas, kpi_col: kpi})
+    return (
+        df
+        .dropna(subset=[time_col])
+        .loc[df[time_col] >= DATA_MINIMA]
+        .sort_values(time_col)
+    )
+
+
+# Janelas móveis: o estado guarda só os últimos JANELA_MAXIMA valores válidos
+# da série ordenada; todas as estatísticas saem dele, então mudar o tamanho
+# das janelas não relê a série e linhas novas só atualizam a cauda
+JANELA_MAXIMA = 256
+JANELAS_PADRAO = {
+    "operacional": 5,         # média móvel (KPI operacional)
+    "minimo_operacional": 3,  # mínimo de valores para a média móvel
+    "tendencia": 3,           # últimos N contra os N anteriores
+    "inclinacao": 10,         # reta dos últimos N valores
+    "ewma": 10,               # span da média exponencial
+}
+
+
+def _cauda_valida(valores, quantidade): # Últimos `quantidade` valores não-NaN, lendo só o fim do array
+    janela = quantidade * 2
+    while True:
+        cauda = valores[-janela:]
+        cauda = cauda[~np.isnan(cauda)]
+        if len(cauda) >= quantidade or janela >= len(valores):
+            return cauda[-quantidade:].copy()
+        janela *= 8
+
+
+def janelas_iniciar(valores): # Estado das janelas móveis de uma série já ordenada
+    arr = valores.to_numpy(dtype=float, na_value=np.nan)
+    return {
+        "ultimos": _cauda_valida(arr, JANELA_MAXIMA),
+        "validos": int(np.count_nonzero(~np.isnan(arr))),
+    }
+
+
+def janelas_anexar(estado, novos): # Novo estado com registros que vêm depois dos já vistos
+    arr = novos.to_numpy(dtype=float, na_value=np.nan)
+    arr = arr[~np.isnan(arr)]
+    return {
+        "ultimos": np.concatenate([estado["ultimos"], arr])[-JANELA_MAXIMA:],
+        "validos": estado["validos"] + len(arr),
+    }
+
+
+def estatisticas_moveis(estado, janelas=None): # Último valor, média móvel, EWMA, inclinação e tendência
+    """`janelas` sobrescreve JANELAS_PADRAO. O EWMA (adjust=False) usa os
+    últimos JANELA_MAXIMA valores: com span até 30, o que fica de fora pesa
+    menos de 1e-7.
+    """
+    j = {**JANELAS_PADRAO, **(janelas or {})}
+    if max(j["operacional"], 2 * j["tendencia"], j["inclinacao"]) > JANELA_MAXIMA:
+        raise ValueError(f"Janelas maiores que {JANELA_MAXIMA} valores não são suportadas")
+
+    u = estado["ultimos"]
+    resultado = {
+        "ultimo": u[-1] if len(u) else np.nan,
+        "media_movel": np.nan,
+        "ewma": np.nan,
+        "inclinacao": np.nan,
+        "tendencia": "→ Estável",
+    }
+    if len(u) == 0:
+        return resultado
+
+    operacional = u[-j["operacional"]:]
+    if len(operacional) >= j["minimo_operacional"]:
+        resultado["media_movel"] = operacional.mean()
+
+    alfa = 2 / (j["ewma"] + 1)
+    pesos = (1 - alfa) ** np.arange(len(u) - 1, -1, -1)
+    pesos[1:] *= alfa
+    resultado["ewma"] = float(pesos @ u)
+
+    reta = u[-j["inclinacao"]:]
+    if len(reta) >= 2:
+        resultado["inclinacao"] = np.polyfit(np.arange(len(reta)), reta, 1)[0]
+
+    n = j["tendencia"]
+    if len(u) >= 2 * n:
+        recente = u[-n:].mean()
+        anterior = u[-2 * n:-n].mean()
+        if recente > anterior:
+            resultado["tendencia"] = "↑ Melhorando"
+        elif recente < anterior:
+            resultado["tendencia"] = "↓ Piorando"
+    return resultado
+
+
+def kpi_operacional(valores, janela=5, minimo=3): # Média dos últimos valores válidos
+    janelas = {"operacional": janela, "minimo_operacional": minimo}
+    return estatisticas_moveis(janelas_iniciar(valores), janelas)["media_movel"]
+
+
+def tendencia(valores, janela=3): # Últimos N valores contra os N anteriores
+    return estatisticas_moveis(janelas_iniciar(valores), {"tendencia": janela})["tendencia"]
+
+
+def calcular_agregados(kpi, datas, serie, kpi_col, time_col, janelas=None): # Números dos cards e do diagnóstico
+    validos, total, conf = confiabilidade(kpi)
+
+    # KPI atual, operacional e tendência: uma leitura do fim da série ordenada
+    moveis = estatisticas_moveis(janelas_iniciar(serie[kpi_col]), janelas)
+
+    return {
+        "total": total,
+        "valid_kpi": validos,
+        "invalid_kpi": total - validos,
+        "confiabilidade": conf,
+        "valid_dates": datas.notna().sum() if datas is not None else None,
+        "kpi_atual": moveis["ultimo"],
+        "kpi_operacional": moveis["media_movel"],
+        "media": serie[kpi_col].mean(),
+        "minimo": serie[kpi_col].min(),
+        "tendencia": moveis["tendencia"],
+    }
+
+
+def status_kpi(kpi, meta, regra): # Código de status de cada registro, numa comparação só
+    valores = kpi.to_numpy(dtype=float, na_value=np.nan)
+    if regra == "Maior é melhor":
+        dentro = valores >= meta
+    else:
+        dentro = valores <= meta
+
+    codigos = np.where(dentro, DENTRO_META, FORA_META).astype(np.int8)
+    codigos[np.isnan(valores)] = SEM_DADO
+    return pd.Series(codigos, index=kpi.index, name="Status KPI")
+
+
+def rotulos_status(status): # Categórico com os rótulos, reaproveitando os códigos
+    return pd.Series(
+        pd.Categorical.from_codes(status.to_numpy(), categories=ROTULOS_STATUS),
+        index=status.index,
+        name=status.name
+    )
+
+
+def resumo_kpi(df, kpi_col, time_col=None, is_percent=True, meta=None, regra=None): # Mesmos números do dashboard, sem UI
+    """Calcula o resumo de um KPI numa planilha já limpa (`limpar_planilha`).
+
+    `meta` e `regra` seguem o dashboard quando omitidas: regra pelo nome da
+    coluna e meta sugerida a partir dos próprios valores.
+    """
+    if regra is None:
+        regra = "Menor é melhor" if menor_e_melhor(kpi_col) else "Maior é melhor"
+
+    kpi = df[kpi_col]
+    if kpi.dtype != "float64":
+        kpi = to_number(kpi)
+
+    convertido = False
+    if is_percent:
+        kpi, convertido = fracao_para_percentual(kpi)
+    sugerida = meta_sugerida(kpi, menor_e_melhor(kpi_col))
+
+    datas = parsear_datas(df[time_col]) if time_col else None
+    serie = serie_temporal(kpi, datas, kpi_col, time_col)
+    agregados = calcular_agregados(kpi, datas, serie, kpi_col, time_col)
+
+    meta = sugerida if meta is None else meta
+    status = status_kpi(kpi, meta, regra)
+
+    return {
+        "kpi": kpi_col,
+        "coluna_tempo": time_col,
+        "regra": regra,
+        "percentual": is_percent,
+        "convertido_de_fracao": convertido,
+        "meta": meta,
+        "meta_sugerida": sugerida,
+        **agregados,
+        "fora_meta": int((status == FORA_META).sum()),
+        "status_atual": ROTULOS_STATUS[status.iloc[-1] if len(status) else SEM_DADO],
+    }
+
+
+# =========================
+# Matriz de KPIs (todas as colunas de uma vez)
+# =========================
+
+REGRAS_KPI = ["Maior é melhor", "Menor é melhor"]
+
+# Colunas convertidas por vez: limita a matriz float64 em memória
+# (1M linhas x 16 colunas = 128 MB)
+BLOCO_COLUNAS = 16
+
+COLUNAS_MATRIZ = [
+    "KPI", "KPI atual", "Média", "Mínimo", "Tendência", "Confiabilidade",
+    "Fora da meta", "Meta", "Regra", "Status", "Convertido de fração",
+]
+
+
+def carregar_metas(caminho): # Metas/regras por coluna de um JSON; sem arquivo, dicionário vazio
+    """Formato: {"OEE (%)": {"meta": 85, "regra": "Maior é melhor", "percentual": true}}.
+
+    Todas as chaves de cada coluna são opcionais; o que faltar segue a
+    detecção automática do dashboard.
+    """
+    if not caminho or not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, encoding="utf-8") as f:
+        metas = json.load(f)
+
+    for coluna, config in metas.items():
+        if not isinstance(config, dict):
+            raise ValueError(f"{caminho}: a coluna '{coluna}' deve ter um objeto com meta/regra")
+        if config.get("regra", REGRAS_KPI[0]) not in REGRAS_KPI:
+            raise ValueError(f"{caminho}: regra inválida para '{coluna}': {config['regra']}")
+    return metas
+
+
+def numeros_em_lote(df, colunas): # Matriz float64 (linhas x colunas); textos num parse só
+    # Ordem de coluna (Fortran): cada KPI fica contíguo para as reduções
+    matriz = np.empty((len(df), len(colunas)), order="F")
+    textos = []
+    for j, coluna in enumerate(colunas):
+        # Colunas já numéricas entram direto, como em `resumo_kpi`
+        if df[coluna].dtype.kind in "iuf":
+            matriz[:, j] = df[coluna].to_numpy(dtype=float, na_value=np.nan)
+        else:
+            textos.append(j)
+
+    # Colunas de texto empilhadas: valores repetidos entre colunas também
+    # são convertidos uma única vez (ver `to_number`)
+    if textos:
+        empilhado = pd.concat(
+            [df[colunas[j]].astype(object) for j in textos], ignore_index=True
+        )
+        matriz[:, textos] = to_number(empilhado).to_numpy().reshape(len(textos), len(df)).T
+    return matriz
+
+
+def _ultimos_validos(x, ordem, qtd, quantidade): # Últimos valores válidos de cada coluna, do mais recente para trás
+    """Matriz (quantidade x colunas), NaN onde a coluna tem menos valores.
+
+    Olha só o fim da série (na `ordem` dada) e aumenta a janela enquanto
+    faltar valor para alguma coluna que tenha valores suficientes (`qtd`).
+    """
+    linhas = np.arange(len(x)) if ordem is None else ordem
+    janela = 64
+    while True:
+        cauda = x[linhas[-janela:]][::-1]
+        validos = ~np.isnan(cauda)
+        if janela >= len(linhas) or (validos.sum(axis=0) >= np.minimum(quantidade, qtd)).all():
+            break
+        janela *= 8
+
+    posicao = np.cumsum(validos, axis=0)
+    ultimos = np.full((quantidade, x.shape[1]), np.nan)
+    i, j = np.nonzero(validos & (posicao <= quantidade))
+    ultimos[posicao[i, j] - 1, j] = cauda[i, j]
+    return ultimos
+
+
+def matriz_kpis(df, colunas, datas=None, metas=None): # Resumo de todas as colunas numa passada por bloco
+    """Uma linha por coluna de KPI com os números do dashboard: KPI atual,
+    média, mínimo, tendência, confiabilidade e registros fora da meta.
+
+    Segue as mesmas regras de `resumo_kpi` (fração vira %, meta sugerida,
+    datas válidas >= 2000 para atual/média/tendência), mas com operações em
+    matriz em vez de uma coluna por vez. O status é o do KPI atual.
+    `metas` vem de `carregar_metas`.
+    """
+    metas = metas or {}
+
+    # Ordem temporal (datas válidas), compartilhada por todas as colunas
+    ordem = com_data = None
+    if datas is not None:
+        valores_datas = datas.to_numpy(dtype="datetime64[ns]")
+        com_data = ~np.isnat(valores_datas) & (valores_datas >= np.datetime64(DATA_MINIMA))
+        posicoes = np.flatnonzero(com_data)
+        ordem = posicoes[np.argsort(valores_datas[posicoes], kind="stable")]
+        if com_data.all():
+            com_data = None
+
+    blocos = []
+    for inicio in range(0, len(colunas), BLOCO_COLUNAS):
+        bloco = list(colunas[inicio:inicio + BLOCO_COLUNAS])
+        config = [metas.get(c, {}) for c in bloco]
+        x = numeros_em_lote(df, bloco)
+        qtd_validos = (~np.isnan(x)).sum(axis=0)
+
+        # Fração -> % quando a maioria dos valores está entre 0 e 1
+        percentual = np.array([cfg.get("percentual", True) for cfg in config], dtype=bool)
+        fracao = ((x >= 0) & (x <= 1)).sum(axis=0) / np.maximum(qtd_validos, 1)
+        converter = percentual & (qtd_validos > 0) & (fracao >= 0.7)
+        for j in np.flatnonzero(converter):
+            x[:, j] *= 100
+
+        # Regra e meta: arquivo de metas, senão pelo nome e meta sugerida
+        regras = [
+            cfg.get("regra") or ("Menor é melhor" if menor_e_melhor(c) else REGRAS_KPI[0])
+            for c, cfg in zip(bloco, config)
+        ]
+        maior = np.array(regras) == REGRAS_KPI[0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sugerida = np.where(
+                [menor_e_melhor(c) for c in bloco],
+                np.fmax.reduce(x, axis=0),
+                np.nansum(x, axis=0) / qtd_validos
+            )
+        sugerida[qtd_validos == 0] = 0.0
+        meta = np.array([cfg.get("meta", np.nan) for cfg in config], dtype=float)
+        meta = np.where(np.isnan(meta), sugerida, meta)
+
+        # NaN nunca passa na comparação: só valores válidos contam
+        fora = np.array([
+            np.count_nonzero(x[:, j] < meta[j] if maior[j] else x[:, j] > meta[j])
+            for j in range(len(bloco))
+        ])
+
+        # Média e mínimo só das datas válidas; atual e tendência pela ordem do tempo
+        xt = x if com_data is None else x[com_data]
+        qtd = (~np.isnan(xt)).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = np.nansum(xt, axis=0) / qtd
+        minimo = np.fmin.reduce(xt, axis=0) if len(xt) else np.full(len(bloco), np.nan)
+
+        ultimos = _ultimos_validos(x, ordem, qtd, 6)
+        atual = ultimos[0]
+        recente = ultimos[:3].mean(axis=0)
+        anterior = ultimos[3:].mean(axis=0)
+        tendencias = np.select(
+            [(qtd >= 6) & (recente > anterior), (qtd >= 6) & (recente < anterior)],
+            ["↑ Melhorando", "↓ Piorando"],
+            "→ Estável"
+        )
+
+        status = np.where(
+            np.isnan(atual), SEM_DADO,
+            np.where(np.where(maior, atual >= meta, atual <= meta), DENTRO_META, FORA_META)
+        )
+
+        blocos.append(pd.DataFrame({
+            "KPI": bloco,
+            "KPI atual": atual,
+            "Média": media,
+            "Mínimo": minimo,
+            "Tendência": tendencias,
+            "Confiabilidade": qtd_validos / max(len(df), 1),
+            "Fora da meta": fora,
+            "Meta": meta,
+            "Regra": regras,
+            "Status": [ROTULOS_STATUS[s] for s in status],
+            "Convertido de fração": converter,
+        }))
+
+    if not blocos:
+        return pd.DataFrame(columns=COLUNAS_MATRIZ)
+    return pd.concat(blocos, ignore_index=True)
+
+
+# =========================
+# KPI por segmento (linha, máquina, turno)
+# =========================
+
+PALAVRAS_SEGMENTO = ["linha", "máquina", "maquina", "turno", "equipamento", "setor"]
+
+
+def colunas_segmento(df, excluir): # Candidatas a segmento: pelo nome primeiro, depois categóricas
+    por_nome = [
+        c for c in df.columns
+        if c not in excluir and any(p in c.lower() for p in PALAVRAS_SEGMENTO)
+    ]
+    categoricas = [
+        c for c in df.columns
+        if c not in excluir and c not in por_nome and isinstance(df[c].dtype, pd.CategoricalDtype)
+    ]
+    return por_nome + categoricas
+
+
+def kpi_por_segmento(kpi, segmentos, datas=None, janelas=None): # Números executivos de cada segmento, sem laço por segmento
+    """Ordena os registros válidos por (segmento, tempo) uma vez e tira tudo
+    com `bincount`: KPI atual, operacional (últimos N), média, tendência e
+    confiabilidade, com as mesmas regras e `janelas` de `calcular_agregados`.
+
+    Devolve o resumo (uma linha por segmento) e a ordenação usada: as
+    posições de cada segmento ficam contíguas em `ordem[limites[i]:limites[i + 1]]`,
+    o que serve para desenhar a série de cada um sem outro groupby.
+    """
+    j = {**JANELAS_PADRAO, **(janelas or {})}
+    codigos, nomes = pd.factorize(segmentos, sort=True)
+    valores = kpi.to_numpy(dtype=float, na_value=np.nan)
+    k = len(nomes)
+
+    no_segmento = codigos >= 0
+    total = np.bincount(codigos[no_segmento], minlength=k)
+    validos = np.bincount(codigos[no_segmento & ~np.isnan(valores)], minlength=k)
+
+    # Série de cada segmento: KPI válido e, com tempo, datas válidas em ordem
+    usar = no_segmento & ~np.isnan(valores)
+    if datas is not None:
+        tempos = datas.to_numpy(dtype="datetime64[ns]")
+        usar &= ~np.isnat(tempos) & (tempos >= np.datetime64(DATA_MINIMA))
+        posicoes = np.flatnonzero(usar)
+        ordem = posicoes[np.lexsort((tempos[posicoes], codigos[posicoes]))]
+    else:
+        posicoes = np.flatnonzero(usar)
+        ordem = posicoes[np.argsort(codigos[posicoes], kind="stable")]
+
+    cod = codigos[ordem]
+    y = valores[ordem]
+    qtd = np.bincount(cod, minlength=k)
+    limites = np.concatenate([[0], np.cumsum(qtd)])
+
+    # 1 = último registro do segmento, 2 = penúltimo...
+    do_fim = limites[cod + 1] - np.arange(len(cod))
+
+    def soma(mascara): # Soma do KPI por segmento só nas posições marcadas
+        return np.bincount(cod[mascara], weights=y[mascara], minlength=k)
+
+    atual = np.full(k, np.nan)
+    atual[cod[do_fim == 1]] = y[do_fim == 1]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = j["operacional"]
+        operacional = np.where(
+            qtd >= j["minimo_operacional"], soma(do_fim <= n) / np.minimum(qtd, n), np.nan
+        )
+        media = soma(np.ones(len(cod), dtype=bool)) / qtd
+        n = j["tendencia"]
+        recente = soma(do_fim <= n) / n
+        anterior = soma((do_fim > n) & (do_fim <= 2 * n)) / n
+        confiabilidade = validos / total
+
+    tendencias = np.select(
+        [(qtd >= 2 * n) & (recente > anterior), (qtd >= 2 * n) & (recente < anterior)],
+        ["↑ Melhorando", "↓ Piorando"],
+        "→ Estável"
+    )
+
+    resumo = pd.DataFrame(
+        {
+            "Registros": total,
+            "KPI atual": atual,
+            "KPI operacional": operacional,
+            "Média": media,
+            "Tendência": tendencias,
+            "Confiabilidade": confiabilidade,
+        },
+        index=pd.Index(nomes, name=segmentos.name),
+    )
+    return {"resumo": resumo, "codigos": codigos, "ordem": ordem, "limites": limites}
+
+
+def fora_meta_por_segmento(segmentado, status, meta, regra): # Resumo por segmento com fora da meta e status atual
+    codigos = segmentado["codigos"]
+    no_segmento = codigos >= 0
+    resumo = segmentado["resumo"]
+    fora = np.bincount(
+        codigos[no_segmento],
+        weights=(status.to_numpy() == FORA_META)[no_segmento],
+        minlength=len(resumo)
+    )
+    return resumo.assign(**{
+        "Fora da meta": fora.astype(np.int64),
+        "Status": rotulos_status(status_kpi(resumo["KPI atual"], meta, regra)),
+    })
+
+
+# =========================
+# Agregados por período (rollups)
+# =========================
+
+GRANULARIDADES = ["Hora", "Turno", "Dia", "Semana", "Mês"]
+
+# Turnos de HORAS_TURNO horas a partir de INICIO_TURNO (06-14, 14-22, 22-06);
+# o turno da noite pertence ao dia em que começou
+INICIO_TURNO = 6
+HORAS_TURNO = 8
+
+
+def inicio_periodo(horas, granularidade): # Início do período de cada hora (DatetimeIndex)
+    if granularidade == "Hora":
+        return horas
+    if granularidade == "Dia":
+        return horas.normalize()
+    if granularidade == "Semana":
+        return (horas - pd.to_timedelta(horas.dayofweek, unit="D")).normalize()
+    if granularidade == "Mês":
+        return horas.to_period("M").to_timestamp()
+    if granularidade == "Turno":
+        deslocadas = horas - pd.Timedelta(hours=INICIO_TURNO)
+        turno = (deslocadas.hour // HORAS_TURNO) * HORAS_TURNO
+        return (
+            deslocadas.normalize()
+            + pd.Timedelta(hours=INICIO_TURNO)
+            + pd.to_timedelta(turno, unit="h")
+        )
+    raise ValueError(f"Granularidade desconhecida: {granularidade}")
+
+
+def calcular_rollups(kpi, datas): # Média, mínimo, máximo e contagem por período, num groupby só
+    """Agrega o KPI por hora numa única passada e monta turno, dia, semana
+    e mês a partir dos parciais por hora (tabelas pequenas).
+
+    Usa as mesmas datas válidas da série temporal (>= 2000). Além das
+    tabelas, guarda o código da hora de cada registro, para que a contagem
+    fora da meta (`fora_meta_por_periodo`) não precise de outro groupby.
+    """
+    horas = datas.dt.floor("h").where(datas >= DATA_MINIMA)
+    codigos, unicas = pd.factorize(horas, sort=True)
+    unicas = pd.DatetimeIndex(unicas)
+
+    validos = codigos >= 0
+    parciais = (
+        pd.Series(kpi.to_numpy(dtype=float, na_value=np.nan)[validos])
+        .groupby(codigos[validos])
+        .agg(["sum", "count", "min", "max"])
+        .reindex(np.arange(len(unicas)))
+    )
+    parciais.index = unicas
+
+    tabelas, mapas = {}, {}
+    for granularidade in GRANULARIDADES:
+        periodos = inicio_periodo(unicas, granularidade)
+        agregado = parciais.groupby(periodos).agg(
+            soma=("sum", "sum"),
+            contagem=("count", "sum"),
+            minimo=("min", "min"),
+            maximo=("max", "max"),
+        )
+        agregado["media"] = agregado["soma"] / agregado["contagem"].where(agregado["contagem"] > 0)
+        agregado.index.name = "Período"
+
+        tabelas[granularidade] = agregado[["media", "minimo", "maximo", "contagem"]]
+        mapas[granularidade] = agregado.index.get_indexer(periodos)
+
+    return {"tabelas": tabelas, "codigos": codigos, "mapas": mapas}
+
+
+def fora_meta_por_periodo(rollups, status): # Tabelas dos rollups com a contagem fora da meta
+    """`status` são os códigos de `status_kpi`, alinhados com o KPI usado
+    em `calcular_rollups`. Recalcula só isto quando meta ou regra mudam."""
+    codigos = rollups["codigos"]
+    validos = codigos >= 0
+    fora = (status.to_numpy() == FORA_META)[validos]
+    fora_hora = np.bincount(codigos[validos], weights=fora, minlength=len(rollups["mapas"]["Hora"]))
+
+    tabelas = {}
+    for granularidade, tabela in rollups["tabelas"].items():
+        fora_periodo = np.bincount(
+            rollups["mapas"][granularidade], weights=fora_hora, minlength=len(tabela)
+        )
+        tabelas[granularidade] = tabela.assign(fora_meta=fora_periodo.astype(np.int64))
+    return tabelas
+
+
+def cards_por_periodo(tabela, meta, regra, janelas=None): # Janelas móveis e status a partir de um rollup
+    moveis = estatisticas_moveis(janelas_iniciar(tabela["media"]), janelas)
+    status = status_kpi(pd.Series([moveis["ultimo"]]), meta, regra)
+    return {**moveis, "status": status.iloc[0]}
+
+
+# =========================
+# Série contínua (arquivos que só crescem)
+# =========================
+
+def serie_continua(percentual=True): # Estado vazio: tempos e valores ordenados, em buffers que dobram de tamanho
+    return {
+        "tempos": np.empty(1024, dtype="datetime64[ns]"),
+        "valores": np.empty(1024),
+        "n": 0,
+        "registros": 0,
+        "validos": 0,
+        "escala": None if percentual else 1.0,
+        "janelas": {"ultimos": np.empty(0), "validos": 0},
+        "fora": None,
+    }
+
+
+def anexar_serie(estado, kpi, datas): # Junta registros novos à série; custo proporcional aos novos
+    """Altera `estado` no lugar e o devolve. `kpi` já numérico (`to_number`),
+    `datas` já convertidas (`parsear_datas`).
+
+    Em KPI percentual, a escala (fração -> %) é decidida no primeiro lote
+    com valores e mantida.
+    Registros que chegam em ordem (o caso normal de uma exportação) só
+    escrevem no fim dos buffers; um lote com datas anteriores às já vistas
+    é intercalado e refaz janelas e contagens, o que custa a série toda.
+    """
+    valores = kpi.to_numpy(dtype=float, na_value=np.nan)
+    tempos = datas.to_numpy(dtype="datetime64[ns]")
+    estado["registros"] += len(valores)
+    estado["validos"] += int(np.count_nonzero(~np.isnan(valores)))
+
+    if estado["escala"] is None and (~np.isnan(valores)).any():
+        _, convertido = fracao_para_percentual(pd.Series(valores))
+        estado["escala"] = 100.0 if convertido else 1.0
+    if estado["escala"] not in (None, 1.0):
+        valores = valores * estado["escala"]
+
+    # Só entram na série registros com KPI e data válidos (>= 2000)
+    usar = ~np.isnan(valores) & ~np.isnat(tempos) & (tempos >= np.datetime64(DATA_MINIMA))
+    ordem = np.flatnonzero(usar)
+    ordem = ordem[np.argsort(tempos[ordem], kind="stable")]
+    novos_t, novos_v = tempos[ordem], valores[ordem]
+    if len(ordem) == 0:
+        return estado
+
+    n = estado["n"]
+    if n == 0 or novos_t[0] >= estado["tempos"][n - 1]:
+        if n + len(ordem) > len(estado["valores"]):
+            capacidade = max(2 * len(estado["valores"]), n + len(ordem))
+            for campo in ("tempos", "valores"):
+                maior = np.empty(capacidade, dtype=estado[campo].dtype)
+                maior[:n] = estado[campo][:n]
+                estado[campo] = maior
+        estado["tempos"][n:n + len(ordem)] = novos_t
+        estado["valores"][n:n + len(ordem)] = novos_v
+        estado["n"] = n + len(ordem)
+        estado["janelas"] = janelas_anexar(estado["janelas"], pd.Series(novos_v))
+    else:
+        posicoes = np.searchsorted(estado["tempos"][:n], novos_t, side="right")
+        estado["tempos"] = np.insert(estado["tempos"][:n], posicoes, novos_t)
+        estado["valores"] = np.insert(estado["valores"][:n], posicoes, novos_v)
+        estado["n"] = len(estado["valores"])
+        estado["janelas"] = janelas_iniciar(pd.Series(estado["valores"]))
+        estado["fora"] = None
+    return estado
+
+
+def fora_meta_continua(estado, meta, regra): # Registros fora da meta, contando só o que chegou desde a última vez
+    n = estado["n"]
+    fora = estado["fora"]
+    if fora is None or fora["chave"] != (meta, regra):
+        fora = {"chave": (meta, regra), "contagem": 0, "n": 0}
+
+    novos = estado["valores"][fora["n"]:n]
+    fora["contagem"] += int(np.count_nonzero(novos < meta if regra == "Maior é melhor" else novos > meta))
+    fora["n"] = n
+    estado["fora"] = fora
+    return fora["contagem"]
+
+
+# =========================
+# Redução de séries para gráficos
+# =========================
+
+def _lttb(x, y, alvo): # Largest-Triangle-Three-Buckets: mantém picos, vales e a forma da curva
+    n = len(x)
+    bordas = np.linspace(1, n - 1, alvo - 1).astype(np.int64)
+    escolhidos = np.empty(alvo, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+
+    anterior = 0
+    for i in range(alvo - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+
+        # Média do balde seguinte (o último balde "vê" só o ponto final)
+        prox_fim = bordas[i + 2] if i + 2 < len(bordas) else n
+        media_x = x[fim:prox_fim].mean()
+        media_y = y[fim:prox_fim].mean()
+
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = anterior
+
+    return escolhidos
+
+
+def _minmax(y, alvo): # Mínimo e máximo de cada balde (mais as pontas), na ordem original
+    n = len(y)
+    inicios = np.linspace(0, n, alvo // 2 + 1).astype(np.int64)[:-1]
+    baldes = np.repeat(np.arange(len(inicios)), np.diff(np.append(inicios, n)))
+
+    escolhidos = []
+    for extremo in (np.minimum, np.maximum):
+        valores = extremo.reduceat(y, inicios)
+        casou = np.flatnonzero(y == valores[baldes])
+        _, primeiro = np.unique(baldes[casou], return_index=True)
+        escolhidos.append(casou[primeiro])
+
+    # Primeiro e último pontos sempre entram, para o eixo x não encolher
+    return np.unique(np.concatenate(escolhidos + [np.array([0, n - 1])]))
+
+
+METODOS_REDUCAO = {"lttb": _lttb, "minmax": lambda x, y, alvo: _minmax(y, alvo)}
+
+
+def reduzir_serie(x, y, alvo, metodo="lttb"): # Posições de até `alvo` pontos que preservam a forma da série
+    """`x` e `y` ordenados por `x` e sem NaN (datas podem vir como datetime64).
+
+    Séries com até `alvo` pontos voltam inteiras.
+    """
+    x = np.asarray(x)
+    if x.dtype.kind == "M":
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    if len(x) <= max(alvo, 2):
+        return np.arange(len(x))
+    return METODOS_REDUCAO[metodo](x, y, max(alvo, 3))
@@ -0,0 +1,19 @@
+import pandas as pd
+import pytest
+
+from ingestion import ARMAZEM_DISPONIVEL, ArmazemDatasets
+
+pytestmark = pytest.mark.skipif(not ARMAZEM_DISPONIVEL, reason="armazém precisa do pyarrow")
+
+
+def test_nomes_que_viram_o_mesmo_texto_nao_se_sobrescrevem(tmp_path):
+    armazem = ArmazemDatasets(str(tmp_path))
+    armazem.salvar("linha A.csv", pd.DataFrame({"OEE": [1.0]}))
+    armazem.salvar("linha_A.csv", pd.DataFrame({"OEE": [2.0]}))
+
+    assert [m["nome"] for m in armazem.listar()] == ["linha A.csv", "linha_A.csv"]
+    assert armazem.abrir("linha A.csv")["OEE"].tolist() == [1.0]
+    assert armazem.abrir("linha_A.csv")["OEE"].tolist() == [2.0]
+
+    armazem.remover("linha A.csv")
+    assert [m["nome"] for m in armazem.listar()] == ["linha_A.csv"]
@@ -0,0 +1,28 @@
+import io
+
+import pandas as pd
+import pytest
+
+from ingestion import ler_upload
+
+PLANILHA = pd.DataFrame({
+    "Data": ["01/01/2024", "02/01/2024"],
+    " OEE (%) ": ["85", "90"],
+    "Perdas": ["1", "2"],
+    "Obs": ["a", "b"],
+})
+
+
+@pytest.mark.parametrize("nome,em_blocos", [("linha.csv", False), ("linha.csv", True), ("linha.xlsx", False)])
+@pytest.mark.parametrize("colunas", [["OEE (%)", "Data"], lambda nome: nome == "OEE (%)" or "data" in nome.lower()])
+def test_le_so_as_colunas_pedidas(nome, em_blocos, colunas):
+    if nome.endswith(".csv"):
+        dados = PLANILHA.to_csv(index=False, sep=";").encode()
+    else:
+        saida = io.BytesIO()
+        PLANILHA.to_excel(saida, index=False)
+        dados = saida.getvalue()
+
+    df = ler_upload(nome, dados, em_blocos=em_blocos, colunas=colunas)
+    assert list(df.columns) == ["Data", "OEE (%)"]
+    assert df["OEE (%)"].tolist() == [85, 90]
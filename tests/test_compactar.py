@@ -0,0 +1,62 @@
+import io
+
+import pandas as pd
+import pytest
+
+import ingestion
+from ingestion import compactar, ler_csv_em_blocos, ler_upload
+from kpi_engine import to_number
+
+
+def planilha(linhas=30, erro_em=25): # CSV com KPI que tem um "erro" no fim, código com zeros e número puro
+    texto = ["Data;OEE (%);Código;Perdas;Turno"]
+    for i in range(linhas):
+        oee = "erro" if i == erro_em else f"0,8{i % 10}"
+        texto.append(f"{i % 28 + 1:02d}/01/2024;{oee};{i:05d};{i * 1.5};{'AB'[i % 2]}")
+    return "\n".join(texto).encode()
+
+
+@pytest.mark.parametrize("ler", [
+    lambda dados: ler_upload("linha.csv", dados),
+    lambda dados: ler_csv_em_blocos(io.BytesIO(dados), 1000),
+    # O "erro" só aparece no terceiro bloco, depois de a coluna ser tratada como número
+    lambda dados: ler_csv_em_blocos(io.BytesIO(dados), 10),
+], ids=["inteiro", "um bloco", "varios blocos"])
+def test_texto_e_codigos_nao_viram_numero(ler):
+    df = ler(planilha())
+
+    assert df["Perdas"].dtype.kind == "f"
+    assert df["Código"].dtype.kind == "O" and df["Código"].iloc[7] == "00007"
+    # O token inválido continua guardado; a análise é que vira NaN
+    assert df["OEE (%)"].astype(object).iloc[25] == "erro"
+    assert to_number(df["OEE (%)"]).iloc[:3].tolist() == [0.80, 0.81, 0.82]
+    assert len(df) == 30
+
+
+def test_coluna_so_com_numeros_vira_numero():
+    df = ler_upload("linha.csv", planilha(erro_em=None))
+    assert df["OEE (%)"].dtype.kind == "f"
+    assert df["OEE (%)"].iloc[1] == pytest.approx(0.81)
+
+
+def test_coluna_de_tempo_com_fuso_vira_data():
+    dados = b"Data;OEE\n2024-01-05T10:00:00Z;0,85\n2024-01-06T10:00:00-03:00;0,9\n"
+    df = ler_upload("linha.csv", dados)
+    assert df["Data"].tolist() == [pd.Timestamp("2024-01-05 10:00"), pd.Timestamp("2024-01-06 13:00")]
+
+
+def test_coluna_de_tempo_que_nao_parseia_fica_como_texto():
+    linhas = ["Data;OEE"] + [f"{'05/01/2024' if i == 0 else f'turno {i % 3}'};0,{i % 10}" for i in range(30)]
+    df = ler_upload("linha.csv", "\n".join(linhas).encode())
+    assert df["Data"].dtype.kind != "M"
+    assert df["Data"].astype(object).tolist()[:2] == ["05/01/2024", "turno 1"]
+
+
+def test_erro_no_parse_de_datas_nao_derruba_a_leitura(monkeypatch):
+    def falha(serie):
+        raise TypeError("datas com fuso")
+
+    monkeypatch.setattr(ingestion, "parsear_datas", falha)
+    df = compactar(pd.DataFrame({"Data": ["2024-01-05T10:00:00Z"] * 4, "OEE": ["0,85"] * 4}, dtype=object))
+    assert df["Data"].astype(object).tolist() == ["2024-01-05T10:00:00Z"] * 4
+    assert df["OEE"].dtype.kind == "f"
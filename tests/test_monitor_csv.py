@@ -0,0 +1,104 @@
+import subprocess
+import sys
+
+from ingestion import MonitorCsv
+
+# Simula o CLP: anexa linhas completas escrevendo cada uma em dois pedaços
+# e termina com uma linha pela metade (sem quebra de linha)
+ESCRITOR = r"""
+import sys
+caminho, inicio, total, parcial = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), sys.argv[4]
+with open(caminho, "a", encoding="utf-8") as f:
+    if f.tell() == 0:
+        f.write("Data;OEE (%);Turno\n")
+    for i in range(inicio, inicio + total):
+        linha = f"{i:06d};{i % 100},5;{'ABC'[i % 3]}\n"
+        f.write(linha[:4]); f.flush(); f.write(linha[4:]); f.flush()
+    f.write(parcial)
+"""
+
+
+def escrever(caminho, inicio, total, parcial=""): # Roda o escritor em outro processo
+    return subprocess.Popen([sys.executable, "-c", ESCRITOR, str(caminho), str(inicio), str(total), parcial])
+
+
+def ler_tudo(monitor, processo): # Lê enquanto o escritor roda e uma última vez depois que ele termina
+    partes = []
+    while processo.poll() is None:
+        novas, reiniciado = monitor.novas_linhas()
+        assert not reiniciado
+        partes.append(novas)
+    assert processo.returncode == 0
+    novas, reiniciado = monitor.novas_linhas()
+    assert not reiniciado
+    partes.append(novas)
+    return [valor for parte in partes if not parte.empty for valor in parte["Data"]]
+
+
+def test_linhas_anexadas_linha_parcial_e_truncamento(tmp_path):
+    caminho = tmp_path / "linha.csv"
+    monitor = MonitorCsv(str(caminho))
+
+    # Sem arquivo ainda: nada a ler
+    novas, reiniciado = monitor.novas_linhas()
+    assert novas.empty and not reiniciado
+
+    # Todas as linhas completas chegam uma única vez, em ordem; a parcial fica para depois
+    datas = ler_tudo(monitor, escrever(caminho, 0, 2000, "002000;4"))
+    assert datas == [f"{i:06d}" for i in range(2000)]
+    assert monitor.avisos == []
+
+    novas, reiniciado = monitor.novas_linhas()
+    assert novas.empty and not reiniciado
+
+    # O resto da linha parcial completa a linha, sem duplicar nem perder nada
+    with open(caminho, "a", encoding="utf-8") as f:
+        f.write("2,5;C\n")
+    novas, reiniciado = monitor.novas_linhas()
+    assert not reiniciado
+    assert novas["Data"].tolist() == ["002000"]
+    assert novas["OEE (%)"].tolist() == ["42,5"]
+
+    # Mais linhas depois da parcial continuam de onde parou
+    datas = ler_tudo(monitor, escrever(caminho, 2001, 500))
+    assert datas == [f"{i:06d}" for i in range(2001, 2501)]
+
+    # Arquivo truncado e reescrito (ex.: rotação do CLP): relê do começo
+    caminho.write_text("", encoding="utf-8")
+    processo = escrever(caminho, 0, 10, "000010;1")
+    assert processo.wait() == 0
+    novas, reiniciado = monitor.novas_linhas()
+    assert reiniciado
+    assert novas["Data"].tolist() == [f"{i:06d}" for i in range(10)]
+    assert list(novas.columns) == ["Data", "OEE (%)", "Turno"]
+
+    novas, reiniciado = monitor.novas_linhas()
+    assert novas.empty and not reiniciado
+
+
+def test_linhas_latin1_e_invalidas_nao_travam_o_monitor(tmp_path):
+    caminho = tmp_path / "linha.csv"
+    caminho.write_bytes(b"Data;Turno\n000001;A\n")
+    monitor = MonitorCsv(str(caminho))
+    assert monitor.novas_linhas()[0]["Turno"].tolist() == ["A"]
+
+    # Arquivo começou em ASCII (detectado como utf-8) e recebe uma linha latin-1
+    with open(caminho, "ab") as f:
+        f.write("000002;Manutenção\n".encode("latin-1"))
+    novas, _ = monitor.novas_linhas()
+    assert novas["Turno"].tolist() == ["Manutenção"]
+    assert monitor.avisos == []
+
+    # Linha com campos a mais e aspas sem fechar: descartadas, o resto segue
+    with open(caminho, "ab") as f:
+        f.write(b'000003;B;x;y\n000004;C\n000005;"D\n')
+    novas, _ = monitor.novas_linhas()
+    assert novas["Data"].tolist() == ["000004"]
+    assert len(monitor.avisos) == 1
+    assert [linha for _, linha in monitor.descartadas] == ["000003;B;x;y", '000005;"D']
+
+    with open(caminho, "ab") as f:
+        f.write(b"000006;A\n")
+    novas, _ = monitor.novas_linhas()
+    assert novas["Data"].tolist() == ["000006"]
+    assert monitor.avisos == []
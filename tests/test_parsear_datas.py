@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpi_engine import parsear_datas
+
+# A referência (pd.to_datetime sem formato) avisa que caiu no dateutil
+pytestmark = pytest.mark.filterwarnings("ignore:Could not infer format")
+
+
+def datas_original(serie): # Tratamento de tempo original (app.py do commit 15df069), como referência
+    # Remove números puros que viram epoch (1970)
+    textos = serie.apply(lambda x: np.nan if str(x).strip().isdigit() else x)
+    # Conversão para datetime
+    serie = pd.to_datetime(textos, errors="coerce", dayfirst=True)
+
+    # Tentativa 2: formato mês/ano em português (ex: fev/25)
+    if serie.isna().all():
+        meses = {
+            "jan": "01", "fev": "02", "mar": "03", "abr": "04",
+            "mai": "05", "jun": "06", "jul": "07", "ago": "08",
+            "set": "09", "out": "10", "nov": "11", "dez": "12"
+        }
+
+        def parse_mes_ano(val):
+            if pd.isna(val):
+                return pd.NaT
+            s = str(val).lower().strip()
+            for m, num in meses.items():
+                if s.startswith(m):
+                    return pd.to_datetime(f"20{s[-2:]}-{num}-01", errors="coerce")
+            return pd.NaT
+
+        # O original aplicava à coluna já convertida (só NaT), então esta
+        # tentativa nunca achava nada; aqui ela recebe o texto, como pretendido
+        serie = textos.apply(parse_mes_ano)
+    return serie
+
+
+def sem_fuso(serie): # parsear_datas guarda datas com fuso em UTC, sem o fuso
+    serie = pd.to_datetime(serie)
+    if serie.dt.tz is not None:
+        serie = serie.dt.tz_convert(None)
+    return serie.astype("datetime64[ns]")
+
+
+CASOS = {
+    "dd/mm/aaaa hh:mm": ["05/01/2024 10:30", "15/03/2024 23:59", "01/12/2023 00:00"],
+    "dd/mm/aa": ["01/02/24", "15/03/24", "31/12/23"],
+    "sem zero à esquerda": ["5/1/2024", "15/3/2024"],
+    "frações de segundo": ["05/01/2024 10:00:00.5", "05/01/2024 10:00:01.25"],
+    "epoch": ["1704067200", "1704153600"],
+    "mês por extenso": ["Jan 2024", "Feb 2024", "Mar 2024"],
+    "fev/25": ["fev/25", "abr/25", "set/24", "out/24"],
+    "lixo misturado": ["05/01/2024", "erro", "", "--", None, "15/03/2024"],
+}
+
+# Ano na frente: o original, com dayfirst=True, trocava dia e mês
+# ("2024-01-05" virava 1º de maio); a referência aqui é o ISO 8601
+CASOS_ISO = {
+    "ISO data": ["2024-01-05", "2024-03-15"],
+    "ISO com T": ["2024-01-05T10:00:00", "2024-03-15T11:30:00"],
+    "ISO com Z": ["2024-01-05T10:00:00Z", "2024-03-15T11:30:00Z"],
+    "ISO com offset": ["2024-01-05T10:00:00-03:00", "2024-03-15T11:30:00-03:00"],
+    "ISO frações de segundo": ["2024-01-05 10:00:00.123", "2024-01-05 10:00:00.456789"],
+}
+
+
+@pytest.mark.parametrize("dtype", [object, "str"])
+@pytest.mark.parametrize("caso", list(CASOS))
+def test_igual_ao_tratamento_original(caso, dtype):
+    serie = pd.Series(CASOS[caso], dtype=dtype, name="Data")
+    esperado = sem_fuso(datas_original(serie.astype(object)))
+    obtido = parsear_datas(serie)
+    assert obtido.name == "Data"
+    pd.testing.assert_series_equal(obtido.astype("datetime64[ns]"), esperado, check_names=False)
+
+
+@pytest.mark.parametrize("dtype", [object, "str"])
+@pytest.mark.parametrize("caso", list(CASOS_ISO))
+def test_iso_com_e_sem_fuso(caso, dtype):
+    serie = pd.Series(CASOS_ISO[caso], dtype=dtype)
+    esperado = sem_fuso(pd.to_datetime(serie.astype(object), format="ISO8601", utc=True))
+    pd.testing.assert_series_equal(parsear_datas(serie).astype("datetime64[ns]"), esperado)
+
+
+def test_valores_repetidos_em_volume():
+    # Caminho de largura fixa (sem strptime) com datas inválidas no meio
+    valores = ["05/01/2024 10:30", "31/02/2024 10:00", "15/03/2024 25:00", "01/12/2023 00:00"] * 500
+    serie = pd.Series(valores, dtype=object)
+    esperado = sem_fuso(datas_original(serie))
+    pd.testing.assert_series_equal(parsear_datas(serie).astype("datetime64[ns]"), esperado)
+
+
+def test_mes_em_portugues_que_tambem_e_ingles():
+    # O original lia "jan/25" e "mar/25" pelo dateutil (dia 25 do ano 1) e
+    # por isso nem chegava ao mês/ano em português
+    serie = pd.Series(["jan/25", "fev/25", "mar/25", "dez/24"])
+    esperado = pd.to_datetime(pd.Series(["2025-01-01", "2025-02-01", "2025-03-01", "2024-12-01"]))
+    pd.testing.assert_series_equal(parsear_datas(serie).astype("datetime64[ns]"), esperado.astype("datetime64[ns]"))
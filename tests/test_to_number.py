@@ -0,0 +1,72 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpi_engine import to_number
+
+
+def parse_value(val): # Conversão original, valor a valor (app.py do commit 15df069), como referência
+    if pd.isna(val):
+        return np.nan
+
+    # 1. Tudo vira string
+    s = str(val).strip().lower()
+
+    # 2. Valores explicitamente inválidos
+    if s in ["", "nan", "none", "erro", "texto", "-", "--", "%"]:
+        return np.nan
+
+    # 3. Normalização
+    s = s.replace(" ", "")
+    s = s.replace(",", ".")
+    s = s.replace("%", "")
+
+    # 4. Extração do primeiro número válido
+    match = re.search(r"-?\d+(\.\d+)?", s)
+
+    if not match:
+        return np.nan
+
+    try:
+        return float(match.group())
+    except:
+        return np.nan
+
+
+TEXTOS = [
+    "", "--", "%", "-", " - ", " 3 . 4 ", "1e-05", None, np.nan, "nan", "None", "erro", "texto",
+    "0,85", "85 %", "85%", "-1.5", "1.234,5", "1,2,3", "abc12", "12a3.4", "inf", "Erro ", "0", "007",
+]
+
+NUMEROS = {
+    "float32": [0.5, 3.25, 1e-05, 0.1, np.nan, 85.0, -2.0, 1e20, 0.0],
+    "float64": [0.5, 1e-05, 0.1, np.nan, 1e20, np.inf, -np.inf, -0.0, 123456.789],
+    "Int64": [1, None, -3, 0, 10**12],
+}
+
+
+def comparar(series): # to_number tem que dar exatamente o que a conversão original dava
+    esperado = series.apply(parse_value).to_numpy(dtype=float)
+    obtido = to_number(series)
+    assert obtido.index.equals(series.index)
+    assert obtido.name == series.name
+    np.testing.assert_array_equal(obtido.to_numpy(dtype=float), esperado)
+
+
+@pytest.mark.parametrize("dtype", [object, "str", "category"])
+def test_textos_iguais_a_conversao_original(dtype):
+    comparar(pd.Series(TEXTOS, dtype=dtype, name="KPI", index=range(10, 10 + len(TEXTOS))))
+
+
+@pytest.mark.parametrize("dtype", list(NUMEROS))
+def test_numeros_iguais_a_conversao_original(dtype):
+    comparar(pd.Series(NUMEROS[dtype], dtype=dtype, name="KPI"))
+
+
+def test_repetidos_e_vazios():
+    valores = ["0,9", "--", None, "0,9", " 3 . 4 ", "0,9", ""] * 50
+    comparar(pd.Series(valores, dtype=object))
+    comparar(pd.Series([], dtype=object))
+    comparar(pd.Series([None, np.nan], dtype="str"))